@@ -0,0 +1,260 @@
+"""Replays recorded NluIntent payloads against RhasspySkill and reports latency per intent.
+
+The skill runs unmodified inside a real HermesApp connected to an in-process MQTT broker,
+Grocy is replaced by bench/fake_grocy.py in a child process. Each request is timed from
+publishing hermes/intent/<name> to the app's endSession/continueSession for that session.
+Payloads that continue a dialogue name the intents to play first in "seed"; the
+customData of the last reply becomes theirs, so they find the session they expect.
+
+    python bench/bench.py --products 1000,50000 --latency 0.01 --concurrency 1,8,32
+"""
+import argparse
+import asyncio
+import io
+import json
+import logging
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiohttp
+from rhasspyhermes import cli as hermes_cli
+from rhasspyhermes_app import HermesApp
+from fake_grocy import serve
+from fake_mqtt import FakeBroker
+from skill import RhasspySkill, IntentNames
+
+_LOGGER = logging.getLogger("GrocyBench")
+REPLY_TOPICS = ("hermes/dialogueManager/endSession", "hermes/dialogueManager/continueSession")
+
+class Bench:
+    """Drives one skill instance through the broker and collects per request timings."""
+    def __init__(self, broker: FakeBroker, payloads: dict) -> None:
+        self.broker = broker
+        self.payloads = payloads
+        self._pending = {}
+        broker.on_publish.append(self._on_publish)
+
+    def _on_publish(self, topic: str, payload: bytes) -> None:
+        if topic in REPLY_TOPICS:
+            message = json.loads(payload)
+            future = self._pending.pop(message.get("sessionId"), None)
+            if future != None and not future.done():
+                future.set_result((time.perf_counter(), message))
+
+    async def request(self, payload: dict, timeout: float = 10) -> float:
+        """Publish one intent and return the seconds until the app replied."""
+        return (await self.exchange(payload, timeout))[0]
+
+    async def exchange(self, payload: dict, timeout: float = 10) -> tuple:
+        """Publish one intent and return the seconds until the app replied and the reply."""
+        sessionId = uuid.uuid4().hex
+        message = dict(payload, id=sessionId, sessionId=sessionId)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[sessionId] = future
+        started = time.perf_counter()
+        self.broker.publish(f"hermes/intent/{payload['intent']['intentName']}", json.dumps(message).encode("utf-8"))
+        try:
+            repliedAt, reply = await asyncio.wait_for(future, timeout)
+            return repliedAt - started, reply
+        finally:
+            self._pending.pop(sessionId, None)
+
+    async def seeded(self, intent_name: str) -> list:
+        """The intent's payloads, each with the session state its seed intents left behind."""
+        variants = []
+        for variant in self.payloads[intent_name]:
+            variant = dict(variant)
+            seeds = variant.pop("seed", [])
+            customData = variant.get("customData")
+            for seedName in seeds:
+                seedPayload = dict(self.payloads[seedName][0], customData=customData)
+                seedPayload.pop("seed", None)
+                customData = (await self.exchange(seedPayload))[1].get("customData")
+            variants.append(dict(variant, customData=customData))
+        return variants
+
+    async def run(self, intent_name: str, requests: int, concurrency: int) -> dict:
+        """Issue requests for one intent keeping concurrency of them in flight."""
+        variants = await self.seeded(intent_name)
+        latencies = []
+        errors = 0
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(index):
+            nonlocal errors
+            async with semaphore:
+                try:
+                    latencies.append(await self.request(variants[index % len(variants)]))
+                except asyncio.TimeoutError:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[one(index) for index in range(requests)])
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            "throughput": len(latencies) / elapsed if elapsed > 0 else 0.0,
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+            "mean": statistics.mean(latencies) if len(latencies) > 0 else 0.0,
+            "errors": errors,
+        }
+
+    async def allocations(self, intent_name: str, requests: int) -> dict:
+        """Peak and retained traced memory per request, one request at a time.
+
+        Without tracemalloc.reset_peak (Python 3.8) the peak is approximated by the
+        memory a request allocated and still held once it was answered.
+        """
+        variants = await self.seeded(intent_name)
+        peaks = []
+        tracemalloc.start()
+        try:
+            retainedBefore = tracemalloc.get_traced_memory()[0]
+            for index in range(requests):
+                if hasattr(tracemalloc, "reset_peak"):
+                    before = tracemalloc.get_traced_memory()[0]
+                    tracemalloc.reset_peak()
+                    await self.request(variants[index % len(variants)])
+                    peaks.append(tracemalloc.get_traced_memory()[1] - before)
+                else:
+                    before = tracemalloc.take_snapshot()
+                    await self.request(variants[index % len(variants)])
+                    growth = tracemalloc.take_snapshot().compare_to(before, "filename")
+                    peaks.append(sum(stat.size_diff for stat in growth if stat.size_diff > 0))
+            retained = tracemalloc.get_traced_memory()[0] - retainedBefore
+        finally:
+            tracemalloc.stop()
+        return {"peak_kib": max(peaks) / 1024, "retained_kib": retained / 1024 / requests}
+
+def percentile(samples: list, percent: float) -> float:
+    if len(samples) == 0:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+def load_payloads(path: str, intent_names: list = None) -> dict:
+    with io.open(path, encoding="utf-8") as f:
+        payloads = json.load(f)
+    known = set(intentName.value for intentName in IntentNames)
+    return {name: variants for name, variants in payloads.items() if name in known and (not intent_names or name in intent_names)}
+
+async def wait_for_grocy(port: int, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(f"http://127.0.0.1:{port}/api/system/info") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                if time.monotonic() > deadline:
+                    raise
+            await asyncio.sleep(0.1)
+
+async def bench_dataset(args, products: int, payloads: dict, intent_names: list) -> list:
+    grocyProcess = multiprocessing.Process(target=serve, args=(args.grocy_port, products, args.latency), daemon=True)
+    grocyProcess.start()
+    broker = FakeBroker()
+    await broker.start()
+    results = []
+    try:
+        await wait_for_grocy(args.grocy_port)
+        config = {
+            "Grocy Setup": {"host": "http://127.0.0.1", "port": str(args.grocy_port), "apikey": "bench", "verifyssl": "False", "default_qu": "1", "default_location_id": "1", "startup_wait": "5"},
+            # Nothing listens here, sentence deployment fails fast and is skipped
+            "Rhasspy": {"protocol": "http", "host": "127.0.0.1", "port": "1"},
+            "Slots": {"refresh_interval": "0"},
+            "Metrics": {"log_interval": "0"},
+            # Every dataset starts cold, a snapshot of the previous one would be restored otherwise
+            "Snapshot": {"enabled": "False"},
+        }
+        app = HermesApp("GrocyBench", host="127.0.0.1", port=broker.port)
+        skillLogger = logging.getLogger("GrocyBenchSkill")
+        skillLogger.setLevel(args.skill_log_level)
+        skill = RhasspySkill("GrocyBench", app, config=config, logger=skillLogger)
+
+        # Same steps as HermesApp.run(), but inside the benchmark's event loop
+        app._subscribe_callbacks()
+        await asyncio.get_running_loop().run_in_executor(None, hermes_cli.connect, app.mqtt_client, app.args)
+        app.mqtt_client.loop_start()
+        appTask = asyncio.create_task(app.handle_messages_async())
+        try:
+            deadline = time.monotonic() + 30
+            while not (skill.grocy_connected != None and skill.grocy_connected.is_set() and all(broker.is_subscribed(f"hermes/intent/{name}") for name in intent_names)):
+                if time.monotonic() > deadline:
+                    missing = [name for name in intent_names if not broker.is_subscribed(f"hermes/intent/{name}")]
+                    raise RuntimeError(f"Skill not ready, Grocy connected: {skill.grocy_connected.is_set()}, not subscribed: {missing}")
+                await asyncio.sleep(0.05)
+
+            bench = Bench(broker, payloads)
+            for intentName in intent_names:
+                # Warm up connections and caches
+                await bench.run(intentName, min(args.requests, 5), 1)
+                for concurrency in args.concurrency:
+                    # Fresh histogram so the skill's own handler timing covers just this run
+                    skill.metrics.intent_latency.pop(intentName, None)
+                    result = await bench.run(intentName, args.requests, concurrency)
+                    handlerLatency = skill.metrics.intent_latency[intentName]
+                    result.update({"products": products, "intent": intentName, "concurrency": concurrency,
+                                   "handler_p50": handlerLatency.percentile(50), "handler_p99": handlerLatency.percentile(99)})
+                    if args.allocations and concurrency == args.concurrency[0]:
+                        result.update(await bench.allocations(intentName, min(args.requests, 20)))
+                    results.append(result)
+                    print_result(result)
+        finally:
+            appTask.cancel()
+            for task in skill.tasks:
+                task.cancel()
+            app.mqtt_client.loop_stop()
+            await skill.grocy.close()
+    finally:
+        await broker.stop()
+        grocyProcess.terminate()
+        grocyProcess.join()
+    return results
+
+def print_result(result: dict) -> None:
+    allocations = f" peak {result['peak_kib']:8.1f} KiB retained {result['retained_kib']:7.1f} KiB" if "peak_kib" in result else ""
+    print(f"{result['products']:>6} {result['intent']:<36} c={result['concurrency']:<3} {result['throughput']:8.1f} req/s"
+          f" p50 {result['p50'] * 1000:7.1f} ms p99 {result['p99'] * 1000:7.1f} ms"
+          f" (handler p50 {result['handler_p50'] * 1000:6.1f} ms p99 {result['handler_p99'] * 1000:6.1f} ms) errors {result['errors']}{allocations}", flush=True)
+
+def int_list(value: str) -> list:
+    return [int(item) for item in value.split(",") if item]
+
+async def main(args) -> None:
+    # Every payload stays available as a seed, only the chosen intents are measured
+    payloads = load_payloads(args.payloads)
+    intentNames = list(load_payloads(args.payloads, args.intents))
+    results = []
+    for products in args.products:
+        results.extend(await bench_dataset(args, products, payloads, intentNames))
+    if args.output != None:
+        with io.open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grocy skill benchmark")
+    parser.add_argument("--products", type=int_list, default=[1000], help="Comma separated dataset sizes, e.g. 1000,10000,50000")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds the fake Grocy adds to every response")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 8, 32], help="Comma separated numbers of requests in flight")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per intent and concurrency level")
+    parser.add_argument("--intents", nargs="*", help="Only run these intent names")
+    parser.add_argument("--payloads", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads.json"))
+    parser.add_argument("--grocy-port", type=int, default=18080)
+    parser.add_argument("--no-allocations", dest="allocations", action="store_false", help="Skip the tracemalloc pass")
+    parser.add_argument("--skill-log-level", default="WARNING")
+    parser.add_argument("--output", help="Write all results as JSON to this file")
+    args = parser.parse_args()
+    # HermesApp parses sys.argv itself
+    sys.argv = sys.argv[:1]
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(main(args))
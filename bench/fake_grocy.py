@@ -0,0 +1,300 @@
+"""Stand-in Grocy API serving a generated dataset with a configurable response latency."""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from datetime import date, timedelta
+from aiohttp import web
+
+class GrocyDataset:
+    """Generated Grocy tables, sized by the number of products."""
+    def __init__(self, products: int = 1000, seed: int = 1) -> None:
+        rng = random.Random(seed)
+        self.tables = {
+            "locations": [{"id": i, "name": f"location {i}", "is_freezer": 1 if i % 5 == 0 else 0} for i in range(1, 11)],
+            "quantity_units": [{"id": i, "name": f"unit {i}", "name_plural": f"units {i}"} for i in range(1, 9)],
+            "shopping_lists": [{"id": i, "name": f"shopping list {i}"} for i in range(1, 6)],
+            "chores": [{"id": i, "name": f"chore {i}"} for i in range(1, 26)],
+            "batteries": [{"id": i, "name": f"battery {i}", "active": 1} for i in range(1, 11)],
+            "products": [
+                {"id": i, "name": f"product {i}", "active": 1, "location_id": rng.randint(1, 10), "qu_id_purchase": 1, "qu_id_stock": 1, "min_stock_amount": rng.randint(0, 3)}
+                for i in range(1, products + 1)
+            ],
+            "shopping_list": [],
+            "stock_log": [],
+        }
+        self.tables["stock"] = [
+            {"id": i, "product_id": rng.randint(1, products), "location_id": rng.randint(1, 10), "amount": float(rng.randint(1, 5)),
+             "best_before_date": (date.today() + timedelta(days=rng.randint(-5, 365))).isoformat(), "stock_id": f"s{i}"}
+            for i in range(1, products * 2 + 1)
+        ]
+        self.users = [
+            {"id": 1, "username": "admin", "first_name": "Alex", "last_name": "Admin", "display_name": "Alex Admin"},
+            {"id": 2, "username": "sam", "first_name": "Sam", "last_name": "Smith", "display_name": "Sam Smith"},
+            {"id": 3, "username": "kim", "first_name": "Kim", "last_name": "Kay", "display_name": "Kim Kay"},
+        ]
+        self.chore_states = [
+            {"chore_id": chore["id"], "chore_name": chore["name"], "next_estimated_execution_time": f"{date.today() + timedelta(days=chore['id'] - 5)} 12:00:00",
+             "next_execution_assigned_to_user_id": (chore["id"] % 3) + 1}
+            for chore in self.tables["chores"]
+        ]
+        self.changed_time = time.strftime("%Y-%m-%d %H:%M:%S")
+        self._bodies = {}
+        self._stock_index = {}
+
+    def touch(self, table: str = None) -> None:
+        self.changed_time = time.strftime("%Y-%m-%d %H:%M:%S") + f".{time.time_ns() % 1000000}"
+        if table == None:
+            self._bodies.clear()
+        else:
+            self._bodies.pop(table, None)
+
+    def stock_by(self, field: str, value: int) -> list:
+        """Stock entries with field == value; indexed like Grocy's database so lookups stay cheap at 50k products."""
+        if field not in self._stock_index:
+            index = {}
+            for entry in self.tables["stock"]:
+                index.setdefault(entry[field], []).append(entry)
+            self._stock_index[field] = index
+        return self._stock_index[field].get(value, [])
+
+    def add_stock_entry(self, entry: dict) -> None:
+        self.tables["stock"].append(entry)
+        for field, index in self._stock_index.items():
+            index.setdefault(entry[field], []).append(entry)
+
+    def book(self, product_id: int, location_id: int, amount: float, transaction_type: str, transaction_id: str) -> dict:
+        """Append a stock_log row like Grocy does for every stock change and return it."""
+        booking = {"id": len(self.tables["stock_log"]) + 1, "product_id": product_id, "location_id": location_id, "amount": amount,
+                   "transaction_type": transaction_type, "transaction_id": transaction_id, "undone": 0}
+        self.tables["stock_log"].append(booking)
+        self.touch("stock_log")
+        return booking
+
+    def move_stock_entry(self, entry: dict, location_id: int) -> None:
+        index = self._stock_index.get("location_id")
+        if index != None:
+            index[entry["location_id"]].remove(entry)
+            index.setdefault(location_id, []).append(entry)
+        entry["location_id"] = location_id
+
+    def body(self, table: str) -> tuple:
+        """JSON body and ETag of a whole table, encoded once per change."""
+        if table not in self._bodies:
+            rows = self.users if table == "users" else self.tables[table]
+            body = json.dumps(rows).encode("utf-8")
+            self._bodies[table] = (body, f'"{hashlib.md5(body).hexdigest()}"')
+        return self._bodies[table]
+
+def order_rows(rows: list, request: web.Request) -> list:
+    """Apply Grocy style order=field[:desc] and limit parameters."""
+    if "order" in request.query:
+        field, _, direction = request.query["order"].partition(":")
+        rows = sorted(rows, key=lambda row: row.get(field), reverse=direction == "desc")
+    if "limit" in request.query:
+        rows = rows[:int(request.query["limit"])]
+    return rows
+
+def filter_rows(rows: list, request: web.Request) -> list:
+    """Apply Grocy style query[]=field<op>value filters."""
+    for query in request.query.getall("query[]", []):
+        for op in (">=", "<=", "!=", "=", ">", "<"):
+            if op in query:
+                field, value = query.split(op, 1)
+                break
+        else:
+            continue
+
+        def matches(row):
+            left, right = row.get(field), value
+            try:
+                left, right = float(left), float(right)
+            except (TypeError, ValueError):
+                left = str(left)
+            return {"=": left == right, "!=": left != right, ">": left > right, "<": left < right, ">=": left >= right, "<=": left <= right}[op]
+        rows = [row for row in rows if matches(row)]
+    return rows
+
+def make_app(dataset: GrocyDataset, latency: float = 0.0) -> web.Application:
+    """Build the aiohttp application; every request is delayed by latency seconds."""
+    @web.middleware
+    async def delay(request, handler):
+        if latency > 0:
+            await asyncio.sleep(latency)
+        return await handler(request)
+
+    def table_response(request, table):
+        if len(request.query.getall("query[]", [])) > 0 or "order" in request.query or "limit" in request.query:
+            return web.json_response(order_rows(filter_rows(dataset.users if table == "users" else dataset.tables[table], request), request))
+        body, etag = dataset.body(table)
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=body, content_type="application/json", headers={"ETag": etag})
+
+    async def system_info(request):
+        return web.json_response({"grocy_version": {"Version": "3.3.2", "ReleaseDate": "2022-11-12"}})
+
+    async def db_changed_time(request):
+        return web.json_response({"changed_time": dataset.changed_time})
+
+    async def get_objects(request):
+        table = request.match_info["entity"]
+        if table not in dataset.tables:
+            return web.json_response({"error_message": f"Entity {table} does not exist"}, status=400)
+        return table_response(request, table)
+
+    async def add_object(request):
+        table = request.match_info["entity"]
+        data = await request.json()
+        rows = dataset.tables[table]
+        data["id"] = max([row["id"] for row in rows] + [0]) + 1
+        if table == "products":
+            # Columns Grocy fills with their defaults when a product is created without them
+            data.setdefault("min_stock_amount", 0)
+        rows.append(data)
+        dataset.touch(table)
+        return web.json_response({"created_object_id": data["id"]})
+
+    async def get_users(request):
+        return table_response(request, "users")
+
+    def product_row(productId):
+        products = dataset.tables["products"]
+        if productId < 1 or productId > len(products):
+            raise web.HTTPBadRequest(text=json.dumps({"error_message": "Product does not exist or is inactive"}), content_type="application/json")
+        return products[productId - 1]
+
+    async def product_details(request):
+        product = product_row(int(request.match_info["id"]))
+        quantityUnit = dataset.tables["quantity_units"][0]
+        stockAmount = sum(entry["amount"] for entry in dataset.stock_by("product_id", product["id"]))
+        return web.json_response({"product": product, "stock_amount": stockAmount, "default_quantity_unit_purchase": quantityUnit, "quantity_unit_stock": quantityUnit, "location": dataset.tables["locations"][0]})
+
+    async def location_entries(request):
+        locationId = int(request.match_info["id"])
+        return web.json_response(dataset.stock_by("location_id", locationId))
+
+    async def add_stock(request):
+        product = product_row(int(request.match_info["id"]))
+        data = await request.json()
+        entryId = len(dataset.tables["stock"]) + 1
+        locationId = int(data.get("location_id") or product["location_id"])
+        dataset.add_stock_entry({"id": entryId, "product_id": product["id"], "location_id": locationId, "amount": float(data["amount"]), "best_before_date": "2030-01-01", "stock_id": f"s{entryId}"})
+        dataset.touch("stock")
+        return web.json_response([dataset.book(product["id"], locationId, float(data["amount"]), "purchase", f"t{time.time_ns()}")])
+
+    async def consume_stock(request):
+        product = product_row(int(request.match_info["id"]))
+        data = await request.json()
+        entries = [entry for entry in dataset.stock_by("product_id", product["id"]) if entry["amount"] > 0]
+        if float(data["amount"]) > sum(entry["amount"] for entry in entries):
+            return web.json_response({"error_message": "Amount to be consumed cannot be > current stock amount (if supplied, at the desired location)"}, status=400)
+        remaining = float(data["amount"])
+        transactionId = f"t{time.time_ns()}"
+        bookings = []
+        for entry in entries:
+            taken = min(entry["amount"], remaining)
+            if taken <= 0:
+                break
+            entry["amount"] -= taken
+            remaining -= taken
+            bookings.append(dataset.book(product["id"], entry["location_id"], -taken, "consume", transactionId))
+        dataset.touch("stock")
+        return web.json_response(bookings)
+
+    async def transfer_stock(request):
+        product = product_row(int(request.match_info["id"]))
+        data = await request.json()
+        fromLocation, toLocation = int(data["location_id_from"]), int(data["location_id_to"])
+        transactionId = f"t{time.time_ns()}"
+        bookings = []
+        for entry in list(dataset.stock_by("product_id", product["id"])):
+            if entry["location_id"] == fromLocation:
+                dataset.move_stock_entry(entry, toLocation)
+                bookings.append(dataset.book(product["id"], fromLocation, -entry["amount"], "transfer_from", transactionId))
+                bookings.append(dataset.book(product["id"], toLocation, entry["amount"], "transfer_to", transactionId))
+        dataset.touch("stock")
+        return web.json_response(bookings)
+
+    async def all_stock(request):
+        amounts = {}
+        for entry in dataset.tables["stock"]:
+            amounts[entry["product_id"]] = amounts.get(entry["product_id"], 0.0) + entry["amount"]
+        return web.json_response([{"product_id": productId, "amount": amount} for productId, amount in amounts.items() if amount > 0])
+
+    async def volatile_stock(request):
+        today = date.today().isoformat()
+        dueSoon = (date.today() + timedelta(days=int(request.query.get("due_soon_days", 5)))).isoformat()
+        due, expired, amounts = [], [], {}
+        for entry in dataset.tables["stock"]:
+            if entry["amount"] <= 0:
+                continue
+            amounts[entry["product_id"]] = amounts.get(entry["product_id"], 0.0) + entry["amount"]
+            if entry["best_before_date"] < today:
+                expired.append(entry)
+            elif entry["best_before_date"] <= dueSoon:
+                due.append(entry)
+        missing = [
+            {"id": product["id"], "name": product["name"], "amount_missing": product["min_stock_amount"] - amounts.get(product["id"], 0.0), "is_partly_in_stock": int(product["id"] in amounts)}
+            for product in dataset.tables["products"] if amounts.get(product["id"], 0.0) < product["min_stock_amount"]
+        ]
+        return web.json_response({"due_products": due, "overdue_products": [], "expired_products": expired, "missing_products": missing})
+
+    async def shopping_list_change(request):
+        dataset.touch("shopping_list")
+        return web.Response(status=204)
+
+    async def get_chores(request):
+        return web.json_response(filter_rows(dataset.chore_states, request))
+
+    async def execute_chore(request):
+        data = await request.json()
+        dataset.touch()
+        return web.json_response({"id": time.time_ns() % 100000, "chore_id": int(request.match_info["id"]), "tracked_time": data.get("tracked_time"), "skipped": int(bool(data.get("skipped"))), "undone": 0})
+
+    async def get_batteries(request):
+        return web.json_response([{"battery_id": battery["id"], "next_estimated_charge_time": f"{date.today() + timedelta(days=battery['id'] - 3)} 00:00:00"} for battery in dataset.tables["batteries"]])
+
+    async def battery_details(request):
+        battery = dataset.tables["batteries"][int(request.match_info["id"]) - 1]
+        return web.json_response({"battery": battery, "charge_cycles_count": 3, "last_charged": "2022-01-01 00:00:00", "next_estimated_charge_time": "2030-01-01 00:00:00"})
+
+    async def charge_battery(request):
+        data = await request.json()
+        dataset.touch()
+        return web.json_response({"id": time.time_ns() % 100000, "battery_id": int(request.match_info["id"]), "tracked_time": data.get("tracked_time"), "undone": 0})
+
+    app = web.Application(middlewares=[delay])
+    app.router.add_get("/api/system/info", system_info)
+    app.router.add_get("/api/system/db-changed-time", db_changed_time)
+    app.router.add_get("/api/objects/{entity}", get_objects)
+    app.router.add_post("/api/objects/{entity}", add_object)
+    app.router.add_get("/api/users", get_users)
+    app.router.add_get("/api/stock", all_stock)
+    app.router.add_get("/api/stock/volatile", volatile_stock)
+    app.router.add_get("/api/stock/products/{id}", product_details)
+    app.router.add_post("/api/stock/products/{id}/add", add_stock)
+    app.router.add_post("/api/stock/products/{id}/consume", consume_stock)
+    app.router.add_post("/api/stock/products/{id}/transfer", transfer_stock)
+    app.router.add_get("/api/stock/locations/{id}/entries", location_entries)
+    app.router.add_post("/api/stock/shoppinglist/add-product", shopping_list_change)
+    app.router.add_post("/api/stock/shoppinglist/remove-product", shopping_list_change)
+    app.router.add_get("/api/chores", get_chores)
+    app.router.add_post("/api/chores/{id}/execute", execute_chore)
+    app.router.add_get("/api/batteries", get_batteries)
+    app.router.add_get("/api/batteries/{id}", battery_details)
+    app.router.add_post("/api/batteries/{id}/charge", charge_battery)
+    return app
+
+def serve(port: int, products: int, latency: float) -> None:
+    web.run_app(make_app(GrocyDataset(products), latency), host="127.0.0.1", port=port, print=None, access_log=None)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Grocy API for benchmarks")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+    serve(args.port, args.products, args.latency)
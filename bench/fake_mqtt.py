@@ -0,0 +1,128 @@
+"""Minimal in-process MQTT 3.1.1 broker, enough for one Hermes app and the benchmark driver.
+
+Supports CONNECT, SUBSCRIBE/UNSUBSCRIBE with + and # wildcards, PUBLISH at QoS 0 and 1,
+PINGREQ and DISCONNECT. Every published message is also passed to the ``on_publish``
+callbacks so the benchmark can observe the app's replies without a second client.
+"""
+import asyncio
+import socket
+import struct
+from typing import Callable, List
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    filterParts = topic_filter.split("/")
+    topicParts = topic.split("/")
+    for index, part in enumerate(filterParts):
+        if part == "#":
+            return True
+        if index >= len(topicParts) or (part != "+" and part != topicParts[index]):
+            return False
+    return len(filterParts) == len(topicParts)
+
+def encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte = length % 128
+        length //= 128
+        encoded.append(byte | 0x80 if length > 0 else byte)
+        if length == 0:
+            return bytes(encoded)
+
+def encode_publish(topic: str, payload: bytes) -> bytes:
+    topicBytes = topic.encode("utf-8")
+    body = struct.pack("!H", len(topicBytes)) + topicBytes + payload
+    return bytes([PUBLISH << 4]) + encode_length(len(body)) + body
+
+class FakeBroker:
+    def __init__(self) -> None:
+        self.subscriptions = {}
+        self.on_publish: List[Callable[[str, bytes], None]] = []
+        self._server = None
+        self._clients = set()
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self._server = await asyncio.start_server(self._handle_client, host, port)
+
+    async def stop(self) -> None:
+        self._server.close()
+        for writer in list(self.subscriptions):
+            writer.close()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+        await self._server.wait_closed()
+
+    def is_subscribed(self, topic: str) -> bool:
+        return any(topic_matches(topicFilter, topic) for topicFilters in self.subscriptions.values() for topicFilter in topicFilters)
+
+    def publish(self, topic: str, payload: bytes) -> None:
+        """Deliver a message to every matching subscriber."""
+        for callback in self.on_publish:
+            callback(topic, payload)
+        packet = None
+        for writer, topicFilters in self.subscriptions.items():
+            if any(topic_matches(topicFilter, topic) for topicFilter in topicFilters):
+                packet = packet or encode_publish(topic, payload)
+                writer.write(packet)
+
+    async def _read_packet(self, reader: asyncio.StreamReader) -> tuple:
+        header = (await reader.readexactly(1))[0]
+        length, multiplier = 0, 1
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if byte & 0x80 == 0:
+                break
+        return header >> 4, header & 0x0F, await reader.readexactly(length)
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Hermes messages are small, don't let Nagle hold them back
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._clients.add(asyncio.current_task())
+        self.subscriptions[writer] = set()
+        try:
+            while True:
+                packetType, flags, body = await self._read_packet(reader)
+                if packetType == CONNECT:
+                    writer.write(bytes([CONNACK << 4, 2, 0, 0]))
+                elif packetType == PUBLISH:
+                    topicLength = struct.unpack("!H", body[:2])[0]
+                    topic = body[2:2 + topicLength].decode("utf-8")
+                    offset = 2 + topicLength
+                    if (flags >> 1) & 0x03 > 0:
+                        writer.write(bytes([PUBACK << 4, 2]) + body[offset:offset + 2])
+                        offset += 2
+                    self.publish(topic, body[offset:])
+                elif packetType == SUBSCRIBE:
+                    packetId, offset, granted = body[:2], 2, bytearray()
+                    while offset < len(body):
+                        filterLength = struct.unpack("!H", body[offset:offset + 2])[0]
+                        self.subscriptions[writer].add(body[offset + 2:offset + 2 + filterLength].decode("utf-8"))
+                        offset += 3 + filterLength
+                        granted.append(0)
+                    writer.write(bytes([SUBACK << 4]) + encode_length(2 + len(granted)) + packetId + bytes(granted))
+                elif packetType == UNSUBSCRIBE:
+                    offset = 2
+                    while offset < len(body):
+                        filterLength = struct.unpack("!H", body[offset:offset + 2])[0]
+                        self.subscriptions[writer].discard(body[offset + 2:offset + 2 + filterLength].decode("utf-8"))
+                        offset += 2 + filterLength
+                    writer.write(bytes([UNSUBACK << 4, 2]) + body[:2])
+                elif packetType == PINGREQ:
+                    writer.write(bytes([PINGRESP << 4, 0]))
+                elif packetType == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.subscriptions.pop(writer, None)
+            self._clients.discard(asyncio.current_task())
+            writer.close()
@@ -0,0 +1,60 @@
+"""Circuit breaker keeping requests away from a failing Grocy."""
+import time
+
+class CircuitBreaker:
+    """Counts consecutive failed calls and opens after ``threshold`` of them.
+
+    While open every call is turned away at once for ``cooldown`` seconds instead of
+    piling up on a backend that is already struggling. After that one trial call is let
+    through: if it succeeds the breaker closes, if it fails it opens for another cooldown.
+    """
+    _LOGGER = None
+
+    def __init__(self, name: str, threshold: int = 5, cooldown: float = 30, logger = None) -> None:
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        # Monotonic time the breaker opened, None while it is closed
+        self.opened_at = None
+        self._trial = False
+        if logger != None:
+            self._LOGGER = logger
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at != None
+
+    def retry_in(self) -> float:
+        """Seconds until the next trial call is let through."""
+        if self.opened_at == None:
+            return 0.0
+        return max(self.opened_at + self.cooldown - time.monotonic(), 0.0)
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead; the first one after the cooldown is the trial."""
+        if self.opened_at == None or self.threshold <= 0:
+            return True
+        if self._trial or self.retry_in() > 0:
+            return False
+        self._trial = True
+        return True
+
+    def succeeded(self) -> None:
+        if self.opened_at != None and self._LOGGER != None:
+            self._LOGGER.warning(f"Circuit breaker: {self.name} answered again, closing")
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def failed(self) -> None:
+        self.failures += 1
+        if self._trial or (self.opened_at == None and self.failures >= self.threshold > 0):
+            if self._LOGGER != None:
+                self._LOGGER.warning(f"Circuit breaker: {self.name} failed {self.failures} times in a row, not calling it for {self.cooldown:g}s")
+            self.opened_at = time.monotonic()
+            self._trial = False
+
+    def abandoned(self) -> None:
+        """A call ended without telling whether it worked, e.g. it was cancelled."""
+        self._trial = False
@@ -0,0 +1,97 @@
+"""Deploys the skill's sentences to Rhasspy and trains only when something changed."""
+import hashlib
+import io
+import json
+import os
+from typing import Dict, List
+import aiohttp
+from rhasspyclient import RhasspyClient, TrainingResult
+
+SENTENCES_FILE = "intents/grocy.ini"
+
+class SentenceDeployer:
+    """Pushes sentences.ini to Rhasspy and retrains, gated on a content hash.
+
+    The digest of the generated sentences and of the slot values is stored in
+    ``state_path``. When neither changed since the last deployment nothing is sent to
+    Rhasspy at all. Only the skill's own sentences file and the changed slots are posted,
+    and training keeps Rhasspy's cache so unchanged intents are not rebuilt.
+    """
+    _LOGGER = None
+
+    def __init__(self, api_url: str, sentences_path: str, state_path: str, satellite_id: str = None, logger = None) -> None:
+        self.api_url = api_url
+        self.sentences_path = sentences_path
+        self.state_path = state_path
+        self.satellite_id = satellite_id
+        if logger != None:
+            self._LOGGER = logger
+
+    def build_sentences(self) -> str:
+        """Sentences file content, with section names suffixed by the satellite id if one is set."""
+        with io.open(self.sentences_path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        if self.satellite_id != None:
+            lines = [f"{line.rstrip()[:-1]}-{self.satellite_id}]" if line.startswith("[") and line.rstrip().endswith("]") else line for line in lines]
+        return "\n".join(lines) + "\n"
+
+    def read_state(self) -> dict:
+        try:
+            with io.open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def write_state(self, state: dict) -> None:
+        tmpPath = f"{self.state_path}.tmp"
+        with io.open(tmpPath, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmpPath, self.state_path)
+
+    @staticmethod
+    def digest(content) -> str:
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def deploy(self, slot_values: Dict[str, List[str]] = None) -> bool:
+        """Deploy sentences and train if they or the slot values changed. Returns True if Rhasspy was trained."""
+        sentences = self.build_sentences()
+        sentencesDigest = self.digest(sentences)
+        state = self.read_state()
+        # Without slot values (Grocy unreachable) only the sentences gate the deployment
+        slotsDigest = self.digest(slot_values) if slot_values != None else state.get("slots")
+        slotDigests = {slotName: self.digest(values) for slotName, values in (slot_values or {}).items()}
+
+        if state.get("sentences") == sentencesDigest and state.get("slots") == slotsDigest:
+            if self._LOGGER != None:
+                self._LOGGER.info("Setup: Sentences and slots unchanged, skipping deployment")
+            return False
+
+        async with aiohttp.ClientSession(headers=[("accept", "application/json")]) as session:
+            if state.get("sentences") != sentencesDigest:
+                async with session.get(f"{self.api_url}/sentences") as response:
+                    response.raise_for_status()
+                    result = await response.json(content_type=None)
+                if result.get(SENTENCES_FILE) != sentences:
+                    async with session.post(f"{self.api_url}/sentences", json={SENTENCES_FILE: sentences}) as response:
+                        response.raise_for_status()
+                        result = await response.text()
+                        if self._LOGGER != None:
+                            self._LOGGER.info(f"Setup: Sentences POST result: {result}")
+                elif self._LOGGER != None:
+                    self._LOGGER.info("Setup: Sentences file already up to date")
+
+            client = RhasspyClient(f"{self.api_url}", session)
+            changedSlots = {slotName: slot_values[slotName] for slotName, slotDigest in slotDigests.items() if state.get("slot_digests", {}).get(slotName) != slotDigest}
+            if len(changedSlots) > 0:
+                result = await client.set_slots(changedSlots, overwrite=True)
+                if self._LOGGER != None:
+                    self._LOGGER.info(f"Setup: Slots POST result for {', '.join(changedSlots)}: {result}")
+
+            result = await client.train(no_cache=False)
+            if self._LOGGER != None:
+                self._LOGGER.info(f"Setup: Train POST result: {result}")
+            if result.result != TrainingResult.SUCCESS:
+                return False
+
+        self.write_state({"sentences": sentencesDigest, "slots": slotsDigest, "slot_digests": slotDigests or state.get("slot_digests", {})})
+        return True
@@ -0,0 +1,106 @@
+"""Announcements of chores, battery charges and best before dates as they come due."""
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, time as clock
+from typing import Callable, List
+from summaries import HouseholdSummaries, parse_time
+
+CHORE = "chore"
+BATTERY = "battery"
+PRODUCT = "product"
+
+#Products named in a day's best before announcement, the rest are counted
+PRODUCTS_NAMED = 5
+
+def due_events(summaries: HouseholdSummaries, kinds = (CHORE, BATTERY, PRODUCT), product_time: clock = clock(9, 0)) -> List[dict]:
+    """Events for everything the summaries know a due time of; a day's products come due together at product_time."""
+    events = []
+    if CHORE in kinds:
+        for chore in summaries.chores:
+            events.append({"key": (CHORE, chore["chore_id"], chore["due"]), "kind": CHORE, "when": chore["due"].timestamp(), "name": chore["name"]})
+    if BATTERY in kinds:
+        for battery in summaries.batteries:
+            events.append({"key": (BATTERY, battery["battery_id"], battery["due"]), "kind": BATTERY, "when": battery["due"].timestamp(), "name": battery["name"]})
+    if PRODUCT in kinds:
+        # One announcement per day, however much stock reaches its date
+        days = {}
+        for row in summaries.expiring:
+            date = parse_time(row["date"])
+            if date != None and not row["expired"]:
+                days.setdefault(date.date(), []).append(row)
+        for day, rows in days.items():
+            names = [f"{row['amount']:g} {row['name']}" for row in rows[:PRODUCTS_NAMED]]
+            if len(rows) > PRODUCTS_NAMED:
+                names.append(f"{len(rows) - PRODUCTS_NAMED} more")
+            name = names[0] if len(names) == 1 else f"{', '.join(names[:-1])} and {names[-1]}"
+            when = datetime.combine(day, product_time)
+            events.append({"key": (PRODUCT, day), "kind": PRODUCT, "when": when.timestamp(), "name": name, "count": len(rows)})
+    return events
+
+class DueScheduler:
+    """Announces items when they come due without polling for them.
+
+    The next due time of every known item sits in a min-heap and the scheduler sleeps
+    until the earliest one, so between events it costs nothing. ``update`` replaces the
+    items whenever fresher data arrives. Every item is announced once per due time; one
+    that was already due when it was first seen is left alone, so a restart doesn't read
+    out the whole backlog.
+    """
+    _LOGGER = None
+
+    def __init__(self, announce: Callable[[dict], None], logger = None) -> None:
+        self.announce = announce
+        self._heap = []
+        self._pending = set()
+        self._announced = set()
+        self._sequence = itertools.count()
+        self._changed = None
+        if logger != None:
+            self._LOGGER = logger
+
+    def update(self, events: List[dict]) -> None:
+        """Schedule these events in place of the ones known so far."""
+        now = time.time()
+        heap = []
+        for event in events:
+            if event["key"] in self._announced:
+                continue
+            if event["when"] <= now and event["key"] not in self._pending:
+                continue
+            heap.append((event["when"], next(self._sequence), event))
+        heapq.heapify(heap)
+        self._heap = heap
+        self._pending = set(event["key"] for when, sequence, event in heap)
+        # Rescheduled or deleted items get new keys, only the current ones need remembering
+        self._announced &= set(event["key"] for event in events)
+        if self._LOGGER != None:
+            self._LOGGER.debug(f"Due scheduler: {len(heap)} events scheduled" + (f", next at {datetime.fromtimestamp(heap[0][0])}" if len(heap) > 0 else ""))
+        if self._changed != None:
+            self._changed.set()
+
+    def _fire(self) -> None:
+        now = time.time()
+        while len(self._heap) > 0 and self._heap[0][0] <= now:
+            when, sequence, event = heapq.heappop(self._heap)
+            self._pending.discard(event["key"])
+            self._announced.add(event["key"])
+            try:
+                self.announce(event)
+            except Exception as error:
+                if self._LOGGER != None:
+                    self._LOGGER.error(f"Due scheduler: Announcing {event['kind']} {event['name']} failed: {error}")
+
+    async def run(self) -> None:
+        self._changed = asyncio.Event()
+        while True:
+            timeout = max(self._heap[0][0] - time.time(), 0) if len(self._heap) > 0 else None
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+                # New events, work out the next wake up again
+                self._changed.clear()
+                continue
+            except asyncio.TimeoutError:
+                pass
+            self._fire()
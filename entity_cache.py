@@ -0,0 +1,217 @@
+"""In-memory cache of Grocy master data."""
+import asyncio
+import time
+from typing import Dict, List, Optional, Union
+from pygrocy.data_models.generic import EntityType
+from grocy_client import GrocyClient, OFFLINE
+from name_resolver import NameIndex
+
+USERS = "users"
+
+#Entity types the cache knows how to load, with the field used as the spoken name
+CACHED_ENTITY_TYPES = {
+    EntityType.PRODUCTS.value: "name",
+    EntityType.LOCATIONS.value: "name",
+    EntityType.QUANTITY_UNITS.value: "name",
+    EntityType.SHOPPING_LISTS.value: "name",
+    EntityType.CHORES.value: "name",
+    EntityType.BATTERIES.value: "name",
+    USERS: "display_name",
+}
+
+class CachedEntities:
+    """One loaded Grocy entity table."""
+    def __init__(self, rows: List[dict], name_field: str, age: float = 0, changed_time: str = None) -> None:
+        self.rows = rows
+        self.name_field = name_field
+        # Grocy's db-changed-time read before the rows, they are at least as new as it
+        self.changed_time = changed_time
+        self.by_id = {int(row["id"]): row for row in rows}
+        self.by_name = {str(row.get(name_field, "")).lower(): int(row["id"]) for row in rows}
+        self.loaded_at = time.monotonic() - age
+        self._name_index = None
+
+    async def name_index(self) -> NameIndex:
+        """Fuzzy name index, built on first use and dropped with the table."""
+        if self._name_index == None:
+            # About a second per 50k names, keep it off the event loop
+            self._name_index = asyncio.get_running_loop().run_in_executor(None, NameIndex, self.rows, self.name_field)
+        return await self._name_index
+
+class GrocyEntityCache:
+    """Loads each entity type once and serves it from memory until its TTL expires.
+
+    TTLs are in seconds; ``ttl`` is the default and ``ttls`` overrides it per entity type.
+    Writes made by the skill call ``invalidate`` so the next read reloads the table.
+    While an intent is answered offline every loaded table counts as fresh.
+
+    With a snapshot or a freshness monitor, Grocy's db-changed-time is read before each
+    table and kept with it. ``revalidate`` compares it to Grocy's current one after
+    (re)connecting: tables from an unchanged database count as freshly loaded, the
+    others are reloaded on their next use. While the monitor sees Grocy change, a table
+    used afterwards fetches just the rows added since (by id), so new objects are known
+    within seconds; Grocy has no change time per row, so edits and deletions still wait
+    for the TTL or an invalidation.
+    """
+    _LOGGER = None
+
+    def __init__(self, grocy: GrocyClient, ttl: float = 300, ttls: Dict[str, float] = None, logger = None) -> None:
+        self.grocy = grocy
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self._entities: Dict[str, CachedEntities] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        # Optional metrics.Metrics counting hits and misses
+        self.metrics = None
+        # Optional snapshot.GrocySnapshot every loaded table is saved to
+        self.snapshot = None
+        # Optional freshness.FreshnessMonitor, tables behind its db-changed-time catch up on use
+        self.monitor = None
+        if logger != None:
+            self._LOGGER = logger
+
+    @classmethod
+    def from_config(cls, grocy: GrocyClient, config: dict, logger = None):
+        """Build the cache from the optional [Cache] config section."""
+        cacheConfig = config.get("Cache", {})
+        ttls = {entity_type: float(cacheConfig[entity_type]) for entity_type in CACHED_ENTITY_TYPES if entity_type in cacheConfig}
+        return cls(grocy, ttl=float(cacheConfig.get("ttl", 300)), ttls=ttls, logger=logger)
+
+    def _key(self, entity_type: Union[EntityType, str]) -> str:
+        key = EntityType(entity_type).value if entity_type != USERS else USERS
+        if key not in CACHED_ENTITY_TYPES:
+            raise ValueError(f"Entity type {key} is not cached")
+        return key
+
+    def _is_fresh(self, key: str) -> bool:
+        entities = self._entities.get(key)
+        if entities != None and OFFLINE.get():
+            return True
+        return entities != None and time.monotonic() - entities.loaded_at < self.ttls.get(key, self.ttl)
+
+    def _behind(self, entities: CachedEntities) -> bool:
+        return self.monitor != None and self.monitor.changed_time != None and entities.changed_time != self.monitor.changed_time and not OFFLINE.get()
+
+    async def _changed_time(self) -> str:
+        # The monitor's value was read before this table is, which is all it has to be
+        if self.monitor != None and self.monitor.changed_time != None:
+            return self.monitor.changed_time
+        return await self.grocy.db_changed_time() if self.snapshot != None else None
+
+    async def _fetch(self, key: str, query_filters: List[str] = None) -> List[dict]:
+        if key == USERS:
+            return await self.grocy.get(USERS, query_filters) or []
+        return await self.grocy.get_generic_objects_for_type(key, query_filters)
+
+    async def _catch_up(self, key: str) -> CachedEntities:
+        """Add the rows created since the table was loaded."""
+        async with self._locks.setdefault(key, asyncio.Lock()):
+            entities = self._entities.get(key)
+            if entities != None and not self._behind(entities):
+                return entities
+            if entities != None:
+                changedTime = self.monitor.changed_time
+                maxId = max(entities.by_id, default=0)
+                rows = await self._fetch(key, [f"id>{maxId}"])
+                # Not stored if the table was invalidated or reloaded meanwhile, that would undo it
+                if self._entities.get(key) is entities:
+                    if len(rows) == 0:
+                        entities.changed_time = changedTime
+                        return entities
+                    # Still as old as the full load, the TTL keeps catching edits
+                    self._entities[key] = CachedEntities(entities.rows + rows, entities.name_field, age = time.monotonic() - entities.loaded_at, changed_time = changedTime)
+                    if self._LOGGER != None:
+                        self._LOGGER.debug(f"Cache: Added {len(rows)} new {key}")
+                    if self.snapshot != None:
+                        self.snapshot.put(key, {"changed_time": changedTime, "rows": self._entities[key].rows})
+                    return self._entities[key]
+        # Dropped while this call waited, load it again once the lock is free
+        return await self._load(key)
+
+    async def _load(self, key: str) -> CachedEntities:
+        if self._is_fresh(key):
+            if self.metrics != None:
+                self.metrics.observe_cache(key, True)
+            if self._behind(self._entities[key]):
+                return await self._catch_up(key)
+            return self._entities[key]
+        if self.metrics != None:
+            self.metrics.observe_cache(key, False)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            # Another caller may have loaded the table while this one waited
+            if self._is_fresh(key):
+                return self._entities[key]
+            changedTime = await self._changed_time()
+            rows = await self._fetch(key)
+            self._entities[key] = CachedEntities(rows, CACHED_ENTITY_TYPES[key], changed_time = changedTime)
+            if self._LOGGER != None:
+                self._LOGGER.debug(f"Cache: Loaded {len(rows)} {key}")
+            if self.snapshot != None:
+                self.snapshot.put(key, {"changed_time": changedTime, "rows": rows})
+            return self._entities[key]
+
+    async def preload(self) -> None:
+        """Load every entity type, so all of them are in the snapshot."""
+        await asyncio.gather(*[self._load(key) for key in CACHED_ENTITY_TYPES])
+
+    def restore(self, tables: Dict[str, tuple]) -> None:
+        """Take the tables of a snapshot, each aging from the time it was saved."""
+        for key, nameField in CACHED_ENTITY_TYPES.items():
+            if key in tables and key not in self._entities:
+                data, savedAt = tables[key]
+                self._entities[key] = CachedEntities(data["rows"], nameField, age = max(time.time() - savedAt, 0), changed_time = data["changed_time"])
+
+    def revalidate(self, changed_time: str) -> List[str]:
+        """Renew the tables loaded at Grocy's current db-changed-time and expire the older ones; returns the renewed ones.
+
+        Expired tables are kept, an intent answered offline can still use them.
+        """
+        renewed = []
+        for key, entities in self._entities.items():
+            if entities.changed_time == None:
+                continue
+            if entities.changed_time == changed_time:
+                entities.loaded_at = time.monotonic()
+                renewed.append(key)
+            else:
+                entities.loaded_at = float("-inf")
+        return renewed
+
+    async def all(self, entity_type: Union[EntityType, str]) -> List[dict]:
+        return (await self._load(self._key(entity_type))).rows
+
+    async def by_id(self, entity_type: Union[EntityType, str]) -> Dict[int, dict]:
+        return (await self._load(self._key(entity_type))).by_id
+
+    async def get(self, entity_type: Union[EntityType, str], object_id) -> dict:
+        return (await self.by_id(entity_type)).get(int(object_id))
+
+    async def id_for_name(self, entity_type: Union[EntityType, str], name: str) -> int:
+        return (await self._load(self._key(entity_type))).by_name.get(str(name).lower())
+
+    async def _name_index(self, entity_type: Union[EntityType, str]) -> NameIndex:
+        return await (await self._load(self._key(entity_type))).name_index()
+
+    async def build_name_index(self, entity_type: Union[EntityType, str]) -> None:
+        """Load a table and index its names ahead of the first fuzzy lookup."""
+        await self._name_index(entity_type)
+
+    async def search(self, entity_type: Union[EntityType, str], text: str, k: int = 5, min_score: float = 0.0) -> List[tuple]:
+        """Up to k (score, row) pairs whose names are closest to text, best first."""
+        return (await self._name_index(entity_type)).search(text, k, min_score)
+
+    async def resolve(self, entity_type: Union[EntityType, str], text: str, min_score: float = 0.5) -> Optional[dict]:
+        """The row whose name best matches free text, or None when nothing is close enough."""
+        return (await self._name_index(entity_type)).best(text, min_score)
+
+    async def has_name(self, entity_type: Union[EntityType, str], name: str) -> bool:
+        """Whether a row already has this name, ignoring case and punctuation."""
+        return (await self._name_index(entity_type)).has_name(name)
+
+    def invalidate(self, entity_type: Union[EntityType, str] = None) -> None:
+        """Drop one entity type, or everything when no type is given."""
+        if entity_type == None:
+            self._entities.clear()
+        else:
+            self._entities.pop(self._key(entity_type), None)
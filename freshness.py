@@ -0,0 +1,70 @@
+"""One poll of Grocy's db-changed-time telling everything cached from Grocy when it changed."""
+import asyncio
+import time
+from typing import Callable, List
+import aiohttp
+from grocy_client import GrocyClient, GrocyError
+
+class FreshnessMonitor:
+    """Reads Grocy's db-changed-time every ``interval`` seconds.
+
+    Grocy moves it on every write to its database, so while it stands still nothing
+    cached from Grocy can be outdated and the steady state costs one tiny request per
+    interval. Listeners are called with the new value when it moves; background loops
+    wait on an event from ``subscribe`` instead of refetching on a timer.
+    """
+    _LOGGER = None
+
+    def __init__(self, grocy: GrocyClient, interval: float = 5, logger = None) -> None:
+        self.grocy = grocy
+        self.interval = interval
+        self.changed_time = None
+        # Monotonic time the change was noticed
+        self.changed_at = None
+        self._listeners: List[Callable[[str], None]] = []
+        self._events: List[asyncio.Event] = []
+        if logger != None:
+            self._LOGGER = logger
+
+    @classmethod
+    def from_config(cls, grocy: GrocyClient, config: dict, logger = None):
+        """Build the monitor from the optional [Freshness] config section, or None when its interval is 0."""
+        interval = float(config.get("Freshness", {}).get("interval", 5))
+        if interval <= 0:
+            return None
+        return cls(grocy, interval = interval, logger = logger)
+
+    def add_listener(self, listener: Callable[[str], None]) -> None:
+        self._listeners.append(listener)
+
+    def subscribe(self) -> asyncio.Event:
+        """An event set on every change, for one waiter to clear."""
+        event = asyncio.Event()
+        self._events.append(event)
+        return event
+
+    def seen(self, changed_time: str) -> None:
+        """Take a db-changed-time read elsewhere, telling the listeners if it moved."""
+        if changed_time == self.changed_time:
+            return
+        first = self.changed_time == None
+        self.changed_time = changed_time
+        self.changed_at = time.monotonic()
+        if first:
+            # Nothing was compared against it yet
+            return
+        if self._LOGGER != None:
+            self._LOGGER.debug(f"Freshness: Grocy changed at {changed_time}")
+        for listener in self._listeners:
+            listener(changed_time)
+        for event in self._events:
+            event.set()
+
+    async def run(self) -> None:
+        while True:
+            try:
+                self.seen(await self.grocy.db_changed_time())
+            except (aiohttp.ClientError, GrocyError, asyncio.TimeoutError) as error:
+                if self._LOGGER != None:
+                    self._LOGGER.debug(f"Freshness: Unable to read db-changed-time: {error}")
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,480 @@
+"""Async client for the Grocy API."""
+import asyncio
+import contextvars
+import functools
+import random
+import time
+import aiohttp
+from datetime import datetime
+from typing import List
+from pygrocy.data_models.generic import EntityType
+from pygrocy.grocy_api_client import TransactionType
+from circuit_breaker import CircuitBreaker
+from metrics import endpoint_label
+
+class GrocyError(Exception):
+    """Error response returned by the Grocy API."""
+
+    def __init__(self, status_code: int, message: str = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+class GrocyOffline(aiohttp.ClientConnectionError):
+    """Raised instead of contacting Grocy while an intent is answered offline."""
+
+#Set while an intent is answered from the last known state because Grocy is unreachable
+OFFLINE = contextvars.ContextVar("OFFLINE", default=False)
+
+#Monotonic time by which the intent running in the current context has to be answered
+DEADLINE = contextvars.ContextVar("DEADLINE", default=None)
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The intent a call was made for ran out of time, which says nothing about Grocy's health."""
+
+class GrocyUnhealthy(GrocyError):
+    """Raised instead of contacting Grocy while its circuit breaker is open."""
+
+    def __init__(self, retry_in: float) -> None:
+        super().__init__(503, f"it keeps failing, waiting {retry_in:.0f} seconds before trying again")
+        self.retry_in = retry_in
+
+class NotEnoughStock(GrocyError):
+    """A consume or transfer asked for more than is in stock."""
+
+    def __init__(self, product_id: int, amount: float, available: float, location_id: int = None) -> None:
+        where = "" if location_id == None else f" at location {location_id}"
+        super().__init__(400, f"Only {available:g} of product {product_id} in stock{where}, {amount:g} requested")
+        self.product_id = product_id
+        self.amount = amount
+        self.available = available
+        self.location_id = location_id
+
+class GrocyClient:
+    """Grocy API client sharing one pooled, keep-alive aiohttp session.
+
+    The session is created lazily inside the running event loop, so the client
+    can be constructed before the Hermes app starts its loop. Concurrent identical
+    GETs share one in-flight request, so callers must treat results as read-only.
+
+    The pool's ``pool_size`` connections bound the calls to Grocy as a whole and at
+    most ``endpoint_concurrency`` calls go to one endpoint at once, so a burst of slow
+    bulk reads can't take every connection. Every call gives up after
+    ``request_timeout`` seconds, or earlier when the intent it runs for reaches its
+    DEADLINE. Failed GETs are tried again up to ``get_retries`` times after a jittered
+    backoff; nothing else is, as other methods aren't idempotent. Connection errors,
+    timeouts and 5xx responses count towards the circuit breaker, which turns calls away
+    with GrocyUnhealthy after ``breaker_threshold`` failures in a row.
+    """
+    _LOGGER = None
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        port = None,
+        verify_ssl = True,
+        pool_size: int = 10,
+        endpoint_concurrency: int = 4,
+        request_timeout: float = 10,
+        get_retries: int = 2,
+        retry_delay: float = 0.2,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 30,
+        logger = None
+    ) -> None:
+        if port == None:
+            self.base_url = f"{base_url.rstrip('/')}/api/"
+        else:
+            self.base_url = f"{base_url.rstrip('/')}:{port}/api/"
+        self.verify_ssl = verify_ssl
+        self.pool_size = pool_size
+        self.endpoint_concurrency = endpoint_concurrency
+        self.request_timeout = request_timeout
+        self.get_retries = get_retries
+        self.retry_delay = retry_delay
+        self.breaker = CircuitBreaker(self.base_url, breaker_threshold, breaker_cooldown, logger = logger)
+        self._headers = {"accept": "application/json", "GROCY-API-KEY": api_key}
+        self._session = None
+        self._session_loop = None
+        # (ETag, Last-Modified, body) of conditional GETs, keyed by url and query
+        self._validators = {}
+        # GETs currently in flight, keyed like the validators
+        self._inflight = {}
+        # Semaphores limiting the calls to one endpoint, keyed by method and endpoint_label
+        self._endpoint_semaphores = {}
+        # Optional metrics.Metrics receiving the latency of every call
+        self.metrics = None
+        # Optional stock_ledger.StockLedger checking and recording stock changes
+        self.stock_ledger = None
+        # Wall clock time of the last response Grocy sent
+        self.answered_at = None
+        if logger != None:
+            self._LOGGER = logger
+
+    @classmethod
+    def from_config(cls, config: dict, logger = None):
+        """Build the client from the [Grocy Setup] config section."""
+        grocyConfig = config['Grocy Setup']
+        return cls(
+            grocyConfig['host'],
+            grocyConfig['apikey'],
+            port = grocyConfig['port'],
+            verify_ssl = str(grocyConfig['verifyssl']).lower() in ("1", "true", "yes", "on"),
+            pool_size = int(grocyConfig.get('pool_size', 10)),
+            endpoint_concurrency = int(grocyConfig.get('endpoint_concurrency', 4)),
+            request_timeout = float(grocyConfig.get('request_timeout', 10)),
+            get_retries = int(grocyConfig.get('get_retries', 2)),
+            retry_delay = float(grocyConfig.get('retry_delay', 0.2)),
+            breaker_threshold = int(grocyConfig.get('breaker_threshold', 5)),
+            breaker_cooldown = float(grocyConfig.get('breaker_cooldown', 30)),
+            logger = logger
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        if self._session == None or self._session.closed or self._session_loop is not loop:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, ssl=None if self.verify_ssl else False, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(headers=self._headers, connector=connector)
+            self._session_loop = loop
+            self._endpoint_semaphores = {}
+        return self._session
+
+    async def close(self) -> None:
+        if self._session != None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _endpoint_semaphore(self, method: str, end_url: str) -> asyncio.Semaphore:
+        key = (method, endpoint_label(end_url))
+        semaphore = self._endpoint_semaphores.get(key)
+        if semaphore == None:
+            semaphore = self._endpoint_semaphores[key] = asyncio.Semaphore(self.endpoint_concurrency)
+        return semaphore
+
+    def _timeout(self, deadline: float = None) -> float:
+        """Seconds a call may take, raising DeadlineExceeded once the deadline has passed."""
+        if deadline == None:
+            return self.request_timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        return min(remaining, self.request_timeout)
+
+    async def _request(self, method: str, end_url: str, params = None, data = None, conditional: bool = False, deadline: float = None):
+        if OFFLINE.get():
+            raise GrocyOffline(f"Grocy is offline, not sending {method} /{end_url}")
+        # Too late already, don't use up the breaker's trial
+        self._timeout(deadline)
+        # Let through while the breaker is open, this call is the trial
+        trial = self.breaker.is_open
+        if not self.breaker.allow():
+            raise GrocyUnhealthy(self.breaker.retry_in())
+        started = time.perf_counter()
+        error = True
+        try:
+            result = await self._limited(method, end_url, params, data, conditional, deadline)
+            error = False
+            self.breaker.succeeded()
+            return result
+        except GrocyError as grocyError:
+            if grocyError.status_code >= 500:
+                self.breaker.failed()
+            else:
+                # Grocy answered, it just didn't like the request
+                self.breaker.succeeded()
+            raise
+        except (DeadlineExceeded, asyncio.CancelledError):
+            # The caller gave up, Grocy may still have been fine
+            if trial:
+                self.breaker.abandoned()
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.breaker.failed()
+            raise
+        finally:
+            if self.metrics != None:
+                self.metrics.observe_grocy(method, end_url, time.perf_counter() - started, error)
+
+    async def _limited(self, method: str, end_url: str, params, data, conditional: bool, deadline: float):
+        self._get_session()
+        semaphore = self._endpoint_semaphore(method, end_url)
+        if deadline == None:
+            await semaphore.acquire()
+        else:
+            waitTimeout = self._timeout(deadline)
+            try:
+                await asyncio.wait_for(semaphore.acquire(), waitTimeout)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded() from None
+        try:
+            timeout = self._timeout(deadline)
+            try:
+                return await self._send(method, end_url, params, data, conditional, timeout)
+            except asyncio.TimeoutError:
+                if timeout < self.request_timeout:
+                    # Cut short by the deadline, not request_timeout
+                    raise DeadlineExceeded() from None
+                raise
+        finally:
+            semaphore.release()
+
+    async def _send(self, method: str, end_url: str, params = None, data = None, conditional: bool = False, timeout: float = None):
+        session = self._get_session()
+        headers = None
+        validatorKey = (end_url, str(params))
+        validator = self._validators.get(validatorKey) if conditional else None
+        if validator != None:
+            headers = {}
+            if validator[0] != None:
+                headers["If-None-Match"] = validator[0]
+            if validator[1] != None:
+                headers["If-Modified-Since"] = validator[1]
+        async with session.request(method, f"{self.base_url}{end_url}", params=params, json=data, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            body = await response.read()
+            if self._LOGGER != None:
+                self._LOGGER.debug(f"Grocy: {method} /{end_url} -> {response.status}")
+            self.answered_at = time.time()
+            if response.status == 304 and validator != None:
+                return validator[2]
+            if response.status >= 400:
+                message = None
+                try:
+                    message = (await response.json(content_type=None)).get("error_message")
+                except (ValueError, AttributeError):
+                    message = body.decode("utf-8", "replace")
+                raise GrocyError(response.status, message)
+            result = None
+            if len(body) > 0:
+                result = await response.json(content_type=None)
+            if conditional and (response.headers.get("ETag") != None or response.headers.get("Last-Modified") != None):
+                self._validators[validatorKey] = (response.headers.get("ETag"), response.headers.get("Last-Modified"), result)
+            return result
+
+    async def get(self, end_url: str, query_filters: List[str] = None, conditional: bool = False, order: str = None, limit: int = None):
+        """GET an endpoint; conditional requests revalidate the last response with ETag/If-Modified-Since."""
+        params = None
+        if query_filters:
+            if isinstance(query_filters, str):
+                query_filters = [query_filters]
+            params = [("query[]", query_filter) for query_filter in query_filters]
+        if order != None:
+            params = (params or []) + [("order", order)]
+        if limit != None:
+            params = (params or []) + [("limit", str(limit))]
+
+        if OFFLINE.get():
+            raise GrocyOffline(f"Grocy is offline, not sending GET /{end_url}")
+        # Single-flight: join an identical request that is already running instead of sending another
+        key = (end_url, str(params))
+        inflight = self._inflight.get(key)
+        if inflight != None and inflight.get_loop() is asyncio.get_running_loop():
+            if self.metrics != None:
+                self.metrics.observe_coalesced(end_url)
+        else:
+            # Shared by callers with different deadlines, so it is bound by request_timeout only
+            inflight = asyncio.ensure_future(self._get_retrying(end_url, params, conditional))
+            self._inflight[key] = inflight
+            inflight.add_done_callback(functools.partial(self._request_done, key))
+        # Shielded so a caller giving up does not cancel the request for the others
+        deadline = DEADLINE.get()
+        if deadline == None:
+            return await asyncio.shield(inflight)
+        try:
+            return await asyncio.wait_for(asyncio.shield(inflight), self._timeout(deadline))
+        except asyncio.TimeoutError:
+            if inflight.done():
+                raise
+            raise DeadlineExceeded() from None
+
+    async def _get_retrying(self, end_url: str, params = None, conditional: bool = False, deadline: float = None):
+        """GET once and up to get_retries times more after connection errors, timeouts and 5xx responses."""
+        attempt = 0
+        while True:
+            try:
+                return await self._request("GET", end_url, params=params, conditional=conditional, deadline=deadline)
+            except (GrocyUnhealthy, DeadlineExceeded):
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, GrocyError) as error:
+                if attempt >= self.get_retries or (isinstance(error, GrocyError) and error.status_code < 500):
+                    raise
+                # Full jitter, so callers that failed together don't come back together
+                delay = random.uniform(0, self.retry_delay * 2 ** attempt)
+                if deadline != None and time.monotonic() + delay >= deadline:
+                    raise
+                if self._LOGGER != None:
+                    self._LOGGER.debug(f"Grocy: GET /{end_url} failed ({error or type(error).__name__}), retrying in {delay * 1000:.0f}ms")
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    def _request_done(self, key: tuple, request: asyncio.Future) -> None:
+        if self._inflight.get(key) is request:
+            del self._inflight[key]
+        if not request.cancelled():
+            # Mark the error as retrieved even if every caller went away
+            request.exception()
+
+    async def post(self, end_url: str, data: dict = None):
+        return await self._request("POST", end_url, data=data, deadline=DEADLINE.get())
+
+    #System
+    async def get_system_info(self):
+        return await self.get("system/info")
+
+    async def db_changed_time(self) -> str:
+        """Time of the last change to the Grocy database."""
+        return (await self.get("system/db-changed-time"))["changed_time"]
+
+    #Generic objects
+    async def get_generic_objects_for_type(self, entity_type: EntityType, query_filters: List[str] = None, conditional: bool = False):
+        return await self.get(f"objects/{EntityType(entity_type).value}", query_filters, conditional) or []
+
+    async def add_generic(self, entity_type: EntityType, data: dict):
+        return await self.post(f"objects/{EntityType(entity_type).value}", data)
+
+    #Stock
+    async def product(self, product_id: int):
+        return await self.get(f"stock/products/{product_id}")
+
+    async def stock_by_location(self, location_id: int):
+        return await self.get(f"stock/locations/{location_id}/entries") or []
+
+    async def volatile_stock(self, due_soon_days: int = 5) -> dict:
+        """Due, overdue, expired and below minimum stock in one call."""
+        return await self._get_retrying("stock/volatile", {"due_soon_days": str(due_soon_days)}, deadline=DEADLINE.get()) or {}
+
+    async def stock_entries(self):
+        """Every stock row, one per product, location and best before date."""
+        return await self.get("objects/stock", conditional=True) or []
+
+    async def stock_log(self, after_id: int = 0):
+        """Stock bookings with an id above after_id, oldest first."""
+        return await self.get("objects/stock_log", [f"id>{after_id}"], order="id") or []
+
+    async def last_stock_log_id(self) -> int:
+        rows = await self.get("objects/stock_log", order="id:desc", limit=1) or []
+        return int(rows[0]["id"]) if len(rows) > 0 else 0
+
+    def _stock_booked(self, bookings):
+        if self.stock_ledger != None:
+            self.stock_ledger.record(bookings)
+        return bookings
+
+    async def _check_stock(self, product_id: int, amount: float, location_id: int = None) -> None:
+        if self.stock_ledger != None:
+            await self.stock_ledger.check(product_id, amount, location_id)
+
+    async def _stock_rejected(self, error: GrocyError, product_id: int, amount: float, location_id: int = None) -> None:
+        """Turn Grocy's rejection into NotEnoughStock when a fresh ledger confirms the shortage."""
+        if self.stock_ledger != None and error.status_code == 400:
+            await self.stock_ledger.sync()
+            await self.stock_ledger.check(product_id, amount, location_id, sync=False)
+
+    async def purchase_product(
+        self,
+        product_id: int,
+        amount: float,
+        price: float = None,
+        best_before_date: datetime = None,
+        transaction_type: TransactionType = TransactionType.PURCHASE,
+        location_id: int = None
+    ):
+        data = {
+            "amount": amount,
+            "transaction_type": transaction_type.value,
+            "price": price,
+        }
+
+        if location_id is not None:
+            data["location_id"] = location_id
+
+        if best_before_date is not None:
+            data["best_before_date"] = best_before_date.strftime("%Y-%m-%d")
+
+        return self._stock_booked(await self.post(f"stock/products/{product_id}/add", data))
+
+    async def consume_product(
+        self,
+        product_id: int,
+        amount: float = 1,
+        spoiled: bool = False,
+        transaction_type: TransactionType = TransactionType.CONSUME,
+        location_id: int = None
+    ):
+        data = {
+            "amount": amount,
+            "spoiled": spoiled,
+            "transaction_type": transaction_type.value,
+        }
+
+        if location_id is not None:
+            data["location_id"] = location_id
+
+        await self._check_stock(product_id, amount, location_id)
+        try:
+            return self._stock_booked(await self.post(f"stock/products/{product_id}/consume", data))
+        except GrocyError as error:
+            await self._stock_rejected(error, product_id, amount, location_id)
+            raise
+
+    async def transfer_product(self, product_id: int, fromlocation_id: int, tolocation_id: int, amount: float):
+        data = {
+            "amount": amount,
+            "location_id_from": fromlocation_id,
+            "location_id_to": tolocation_id
+        }
+
+        await self._check_stock(product_id, amount, fromlocation_id)
+        try:
+            return self._stock_booked(await self.post(f"stock/products/{product_id}/transfer", data))
+        except GrocyError as error:
+            await self._stock_rejected(error, product_id, amount, fromlocation_id)
+            raise
+
+    #Shopping lists
+    async def add_product_to_shopping_list(self, product_id: int, shopping_list_id: int = 1, amount: float = 1):
+        data = {
+            "product_id": product_id,
+            "list_id": shopping_list_id,
+            "product_amount": amount,
+        }
+        return await self.post("stock/shoppinglist/add-product", data)
+
+    async def remove_product_in_shopping_list(self, product_id: int, shopping_list_id: int = 1, amount: float = 1):
+        data = {
+            "product_id": product_id,
+            "list_id": shopping_list_id,
+            "product_amount": amount,
+        }
+        return await self.post("stock/shoppinglist/remove-product", data)
+
+    #Chores
+    async def chores(self, query_filters: List[str] = None):
+        return await self.get("chores", query_filters) or []
+
+    async def execute_chore(self, chore_id: int, tracked_time: datetime = None, skipped: bool = False, done_by: int = None):
+        if tracked_time == None:
+            tracked_time = datetime.now()
+        data = {
+            "tracked_time": tracked_time.astimezone().isoformat(),
+            "skipped": skipped,
+        }
+
+        if done_by is not None:
+            data["done_by"] = done_by
+
+        return await self.post(f"chores/{chore_id}/execute", data)
+
+    #Batteries
+    async def batteries(self):
+        return await self.get("batteries") or []
+
+    async def battery(self, battery_id: int):
+        return await self.get(f"batteries/{battery_id}")
+
+    async def charge_battery(self, battery_id: int, tracked_time: datetime = None):
+        if tracked_time == None:
+            tracked_time = datetime.now()
+        data = {"tracked_time": tracked_time.astimezone().isoformat()}
+
+        return await self.post(f"batteries/{battery_id}/charge", data)
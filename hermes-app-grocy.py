@@ -1,17 +1,27 @@
 """Skill to work with the Grocy App."""
 
+import argparse
+import asyncio
 import logging
+import os
 from skill import RhasspySkill
+from slots import generate_slot_files
 from rhasspyhermes_app import HermesApp
 
 _APPNAME = "GrocyApp"
 _LOGGER = logging.getLogger(_APPNAME)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog=_APPNAME)
+    parser.add_argument("--generate-slots", metavar="DIR", help="Write the Grocy slot files to DIR and exit")
     _LOGGER.info(f"Starting Hermes App: {_APPNAME}")
-    app = HermesApp(_APPNAME)
-    _LOGGER.info(f"Setup starting App: {_APPNAME}")
-    skill = RhasspySkill(name = _APPNAME, app = app, logger = _LOGGER)
-    _LOGGER.info(f"Setup Completed App: {_APPNAME}")
-    _LOGGER.info(f"Running App: {_APPNAME}")
-    app.run()
+    app = HermesApp(_APPNAME, parser=parser)
+    if app.args.generate_slots:
+        _LOGGER.info(f"Generating slots: {app.args.generate_slots}")
+        asyncio.run(generate_slot_files(RhasspySkill.read_configuration_file(), app.args.generate_slots, os.path.dirname(__file__) + "/config/slots.json", logger = _LOGGER))
+    else:
+        _LOGGER.info(f"Setup starting App: {_APPNAME}")
+        skill = RhasspySkill(name = _APPNAME, app = app, logger = _LOGGER)
+        _LOGGER.info(f"Setup Completed App: {_APPNAME}")
+        _LOGGER.info(f"Running App: {_APPNAME}")
+        app.run()
@@ -0,0 +1,38 @@
+"""Slots of an intent by name, extracted once before its handler runs."""
+from typing import Dict, Iterable, List, Optional
+from rhasspyhermes.intent import Slot
+from rhasspyhermes.nlu import NluIntent
+
+class ParsedIntent:
+    """An NluIntent's slots keyed by slot name.
+
+    Handlers look slots up here instead of scanning ``intent.slots`` for every name.
+    When a name occurs more than once the first slot wins, as with ``next()`` over the list.
+    """
+    __slots__ = ("intent", "slots")
+
+    def __init__(self, intent: NluIntent) -> None:
+        self.intent = intent
+        self.slots: Dict[str, Slot] = {}
+        for slot in intent.slots:
+            self.slots.setdefault(slot.slot_name, slot)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.slots
+
+    def slot(self, name: str) -> Optional[Slot]:
+        return self.slots.get(name)
+
+    def value(self, name: str, default = None):
+        """The slot's value, or default when the slot wasn't sent."""
+        slot = self.slots.get(name)
+        return slot.value['value'] if slot != None else default
+
+    def raw(self, name: str, default: str = None) -> str:
+        """The words the slot was recognised from, or default when it wasn't sent."""
+        slot = self.slots.get(name)
+        return slot.raw_value if slot != None else default
+
+    def missing(self, names: Iterable[str]) -> List[str]:
+        """The given slot names the intent didn't carry, in the given order."""
+        return [name for name in names if name not in self.slots]
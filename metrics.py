@@ -0,0 +1,163 @@
+"""Latency and count metrics for intents, Grocy calls and the entity cache."""
+import asyncio
+import bisect
+import re
+from collections import defaultdict, deque
+from aiohttp import web
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+def endpoint_label(end_url: str) -> str:
+    """Collapse ids in an API path so calls to the same endpoint share one series."""
+    return _ID_SEGMENT.sub("/{id}", f"/{end_url}")[1:]
+
+class Histogram:
+    """Cumulative latency buckets plus a window of recent samples for percentiles."""
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, window: int = 1024) -> None:
+        self.bucket_counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, seconds: float) -> None:
+        self.bucket_counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.recent.append(seconds)
+
+    def percentile(self, percent: float) -> float:
+        if len(self.recent) == 0:
+            return 0.0
+        samples = sorted(self.recent)
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+class Metrics:
+    """Collects per intent, per Grocy endpoint and cache metrics.
+
+    Exposed in Prometheus text format by ``serve`` and as a log line by ``log_summary``.
+    """
+    _LOGGER = None
+
+    def __init__(self, logger = None) -> None:
+        self.intent_counts = defaultdict(int)
+        self.intent_errors = defaultdict(int)
+        self.intent_latency = defaultdict(Histogram)
+        self.grocy_counts = defaultdict(int)
+        self.grocy_errors = defaultdict(int)
+        self.grocy_latency = defaultdict(Histogram)
+        self.grocy_coalesced = defaultdict(int)
+        self.cache_hits = defaultdict(int)
+        self.cache_misses = defaultdict(int)
+        if logger != None:
+            self._LOGGER = logger
+
+    def observe_intent(self, intent_name: str, seconds: float, error: bool = False) -> None:
+        self.intent_counts[intent_name] += 1
+        if error:
+            self.intent_errors[intent_name] += 1
+        self.intent_latency[intent_name].observe(seconds)
+
+    def observe_grocy(self, method: str, end_url: str, seconds: float, error: bool = False) -> None:
+        key = (method, endpoint_label(end_url))
+        self.grocy_counts[key] += 1
+        if error:
+            self.grocy_errors[key] += 1
+        self.grocy_latency[key].observe(seconds)
+
+    def observe_coalesced(self, end_url: str) -> None:
+        """A GET that joined an identical request already in flight."""
+        self.grocy_coalesced[endpoint_label(end_url)] += 1
+
+    def observe_cache(self, entity_type: str, hit: bool) -> None:
+        if hit:
+            self.cache_hits[entity_type] += 1
+        else:
+            self.cache_misses[entity_type] += 1
+
+    def _histogram_lines(self, name: str, labels: str, histogram: Histogram) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(Histogram.BUCKETS, histogram.bucket_counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        return lines
+
+    def render_prometheus(self) -> str:
+        lines = [
+            "# TYPE grocy_skill_intents_total counter",
+            "# TYPE grocy_skill_intent_errors_total counter",
+            "# TYPE grocy_skill_intent_seconds histogram",
+        ]
+        for intentName in sorted(self.intent_counts):
+            labels = f'intent="{intentName}"'
+            lines.append(f"grocy_skill_intents_total{{{labels}}} {self.intent_counts[intentName]}")
+            lines.append(f"grocy_skill_intent_errors_total{{{labels}}} {self.intent_errors[intentName]}")
+            lines.extend(self._histogram_lines("grocy_skill_intent_seconds", labels, self.intent_latency[intentName]))
+
+        lines.extend([
+            "# TYPE grocy_skill_grocy_requests_total counter",
+            "# TYPE grocy_skill_grocy_errors_total counter",
+            "# TYPE grocy_skill_grocy_request_seconds histogram",
+        ])
+        for method, endpoint in sorted(self.grocy_counts):
+            labels = f'method="{method}",endpoint="{endpoint}"'
+            lines.append(f"grocy_skill_grocy_requests_total{{{labels}}} {self.grocy_counts[(method, endpoint)]}")
+            lines.append(f"grocy_skill_grocy_errors_total{{{labels}}} {self.grocy_errors[(method, endpoint)]}")
+            lines.extend(self._histogram_lines("grocy_skill_grocy_request_seconds", labels, self.grocy_latency[(method, endpoint)]))
+
+        lines.append("# TYPE grocy_skill_grocy_coalesced_total counter")
+        for endpoint in sorted(self.grocy_coalesced):
+            lines.append(f'grocy_skill_grocy_coalesced_total{{endpoint="{endpoint}"}} {self.grocy_coalesced[endpoint]}')
+
+        lines.extend([
+            "# TYPE grocy_skill_cache_hits_total counter",
+            "# TYPE grocy_skill_cache_misses_total counter",
+        ])
+        for entityType in sorted(set(self.cache_hits) | set(self.cache_misses)):
+            labels = f'entity="{entityType}"'
+            lines.append(f"grocy_skill_cache_hits_total{{{labels}}} {self.cache_hits[entityType]}")
+            lines.append(f"grocy_skill_cache_misses_total{{{labels}}} {self.cache_misses[entityType]}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        parts = []
+        for intentName in sorted(self.intent_counts):
+            histogram = self.intent_latency[intentName]
+            parts.append(f"{intentName}: n={self.intent_counts[intentName]} err={self.intent_errors[intentName]} p50={histogram.percentile(50) * 1000:.0f}ms p99={histogram.percentile(99) * 1000:.0f}ms")
+        for method, endpoint in sorted(self.grocy_counts):
+            histogram = self.grocy_latency[(method, endpoint)]
+            parts.append(f"{method} {endpoint}: n={self.grocy_counts[(method, endpoint)]} p50={histogram.percentile(50) * 1000:.0f}ms p99={histogram.percentile(99) * 1000:.0f}ms")
+        coalesced = sum(self.grocy_coalesced.values())
+        if coalesced > 0:
+            parts.append(f"coalesced GETs: {coalesced}")
+        hits = sum(self.cache_hits.values())
+        lookups = hits + sum(self.cache_misses.values())
+        if lookups > 0:
+            parts.append(f"cache hit rate: {hits / lookups:.1%}")
+        return " | ".join(parts)
+
+    async def serve(self, host: str, port: int) -> web.AppRunner:
+        """Expose /metrics over HTTP."""
+        async def handle_metrics(request):
+            return web.Response(text=self.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        if self._LOGGER != None:
+            self._LOGGER.info(f"Metrics: Serving on http://{host}:{port}/metrics")
+        return runner
+
+    async def log_summary(self, interval: float) -> None:
+        """Log the metrics summary every interval seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            if self._LOGGER != None and len(self.intent_counts) + len(self.grocy_counts) > 0:
+                self._LOGGER.info(f"Metrics: {self.summary()}")
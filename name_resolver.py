@@ -0,0 +1,73 @@
+"""Fuzzy lookup of Grocy names by character trigrams."""
+import collections
+import heapq
+import re
+from typing import Dict, List, Optional, Tuple
+
+def normalize(name: str) -> str:
+    """Lower case, punctuation dropped and whitespace collapsed, so spoken and typed names compare equal."""
+    return " ".join(re.sub(r"[^\w\s]", " ", str(name).lower()).split())
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return set(padded[index:index + 3] for index in range(len(padded) - 2))
+
+class NameIndex:
+    """Trigram index over the names of one entity table.
+
+    Built once per loaded table. A search only walks the posting lists of the query's
+    rarer trigrams, up to ``max_candidates`` entries, and ranks that shortlist by the
+    Dice coefficient of the trigram sets, so its cost depends on the query rather than
+    the table size.
+    """
+    def __init__(self, rows: List[dict], name_field: str, max_candidates: int = 2000) -> None:
+        self.rows = rows
+        self.max_candidates = max_candidates
+        self.names = [normalize(row.get(name_field, "")) for row in rows]
+        self.exact: Dict[str, int] = {}
+        self.grams: List[frozenset] = []
+        postings = collections.defaultdict(list)
+        for index, name in enumerate(self.names):
+            self.exact.setdefault(name, index)
+            grams = frozenset(trigrams(name))
+            self.grams.append(grams)
+            for gram in grams:
+                postings[gram].append(index)
+        self.postings: Dict[str, List[int]] = dict(postings)
+
+    def search(self, text: str, k: int = 5, min_score: float = 0.0) -> List[Tuple[float, dict]]:
+        """Up to k (score, row) pairs, best first; an exact match scores 1.0."""
+        name = normalize(text)
+        exactIndex = self.exact.get(name)
+        if exactIndex != None and k == 1:
+            return [(1.0, self.rows[exactIndex])]
+
+        queryGrams = trigrams(name)
+        counts = collections.Counter()
+        walked = 0
+        # Rarest trigrams first, they say the most about the name and have the shortest lists
+        for gram in sorted(queryGrams, key=lambda gram: len(self.postings.get(gram, ()))):
+            posting = self.postings.get(gram, ())
+            if walked > 0 and walked + len(posting) > self.max_candidates:
+                break
+            walked += len(posting)
+            counts.update(posting)
+
+        # Shortlist by the share of walked trigrams relative to name length, then score exactly
+        grams = self.grams
+        shortlist = heapq.nlargest(max(k * 10, 50), counts, key=lambda index: counts[index] / len(grams[index]))
+        if exactIndex != None and exactIndex not in shortlist:
+            shortlist.append(exactIndex)
+        scored = []
+        for index in shortlist:
+            score = 2.0 * len(queryGrams & self.grams[index]) / (len(queryGrams) + len(self.grams[index]))
+            if score >= min_score:
+                scored.append((score, index))
+        return [(score, self.rows[index]) for score, index in heapq.nlargest(k, scored)]
+
+    def best(self, text: str, min_score: float = 0.0) -> Optional[dict]:
+        matches = self.search(text, 1, min_score)
+        return matches[0][1] if len(matches) > 0 else None
+
+    def has_name(self, text: str) -> bool:
+        return normalize(text) in self.exact
@@ -0,0 +1,95 @@
+"""Response sentence catalog loaded from responses.ini."""
+import os
+import random
+import time
+from typing import Callable, Dict, List
+
+class CatalogFile:
+    """One parsed responses file with its templates precompiled."""
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.mtime = None
+        self.sections: Dict[str, List[Callable[..., str]]] = {}
+        self.checked_at = 0.0
+
+    def load(self) -> None:
+        sections = {}
+        templates = None
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if len(line) == 0 or line[0] in "#;":
+                    continue
+                if line[0] == "[" and line[-1] == "]":
+                    templates = sections.setdefault(line[1:-1], [])
+                elif templates != None:
+                    templates.append(line.format)
+        self.sections = sections
+        self.mtime = os.stat(self.path).st_mtime
+
+class ResponseCatalog:
+    """Serves randomised response sentences without touching the disk per utterance.
+
+    Each section of the responses file is parsed once into a list of ``str.format``
+    callables, so placeholders may be positional (``{}``) or named (``{product}``).
+    A language specific file next to the default one, e.g. ``responses.de.ini``, is used
+    for intents in that language, falling back to the default file per section. Files are reloaded when their mtime changes, checked at
+    most once every ``reload_interval`` seconds.
+    """
+    _LOGGER = None
+
+    def __init__(self, path: str, reload_interval: float = 5.0, logger = None) -> None:
+        self.path = path
+        self.reload_interval = reload_interval
+        self._files: Dict[str, CatalogFile] = {}
+        self._missing: Dict[str, float] = {}
+        if logger != None:
+            self._LOGGER = logger
+        self._file(None)
+
+    def _language_path(self, lang: str) -> str:
+        if lang == None:
+            return self.path
+        base, ext = os.path.splitext(self.path)
+        return f"{base}.{lang}{ext}"
+
+    def _file(self, lang: str) -> CatalogFile:
+        catalogFile = self._files.get(lang)
+        now = time.monotonic()
+        if catalogFile != None and now - catalogFile.checked_at < self.reload_interval:
+            return catalogFile
+        if lang in self._missing and now - self._missing[lang] < self.reload_interval:
+            return self._file(None)
+
+        path = self._language_path(lang)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            # No catalog for this language, fall back to the default file
+            if lang == None:
+                raise
+            self._files.pop(lang, None)
+            self._missing[lang] = now
+            return self._file(None)
+
+        self._missing.pop(lang, None)
+        if catalogFile == None:
+            catalogFile = self._files[lang] = CatalogFile(path)
+        if catalogFile.mtime != mtime:
+            catalogFile.load()
+            if self._LOGGER != None:
+                self._LOGGER.info(f"Responses: Loaded {len(catalogFile.sections)} sections from {path}")
+        catalogFile.checked_at = now
+        return catalogFile
+
+    def has(self, section: str, lang: str = None) -> bool:
+        return len(self._file(lang).sections.get(section) or self._file(None).sections.get(section) or []) > 0
+
+    def sentence(self, section: str, *args, lang: str = None, **kwargs) -> str:
+        """Pick a random template of the section and fill in its placeholders."""
+        templates = self._file(lang).sections.get(section)
+        if not templates and lang != None:
+            templates = self._file(None).sections.get(section)
+        if not templates:
+            raise KeyError(f"No responses for {section}")
+        return random.choice(templates)(*args, **kwargs)
@@ -1,27 +1,49 @@
 import asyncio
+import collections
+import contextvars
+import dataclasses
+import functools
+import re
 import os
+import socket
+import time
+import uuid
 import io
 import aiohttp
 import configparser
-import json
-import random
-from typing import Optional
-from rhasspyclient import RhasspyClient
+from typing import List, Optional
 from enum import Enum
 from pydantic import BaseModel
 from enum import Enum
 from datetime import datetime
-from rhasspyhermes.nlu import NluIntent
+from rhasspyhermes.dialogue import DialogueIntentNotRecognized
+from rhasspyhermes.intent import Intent
+from rhasspyhermes.nlu import NluIntent, NluIntentNotRecognized
 from rhasspyhermes_app import ContinueSession, EndSession, HermesApp
 from pygrocy.data_models.generic import EntityType
-from pygrocy import Grocy
-from pygrocy import errors
-from pygrocy.grocy_api_client import GrocyApiClient,TransactionType,ProductData
+from grocy_client import GrocyClient, GrocyError, GrocyUnhealthy, NotEnoughStock, OFFLINE, DEADLINE
+from entity_cache import GrocyEntityCache, USERS
+from responses import ResponseCatalog
+from deployment import SentenceDeployer
+from slots import SlotGenerator, SlotWatcher, SLOT_SOURCES
+from metrics import Metrics
+from intent_parser import ParsedIntent
+from tenants import Tenant, TENANT
+from snapshot import describe_age
+
+class PurchaseSessionItem(BaseModel):
+    product_id: int
+    product_name: str
+    quantity: float = 1
+    location_id: Optional[int]
 
 class SessionCustomData(BaseModel):
     intent_name: str
     input_text: str
     intent_slots: Optional[str]
+    items: List[PurchaseSessionItem] = []
+    listing_id: Optional[str]
+    listing_offset: int = 0
 
 class IntentNames(str, Enum):
     GROCYGETLOCATIONS = "GrocyGetLocations"
@@ -45,6 +67,90 @@ class IntentNames(str, Enum):
     GROCYGETBATTERYNEXTCHARGETIME = "GrocyGetBatteryNextChargeTime"
     GROCYTRACKBATTERYCHARGE = "GrocyTrackBatteryCharge"
 
+    GROCYSTARTPURCHASESESSION = "GrocyStartPurchaseSession"
+    GROCYPURCHASESESSIONITEM = "GrocyPurchaseSessionItem"
+    GROCYPURCHASESESSIONDONE = "GrocyPurchaseSessionDone"
+
+    GROCYCOMPOUND = "GrocyCompound"
+
+    GROCYLISTMORE = "GrocyListMore"
+
+    GROCYGETEXPIRING = "GrocyGetExpiring"
+    GROCYGETBELOWMINIMUM = "GrocyGetBelowMinimum"
+    GROCYGETOVERDUECHORES = "GrocyGetOverdueChores"
+    GROCYGETBATTERIESDUE = "GrocyGetBatteriesDue"
+
+#Intents a GrocyCompound utterance can combine, keyed by the prefix of their slot names
+COMPOUND_PARTS = {
+    "consume": IntentNames.GROCYTRACKPRODUCTCONSUME,
+    "purchase": IntentNames.GROCYPURCHASEPRODUCT,
+    "transfer": IntentNames.GROCYTRANSFERPRODUCT,
+    "add": IntentNames.GROCYADDPRODUCTTOSHOPPINGLIST,
+    "remove": IntentNames.GROCYREMOVEPRODUCTFROMSHOPPINGLIST,
+    "chore": IntentNames.GROCYTRACKCHORE,
+    "charge": IntentNames.GROCYTRACKBATTERYCHARGE,
+}
+
+#Entity types behind slots naming existing Grocy objects, by slot name (compound slots by their last part)
+SLOT_ENTITY_TYPES = {
+    "product": EntityType.PRODUCTS,
+    "location": EntityType.LOCATIONS,
+    "fromloc": EntityType.LOCATIONS,
+    "toloc": EntityType.LOCATIONS,
+    "list": EntityType.SHOPPING_LISTS,
+    "chore": EntityType.CHORES,
+    "battery": EntityType.BATTERIES,
+    "person": USERS,
+}
+
+#Slots an intent can't be handled without, asked for in this order when missing
+REQUIRED_SLOTS = {
+    IntentNames.GROCYGETLOCATIONSTOCK.value: ("location",),
+    IntentNames.GROCYPURCHASEPRODUCT.value: ("product", "quantity", "location"),
+    IntentNames.GROCYGETPRODUCTSTOCK.value: ("product",),
+    IntentNames.GROCYTRACKPRODUCTCONSUME.value: ("product",),
+    IntentNames.GROCYTRANSFERPRODUCT.value: ("product", "fromloc", "toloc"),
+    IntentNames.GROCYTRACKCHORE.value: ("action", "chore"),
+    IntentNames.GROCYADDPRODUCTTOSHOPPINGLIST.value: ("list", "product"),
+    IntentNames.GROCYREMOVEPRODUCTFROMSHOPPINGLIST.value: ("list", "product"),
+    IntentNames.GROCYGETBATTERYNEXTCHARGETIME.value: ("battery",),
+    IntentNames.GROCYTRACKBATTERYCHARGE.value: ("battery",),
+}
+
+#Intents whose name slots are new names, never resolved to existing objects
+NEW_NAME_INTENTS = (IntentNames.GROCYCREATEPRODUCT.value, IntentNames.GROCYCREATESHOPPINGLIST.value)
+
+#Intents answered from the snapshot while Grocy is unreachable, with the response saying so; writes are queued
+OFFLINE_INTENTS = {
+    IntentNames.GROCYGETLOCATIONS.value: "GrocyOffline-Read",
+    IntentNames.GROCYGETLOCATIONSTOCK.value: "GrocyOffline-Read",
+    IntentNames.GROCYGETPRODUCTSTOCK.value: "GrocyOffline-Read",
+    IntentNames.GROCYGETSHOPPINGLISTS.value: "GrocyOffline-Read",
+    IntentNames.GROCYGETBATTERIES.value: "GrocyOffline-Read",
+    IntentNames.GROCYGETEXPIRING.value: "GrocyOffline-Read",
+    IntentNames.GROCYGETBELOWMINIMUM.value: "GrocyOffline-Read",
+    IntentNames.GROCYGETCHORES.value: "GrocyOffline-Read",
+    IntentNames.GROCYGETOVERDUECHORES.value: "GrocyOffline-Read",
+    IntentNames.GROCYGETBATTERIESDUE.value: "GrocyOffline-Read",
+    IntentNames.GROCYPURCHASEPRODUCT.value: "GrocyOffline-Write",
+    IntentNames.GROCYTRACKPRODUCTCONSUME.value: "GrocyOffline-Write",
+    IntentNames.GROCYADDPRODUCTTOSHOPPINGLIST.value: "GrocyOffline-Write",
+    IntentNames.GROCYREMOVEPRODUCTFROMSHOPPINGLIST.value: "GrocyOffline-Write",
+    IntentNames.GROCYPURCHASESESSIONDONE.value: "GrocyOffline-Write",
+    IntentNames.GROCYSTARTPURCHASESESSION.value: None,
+    IntentNames.GROCYPURCHASESESSIONITEM.value: None,
+    IntentNames.GROCYLISTMORE.value: None,
+}
+
+#Unfinished listings kept for "more", the oldest is dropped first
+MAX_LISTINGS = 32
+
+#Sentences of the handler running in the current task, collected instead of spoken while inside a compound intent
+COMPOUND_REPLIES = contextvars.ContextVar("COMPOUND_REPLIES", default=None)
+
+#[sentence, site id] saying Grocy is unreachable, spoken ahead of the first answer of an intent handled offline
+OFFLINE_NOTICE = contextvars.ContextVar("OFFLINE_NOTICE", default=None)
+
 class RhasspySkill:
     name:str = None
     app: HermesApp = None
@@ -53,7 +159,18 @@ class RhasspySkill:
     apiUrl = None
     satellite_id = None
     intents = None
-    grocy = None
+    intent_functions = None
+    default_tenant = None
+    tenants = None
+    site_tenants = None
+    deployer = None
+    slot_generator = None
+    slot_watcher = None
+    tasks = None
+    metrics = None
+    listings = None
+    listing_page_size = 5
+    listing_mode = "more"
     
     def __init__(self, name: str, app: HermesApp, config = None, logger = None) -> None:
         self.name = name
@@ -64,90 +181,414 @@ class RhasspySkill:
         self.apiUrl = f"{self.config['Rhasspy']['protocol']}://{self.config['Rhasspy']['host']}:{self.config['Rhasspy']['port']}/api"
         if logger != None:
             self._LOGGER = logger            
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(self.setup_skill())    
-    
+        responses = ResponseCatalog(os.path.dirname(__file__) + "/config/responses.ini", logger = self._LOGGER)
+        self.tasks = []
+        self.metrics = Metrics(logger = self._LOGGER)
+        # Seconds an intent may wait for Grocy, below Rhasspy's dialogue session timeout so the answer still arrives
+        self.intent_timeout = float(self.config['Grocy Setup'].get('intent_timeout', 10))
+
+        # The main config is the default tenant, [Tenant:<name>] sections add households routed by site id
+        self.default_tenant = Tenant(
+            "default",
+            self.config,
+            max_concurrency = int(self.config['Grocy Setup'].get('max_concurrency', 32)),
+            responses = responses,
+            journal_path = os.path.dirname(__file__) + "/config/write_journal.jsonl",
+            snapshot_path = os.path.dirname(__file__) + "/config/snapshot.sqlite",
+            logger = self._LOGGER
+        )
+        self.tenants = [self.default_tenant] + [
+            Tenant.from_section(
+                name,
+                self.config,
+                responses,
+                os.path.dirname(__file__) + f"/config/write_journal-{name}.jsonl",
+                snapshot_path = os.path.dirname(__file__) + f"/config/snapshot-{name}.sqlite",
+                logger = self._LOGGER
+            )
+            for name in Tenant.names(self.config)
+        ]
+        self.site_tenants = {}
+        for tenant in self.tenants:
+            tenant.grocy.metrics = self.metrics
+            tenant.cache.metrics = self.metrics
+            # Optional write-behind mode: stock and shopping list changes are acknowledged before they reach Grocy,
+            # with a snapshot they are also queued while Grocy is down
+            tenant.setup_write_queue(self.write_failed)
+            # Optional announcements of items coming due, scheduled from the summaries' refreshes
+            tenant.setup_notifications(self.announce_due)
+            for siteId in tenant.sites:
+                self.site_tenants[siteId] = tenant
+
+        self.deployer = SentenceDeployer(
+            self.apiUrl,
+            os.path.dirname(__file__) + "/sentences.ini",
+            os.path.dirname(__file__) + "/config/deployment.json",
+            satellite_id = self.satellite_id,
+            logger = self._LOGGER
+        )
+        self.slot_generator = SlotGenerator(self.grocy, os.path.dirname(__file__) + "/config/slots.json", logger = self._LOGGER)
+        slotsConfig = self.config.get('Slots', {})
+        if float(slotsConfig.get('refresh_interval', 60)) > 0:
+            self.slot_watcher = SlotWatcher(
+                self.slot_generator,
+                self.deployer,
+                interval = float(slotsConfig.get('refresh_interval', 60)),
+                debounce = float(slotsConfig.get('debounce', 15)),
+                on_change = self.slots_changed,
+                logger = self._LOGGER
+            )
+            self.slot_watcher.monitor = self.default_tenant.monitor
+        if self.default_tenant.monitor != None:
+            # The cache catches up with every change the monitor sees, the slots only need its tables
+            self.slot_generator.cache = self.default_tenant.cache
+
+        listingsConfig = self.config.get('Listings', {})
+        self.listings = collections.OrderedDict()
+        self.listing_page_size = max(1, int(listingsConfig.get('page_size', 5)))
+        self.listing_mode = str(listingsConfig.get('mode', "more")).lower()
+
+        self.register_intents()
+        self.app.mqtt_client.on_socket_open = self.mqtt_socket_open
+
+        # Background tasks have to run in the loop the app creates in app.run()
+        handle_messages_async = self.app.handle_messages_async
+        async def run_app(*args, **kwargs):
+            self.start_background_tasks()
+            return await handle_messages_async(*args, **kwargs)
+        self.app.handle_messages_async = run_app
+
+    def start_background_tasks(self):
+        for tenant in self.tenants:
+            # Tasks copy the current context, so each one keeps working on its own tenant
+            token = TENANT.set(tenant)
+            try:
+                tenant.grocy_connected = asyncio.Event()
+                tenant.connect_task = asyncio.create_task(self.connect_grocy())
+                self.tasks.append(tenant.connect_task)
+                self.tasks.extend(asyncio.create_task(coroutine) for coroutine in tenant.background_tasks())
+            finally:
+                TENANT.reset(token)
+        self.tasks.append(asyncio.create_task(self.setup_skill()))
+        self.tasks.append(asyncio.create_task(self.start_metrics()))
+
+    #Tenants
+    def tenant(self) -> Tenant:
+        """Tenant of the intent or task running now, the default one outside of them."""
+        return TENANT.get() or self.default_tenant
+
+    def tenant_for(self, site_id: str) -> Tenant:
+        return self.site_tenants.get(site_id, self.default_tenant)
+
+    @property
+    def grocy(self) -> GrocyClient:
+        return self.tenant().grocy
+
+    @property
+    def cache(self) -> GrocyEntityCache:
+        return self.tenant().cache
+
+    @property
+    def ledger(self):
+        return self.tenant().ledger
+
+    @property
+    def summaries(self):
+        return self.tenant().summaries
+
+    @property
+    def write_queue(self):
+        tenant = self.tenant()
+        return tenant.write_queue if tenant.write_behind or OFFLINE.get() else None
+
+    @property
+    def notification_sites(self) -> list:
+        return self.tenant().notification_sites
+
+    @property
+    def responses(self) -> ResponseCatalog:
+        return self.tenant().responses
+
+    @property
+    def grocy_connected(self) -> asyncio.Event:
+        return self.tenant().grocy_connected
+
+    @grocy_connected.setter
+    def grocy_connected(self, event: asyncio.Event):
+        self.tenant().grocy_connected = event
+
+    def mqtt_socket_open(self, client, userdata, sock):
+        """Disable Nagle on the MQTT socket so back to back replies are not held by delayed ACKs."""
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def register_intents(self):
+        self.intent_functions = {
+            IntentNames.GROCYGETLOCATIONS: self.get_locations,
+            IntentNames.GROCYPURCHASEPRODUCT: self.purchase_product,
+            IntentNames.GROCYCREATEPRODUCT: self.create_product,
+            IntentNames.GROCYGETCHORES: self.get_chores,
+            IntentNames.GROCYTRACKCHORE: self.track_chore,
+            IntentNames.GROCYGETSHOPPINGLISTS: self.get_shoppinglist,
+            IntentNames.GROCYCREATESHOPPINGLIST: self.create_shopping_list,
+            IntentNames.GROCYADDPRODUCTTOSHOPPINGLIST: self.add_product_to_shopping_list,
+            IntentNames.GROCYREMOVEPRODUCTFROMSHOPPINGLIST: self.remove_product_from_shopping_list,
+            IntentNames.GROCYGETBATTERIES: self.get_batteries,
+            IntentNames.GROCYGETBATTERYNEXTCHARGETIME: self.get_batterynextchangetime,
+            IntentNames.GROCYTRACKBATTERYCHARGE: self.track_batterycharge,
+            IntentNames.GROCYGETPRODUCTSTOCK: self.get_productstock,
+            IntentNames.GROCYTRACKPRODUCTCONSUME: self.track_productconsume,
+            IntentNames.GROCYTRANSFERPRODUCT: self.transfer_product,
+            IntentNames.GROCYGETLOCATIONSTOCK: self.get_locationstock,
+            IntentNames.GROCYSTARTPURCHASESESSION: self.start_purchase_session,
+            IntentNames.GROCYPURCHASESESSIONITEM: self.purchase_session_item,
+            IntentNames.GROCYPURCHASESESSIONDONE: self.purchase_session_done,
+            IntentNames.GROCYCOMPOUND: self.compound,
+            IntentNames.GROCYLISTMORE: self.list_more,
+            IntentNames.GROCYGETEXPIRING: self.get_expiring,
+            IntentNames.GROCYGETBELOWMINIMUM: self.get_below_minimum,
+            IntentNames.GROCYGETOVERDUECHORES: self.get_overdue_chores,
+            IntentNames.GROCYGETBATTERIESDUE: self.get_batteries_due,
+        }
+        for intentName, function in self.intent_functions.items():
+            self.app.on_intent(intentName.value)(self.intent_handler(function))
+        # Sessions continued with send_intent_not_recognized hand misrecognitions to the dialogue handler
+        self.app.on_dialogue_intent_not_recognized(self.purchase_session_not_recognized)
+
+    def intent_handler(self, function):
+        """Wrap an intent handler so it is timed and answers at once while Grocy is unreachable."""
+        @functools.wraps(function)
+        async def handler(intent: NluIntent):
+            started = time.perf_counter()
+            error = True
+            # Everything the handler touches belongs to the household of the site it was spoken on
+            tenant = self.tenant_for(intent.site_id)
+            token = TENANT.set(tenant)
+            deadlineToken = DEADLINE.set(time.monotonic() + self.intent_timeout)
+            offlineToken = None
+            noticeToken = None
+            try:
+                if tenant.grocy_connected == None or not tenant.grocy_connected.is_set():
+                    if not self.answers_offline(tenant, intent.intent.intent_name):
+                        self._LOGGER.info(f"Intent: {intent.id} | Grocy {tenant.name} unavailable, not handling {intent.intent.intent_name}")
+                        return EndSession(self.responses.sentence("GrocyUnavailable", lang=intent.lang))
+                    # Grocy is never contacted while the handler runs, it answers from the snapshot
+                    offlineToken = OFFLINE.set(True)
+                    # Only said once the handler managed without Grocy
+                    noticeToken = OFFLINE_NOTICE.set(self.offline_notice(intent, tenant))
+                async with tenant.semaphore():
+                    try:
+                        if intent.intent.intent_name not in NEW_NAME_INTENTS:
+                            await self.resolve_slots(intent)
+                        result = await self.run_intent(function, ParsedIntent(intent))
+                        # Ahead of an answer returned rather than spoken by the handler
+                        self.speak_offline_notice()
+                        error = False
+                        return result
+                    except asyncio.TimeoutError:
+                        self._LOGGER.error(f"Intent: {intent.id} | Grocy {tenant.name} did not answer within {self.intent_timeout:g}s")
+                        if tenant.grocy.breaker.is_open:
+                            self.grocy_unavailable()
+                        return EndSession(self.responses.sentence("GrocyUnavailable", lang=intent.lang))
+                    except aiohttp.ClientError as connectionError:
+                        if OFFLINE.get():
+                            self._LOGGER.info(f"Intent: {intent.id} | Grocy {tenant.name} unavailable and the snapshot can't answer {intent.intent.intent_name}: {connectionError}")
+                        else:
+                            self._LOGGER.error(f"Intent: {intent.id} | Lost connection to Grocy {tenant.name}: {connectionError}")
+                        self.grocy_unavailable()
+                        return EndSession(self.responses.sentence("GrocyUnavailable", lang=intent.lang))
+                    except GrocyUnhealthy as unhealthy:
+                        self._LOGGER.error(f"Intent: {intent.id} | Grocy {tenant.name} is failing, not handling {intent.intent.intent_name}")
+                        return EndSession(self.unhealthy_sentence(intent, unhealthy))
+            finally:
+                if noticeToken != None:
+                    OFFLINE_NOTICE.reset(noticeToken)
+                if offlineToken != None:
+                    OFFLINE.reset(offlineToken)
+                DEADLINE.reset(deadlineToken)
+                TENANT.reset(token)
+                elapsed = time.perf_counter() - started
+                self.metrics.observe_intent(intent.intent.intent_name, elapsed, error)
+                self._LOGGER.debug(f"Intent: {intent.id} | {intent.intent.intent_name} handled in {elapsed * 1000:.1f}ms")
+        return handler
+
+    def unhealthy_sentence(self, intent: NluIntent, error: GrocyUnhealthy) -> str:
+        """Answer for an intent whose handler let the circuit breaker's error through."""
+        if self.responses.has(f"{intent.intent.intent_name}-Fail-GrocyError", lang=intent.lang):
+            return self.fail_sentence(intent, "GrocyError", error.message)
+        return self.responses.sentence("GrocyUnavailable", lang=intent.lang)
+
+    def answers_offline(self, tenant: Tenant, intentName: str) -> bool:
+        """Whether an intent can be answered without the tenant's Grocy, from its snapshot or queued for later."""
+        if intentName in OFFLINE_INTENTS and OFFLINE_INTENTS[intentName] == None:
+            # Kept in the session or the listing, nothing to read from Grocy
+            return True
+        if tenant.snapshot == None or intentName not in OFFLINE_INTENTS or tenant.data_time() == 0:
+            return False
+        return OFFLINE_INTENTS[intentName] != "GrocyOffline-Write" or tenant.write_queue != None
+
+    def offline_notice(self, intent: NluIntent, tenant: Tenant) -> Optional[list]:
+        """The notice that Grocy is unreachable for an intent answered offline, as [sentence, site id]."""
+        section = OFFLINE_INTENTS[intent.intent.intent_name]
+        if section == None:
+            return None
+        age = describe_age(max(time.time() - tenant.data_time(), 0))
+        self._LOGGER.info(f"Intent: {intent.id} | Grocy {tenant.name} unavailable, answering {intent.intent.intent_name} from data {age} old")
+        return [self.responses.sentence(section, age=age, lang=intent.lang), intent.site_id]
+
+    def speak_offline_notice(self):
+        """Say the pending offline notice of the running intent, once."""
+        notice = OFFLINE_NOTICE.get()
+        if notice:
+            self.app.notify(*notice)
+            notice.clear()
+
+    async def run_intent(self, function, parsed: ParsedIntent):
+        """Run a handler with its parsed slots, or ask for the first required slot that wasn't sent."""
+        intent = parsed.intent
+        missing = parsed.missing(REQUIRED_SLOTS.get(intent.intent.intent_name, ()))
+        if len(missing) > 0:
+            self._LOGGER.info(f"Intent: {intent.id} | Missing slots: {', '.join(missing)}")
+            return EndSession(self.responses.sentence(f"MissingSlot-{missing[0]}", lang=intent.lang))
+        return await function(intent, parsed)
+
+    async def resolve_slots(self, intent: NluIntent):
+        """Replace free-text slot values with the id of the closest matching Grocy object."""
+        # Generated slots carry the default Grocy's ids, other tenants match the spoken name instead
+        slotIds = self.tenant() is self.default_tenant
+        for slot in intent.slots:
+            entityType = SLOT_ENTITY_TYPES.get(slot.slot_name.split("_")[-1])
+            value = slot.value.get('value') if isinstance(slot.value, dict) else None
+            if entityType == None or value == None:
+                continue
+            if (isinstance(value, (int, float)) or str(value).isdigit()) and (slotIds or not slot.raw_value):
+                continue
+            row = await self.cache.resolve(entityType, slot.raw_value or value)
+            if row == None:
+                self._LOGGER.info(f"Intent: {intent.id} | No {EntityType(entityType).value if entityType != USERS else USERS} matches {slot.slot_name} '{value}'")
+                continue
+            self._LOGGER.info(f"Intent: {intent.id} | Resolved {slot.slot_name} '{value}' to {row['id']}")
+            slot.value['value'] = int(row['id'])
+
+    @staticmethod
+    def extract_name(intent: NluIntent, lead: str, trail: str = None) -> str:
+        """Cut a spoken name out of the raw input, between the lead words and optional trailing words."""
+        pattern = re.escape(lead) + r"\s+(.+?)"
+        if trail != None:
+            pattern += r"(?:\s+" + trail + r")?"
+        match = re.match(pattern + r"\s*$", intent.raw_input or "", re.IGNORECASE)
+        return match.group(1).strip() if match != None else ""
+
+    async def start_metrics(self):
+        """Serve metrics over HTTP and log a periodic summary when configured in [Metrics]."""
+        metricsConfig = self.config.get('Metrics', {})
+        port = int(metricsConfig.get('port', 0))
+        if port > 0:
+            try:
+                await self.metrics.serve(metricsConfig.get('host', "127.0.0.1"), port)
+            except OSError as error:
+                self._LOGGER.error(f"Metrics: Unable to serve on port {port}: {error}")
+        logInterval = float(metricsConfig.get('log_interval', 300))
+        if logInterval > 0:
+            await self.metrics.log_summary(logInterval)
+
+    async def connect_grocy(self):
+        """Connect to Grocy, retrying with exponential backoff until it answers."""
+        # Started from an intent when Grocy went away, but not bound by that intent's deadline
+        DEADLINE.set(None)
+        tenant = self.tenant()
+        grocySetup = tenant.config['Grocy Setup']
+        self._LOGGER.info(f"Config - Tenant: {tenant.name}")
+        self._LOGGER.info(f"Config - Host: {grocySetup['host']}")
+        self._LOGGER.info(f"Config - Port: {grocySetup['port']}")
+        self._LOGGER.info(f"Config - Verify SSL: {grocySetup['verifyssl']}")
+        self._LOGGER.info(f"Config - API Key: {grocySetup['apikey']}")
+        delay = 1
+        maxDelay = float(grocySetup.get('retry_max_delay', 60))
+        while True:
+            try:
+                sysinfo = await self.grocy.get_system_info()
+                # Before any intent is let through, so none of them is answered from outdated tables
+                await tenant.revalidate()
+                self._LOGGER.info(f"Connected to host: {grocySetup['host']}:{grocySetup['port']} grocy version: {sysinfo['grocy_version']['Version']}")
+                self.grocy_connected.set()
+                return
+            except (aiohttp.ClientError, GrocyError, asyncio.TimeoutError) as error:
+                self._LOGGER.error(f"Error connecting to host: {grocySetup['host']} ({error}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, maxDelay)
+
+    def grocy_unavailable(self):
+        """Mark Grocy as down and start reconnecting unless that is already happening."""
+        if OFFLINE.get():
+            # Already known to be down; a connect task started from here would inherit the offline context
+            return
+        tenant = self.tenant()
+        tenant.grocy_connected.clear()
+        if tenant.connect_task == None or tenant.connect_task.done():
+            tenant.connect_task = asyncio.create_task(self.connect_grocy())
+            self.tasks.append(tenant.connect_task)
+
     async def setup_skill(self):
-        
-        data = {}
-        sentencesString = ""
-        
-        # Sentence setup
-        async with aiohttp.ClientSession(headers=[("accept", "application/json")]) as session:
-            async with session.get(
-                f"{self.apiUrl}/sentences"
-            ) as response:
-                response.raise_for_status()
-                result = await response.json()
-                self._LOGGER.debug(f"Setup: Sentences GET result: {result}")
-                if result.get(f"intents/grocy.ini") == None:
-                    self._LOGGER.info(f"Setup: Sentences file note found")
-                    # open the sentence file in read mode and split into a list
-                    sentences = configparser.ConfigParser(allow_no_value=True)
-                    sentences.read("./sentences.ini")
-
-                    if self._LOGGER != None:
-                        self._LOGGER.info(f"Setup: Sentences config file read")
-
-                        # parse sentences config file
-                        for section in sentences.sections():
-                            sentencesString = f"{sentencesString}[{section}-{self.satellite_id}]\n"
-                            for key in sentences[section]: 
-                                sentencesString = f"{sentencesString}{key}\n"
-                            sentencesString = f"{sentencesString}\n"   
-                        
-                        data[f"intents/grocy.ini"] = sentencesString
-
-                        if self._LOGGER != None:
-                            self._LOGGER.info(f"Setup: Sentences POST data built")
-                        
-                        async with aiohttp.ClientSession(headers=[("Content-Type", "application/json")]) as session:
-                            async with session.post(
-                                    f"{self.apiUrl}/sentences", data=json.dumps(data)
-                                ) as response:
-                                    response.raise_for_status()
-                                    result = await response.text()
-                                    self._LOGGER.debug(f"Setup: Sentences POST result: {result}")
-                            client = RhasspyClient(f"{self.apiUrl}", session)
-                            result = await client.train(no_cache=True)
-                            self._LOGGER.info(f"Setup: Train POST result: {result}")
-                    else:
-                        self._LOGGER.info(f"Setup: Sentences config file not read")
-                else:
-                    self._LOGGER.info(f"Setup: Sentences file exists")
-
-        # Grocy setup
-        self._LOGGER.info(f"Config - Host: {self.config['Grocy Setup']['host']}")
-        self._LOGGER.info(f"Config - Port: {self.config['Grocy Setup']['port']}")
-        self._LOGGER.info(f"Config - Verify SSL: {self.config['Grocy Setup']['verifyssl']}")
-        self._LOGGER.info(f"Config - API Key: {self.config['Grocy Setup']['apikey']}")
-        grocy = Grocy(self.config['Grocy Setup']['host'], self.config['Grocy Setup']['apikey'], port = self.config['Grocy Setup']['port'], verify_ssl = self.config['Grocy Setup']['verifyssl'])
+        """Deploy sentences and slots to Rhasspy, then keep the slots refreshed."""
+        slotValues = None
+        try:
+            # Give Grocy a moment so the slots can be deployed together with the sentences
+            await asyncio.wait_for(self.grocy_connected.wait(), float(self.config['Grocy Setup'].get('startup_wait', 10)))
+            slotValues = await self.slot_generator.generate()
+        except asyncio.TimeoutError:
+            self._LOGGER.error("Setup: Grocy not connected, deploying sentences without slot values")
+        except (aiohttp.ClientError, GrocyError) as error:
+            self._LOGGER.error(f"Setup: Unable to read slot values from Grocy: {error}")
+
+        try:
+            await self.deployer.deploy(slotValues)
+        except (aiohttp.ClientError, IOError) as error:
+            self._LOGGER.error(f"Setup: Sentence deployment failed: {error}")
+
+        if self.slot_watcher != None:
+            self.tasks.append(asyncio.create_task(self.slot_watcher.run()))
+
+        # Build the product name index now rather than on the first free-text request
         try:
-            sysinfo = grocy.get_system_info()
-            self._LOGGER.info(f"Connected to host: {self.config['Grocy Setup']['host']}:{self.config['Grocy Setup']['port']} grocy version: {sysinfo.grocy_version}")
-            self.grocy = grocy
-        except:
-            self._LOGGER.error(f"Error connecting to host: {self.config['Grocy Setup']['host']}")
-
-        # Register intent handlers
-        self.app.on_intent(IntentNames.GROCYGETLOCATIONS)(self.get_locations)
-        self.app.on_intent(IntentNames.GROCYPURCHASEPRODUCT)(self.purchase_product)
-        self.app.on_intent(IntentNames.GROCYCREATEPRODUCT)(self.create_product)
-        self.app.on_intent(IntentNames.GROCYGETCHORES)(self.get_chores)
-        self.app.on_intent(IntentNames.GROCYTRACKCHORE)(self.track_chore)
-        self.app.on_intent(IntentNames.GROCYGETSHOPPINGLISTS)(self.get_shoppinglist)
-        self.app.on_intent(IntentNames.GROCYCREATESHOPPINGLIST)(self.create_shopping_list)
-        self.app.on_intent(IntentNames.GROCYADDPRODUCTTOSHOPPINGLIST)(self.add_product_to_shopping_list)
-        self.app.on_intent(IntentNames.GROCYREMOVEPRODUCTFROMSHOPPINGLIST)(self.remove_product_from_shopping_list)
-        self.app.on_intent(IntentNames.GROCYGETBATTERIES)(self.get_batteries)
-        self.app.on_intent(IntentNames.GROCYGETBATTERYNEXTCHARGETIME)(self.get_batterynextchangetime)
-        self.app.on_intent(IntentNames.GROCYTRACKBATTERYCHARGE)(self.track_batterycharge)
-        self.app.on_intent(IntentNames.GROCYGETPRODUCTSTOCK)(self.get_productstock)
-        self.app.on_intent(IntentNames.GROCYTRACKPRODUCTCONSUME)(self.track_productconsume)
-        self.app.on_intent(IntentNames.GROCYTRANSFERPRODUCT)(self.transfer_product)
-        self.app.on_intent(IntentNames.GROCYGETLOCATIONSTOCK)(self.get_locationstock)
-
-    def read_configuration_file(self):
+            await self.grocy_connected.wait()
+            await self.cache.build_name_index(EntityType.PRODUCTS)
+        except (aiohttp.ClientError, GrocyError, asyncio.TimeoutError) as error:
+            self._LOGGER.warning(f"Setup: Unable to index product names: {error}")
+
+    def write_failed(self, mutation: dict, message: str):
+        """Tell the site a queued mutation came from that Grocy did not accept it."""
+        sentence = self.responses.sentence(f"WriteBehindFailed-{mutation['kind']}", error=message, lang=mutation.get('lang'), **mutation['labels'])
+        self._LOGGER.info(f"Write behind: Announcing failure to {mutation['site_id']}: {sentence}")
+        self.app.notify(sentence, mutation['site_id'])
+
+    def notify(self, sentence: str, site_id: str):
+        """Speak a handler's answer, or hand it to the compound intent the handler is running in."""
+        replies = COMPOUND_REPLIES.get()
+        if replies != None:
+            replies.append(sentence)
+        else:
+            self.speak_offline_notice()
+            self.app.notify(sentence, site_id)
+
+    def announce_due(self, event: dict):
+        """Announce an item that came due on every configured site."""
+        sentence = self.responses.sentence(f"DueNotification-{event['kind']}", **event)
+        self._LOGGER.info(f"Notifications: {sentence}")
+        for siteId in self.notification_sites:
+            self.app.notify(sentence, siteId)
+
+    def slots_changed(self, slotNames: list):
+        """Drop cached master data behind slots the watcher found changed."""
+        if self.slot_generator.cache != None:
+            # The slots were built from the cache, it already has the change
+            return
+        for slotName in slotNames:
+            entityType = SLOT_SOURCES[slotName][0].split("/")[-1]
+            self._LOGGER.info(f"Slots: {slotName} changed, invalidating cached {entityType}")
+            self.cache.invalidate(entityType)
+
+    @staticmethod
+    def read_configuration_file():
         try:
             cp = configparser.ConfigParser()
             with io.open(os.path.dirname(__file__) + "/config/config.ini", encoding="utf-8") as f:
@@ -157,222 +598,220 @@ class RhasspySkill:
         except (IOError, configparser.Error):
             return dict()
 
-    def response_sentence(self, intent: NluIntent, contextName:str = None, data_string: str = None) -> str:
+    def response_sentence(self, intent: NluIntent, *args, contextName: str = None, **kwargs) -> str:
         self._LOGGER.debug(f"Intent: {intent.id} | Started response_sentence")
 
-        # open the responses file in read mode
-        responses = configparser.ConfigParser(allow_no_value=True)
-        responses.read("config/responses.ini")
-        
         if contextName == None:
             intentName = intent.intent.intent_name
         else:
             intentName = f"{intent.intent.intent_name}-{contextName}"
-        
-        intentResponses = responses.items(intentName)
-        if intentResponses[-1] == None:
-            intentResponses = intentResponses[0:-1]
-        
-        if data_string == None:
-            sentence = str(random.choice(intentResponses)[0])
-        else:            
-            sentence = str(random.choice(intentResponses)[0]).format(data_string)
-
-        self._LOGGER.debug(f"Intent: {intent.id} | response_sentence sentence: {sentence}")
-        self._LOGGER.debug(f"Intent: {intent.id} | Completed response_sentence")
-        return sentence
-
-    def fail_sentence(self, intent: NluIntent, errName: str):
-        self._LOGGER.debug(f"Intent: {intent.id} | Started response_sentence")
 
-        # open the responses file in read mode
-        responses = configparser.ConfigParser(allow_no_value=True)
-        responses.read("config/responses.ini")
-        
-        intentErrName = f"{intent.intent.intent_name}-Fail-{errName}"
-
-        intentErrResponses = responses.items(intentErrName)
-        if intentErrResponses[-1] == None:
-            intentErrResponses = intentErrResponses[0:-1]
-                    
-        sentence = str(random.choice(intentErrResponses)[0])
+        sentence = self.responses.sentence(intentName, *args, lang=intent.lang, **kwargs)
 
         self._LOGGER.debug(f"Intent: {intent.id} | response_sentence sentence: {sentence}")
         self._LOGGER.debug(f"Intent: {intent.id} | Completed response_sentence")
         return sentence
 
-    def grocy_purchase_product(
-        self, 
-        grocyapiclient: GrocyApiClient,
-        product_id: int,
-        amount: float,
-        price: float,
-        best_before_date: None,
-        transaction_type: TransactionType = TransactionType.PURCHASE,
-        location: int = None
-    ):
-        data = {
-            "amount": amount,
-            "transaction_type": transaction_type.value,
-            "price": price,
-            "location_id": location,
-        }
+    def fail_sentence(self, intent: NluIntent, errName: str, *args, **kwargs) -> str:
+        self._LOGGER.debug(f"Intent: {intent.id} | Started fail_sentence")
 
-        if location is not None:
-            data["location_id"] = location
-
-        if best_before_date is not None:
-            data["best_before_date"] = best_before_date.strftime("%Y-%m-%d")
-
-        return grocyapiclient._do_post_request(f"stock/products/{product_id}/add", data)
-
-    def grocy_transfer_product(
-        self, 
-        grocyapiclient: GrocyApiClient,
-        product_id: int,
-        fromlocation_id: int,
-        tolocation_id: int,
-        amount: float
-    ):
-        data = {
-            "amount": amount,
-            "location_id_from": fromlocation_id,
-            "location_id_to": tolocation_id
-        }
+        sentence = self.responses.sentence(f"{intent.intent.intent_name}-Fail-{errName}", *args, lang=intent.lang, **kwargs)
 
-        return grocyapiclient._do_post_request(f"stock/products/{product_id}/transfer", data)
+        self._LOGGER.debug(f"Intent: {intent.id} | fail_sentence sentence: {sentence}")
+        self._LOGGER.debug(f"Intent: {intent.id} | Completed fail_sentence")
+        return sentence
 
-    def grocy_get_stock_by_location(
-        self, 
-        grocyapiclient: GrocyApiClient,
-        location_id: int = None
-    ):
-        return grocyapiclient._do_get_request(f"stock/locations/{location_id}/entries")
+    @staticmethod
+    def session_data(customData: str, intentName: IntentNames) -> Optional[SessionCustomData]:
+        """The custom data of a session the skill continued for intentName, or None for any other session."""
+        if not customData:
+            return None
+        try:
+            data = SessionCustomData.parse_raw(customData)
+        except ValueError:
+            return None
+        return data if data.intent_name == intentName.value else None
+
+    async def location_stock_lines(self, stockEntries: list) -> list:
+        """Join stock entries to product names, one "<amount> <name>" line per product."""
+        products = await self.cache.by_id(EntityType.PRODUCTS)
+        if any(int(entry['product_id']) not in products for entry in stockEntries):
+            # A product was created since the cache was loaded
+            self.cache.invalidate(EntityType.PRODUCTS)
+            products = await self.cache.by_id(EntityType.PRODUCTS)
+
+        # Entries of the same product across several stock rows are summed into one line
+        amounts = {}
+        for entry in stockEntries:
+            productId = int(entry['product_id'])
+            amounts[productId] = amounts.get(productId, 0) + float(entry['amount'])
+
+        return [f"{amount:g} {products[productId]['name'] if productId in products else 'unknown product'}" for productId, amount in amounts.items()]
+
+    #Listings: long answers are spoken a page at a time
+    @staticmethod
+    def join_items(items: List[str], last: bool = True) -> str:
+        """Join listing items for speech, with "and" before the final item if the listing ends here."""
+        if len(items) < 2 or not last:
+            return ", ".join(items)
+        return f"{', '.join(items[:-1])}, and {items[-1]}"
+
+    def listing(self, intent: NluIntent, lead: str, items: List[str]):
+        """Answer with a listing, the first page at once so speech starts however long the list is.
+
+        In "more" mode the items stay with the skill and the session only carries their key
+        and the next offset until the user says more, in "stream" mode each further page
+        follows as its own notification.
+        """
+        pageSize = self.listing_page_size
+        first = f"{lead} {self.join_items(items[:pageSize], len(items) <= pageSize)}"
+        self._LOGGER.info(f"Intent: {intent.id} | Listing {len(items)} items, {pageSize} per page")
+        if len(items) <= pageSize or self.listing_mode == "stream" or COMPOUND_REPLIES.get() != None:
+            self.notify(first, intent.site_id)
+            for start in range(pageSize, len(items), pageSize):
+                self.notify(self.join_items(items[start:start + pageSize], start + pageSize >= len(items)), intent.site_id)
+            return EndSession()
+
+        listingId = uuid.uuid4().hex
+        self.listings[listingId] = items
+        while len(self.listings) > MAX_LISTINGS:
+            self.listings.popitem(last=False)
+        data = SessionCustomData(intent_name=IntentNames.GROCYLISTMORE.value, input_text=intent.input, listing_id=listingId, listing_offset=pageSize)
+        return self.continue_listing(data, first, len(items) - pageSize, intent.lang)
+
+    def continue_listing(self, data: SessionCustomData, sentence: str, remaining: int, lang: str = None) -> ContinueSession:
+        prompt = self.responses.sentence(f"{IntentNames.GROCYLISTMORE.value}-Prompt", count=remaining, lang=lang)
+        return ContinueSession(
+            text=f"{sentence}, {prompt}",
+            custom_data=data.json(),
+            intent_filter=[IntentNames.GROCYLISTMORE.value]
+        )
+
+    async def list_more(self, intent: NluIntent, parsed: ParsedIntent):
+        """Speak the next page of a listing."""
+        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYLISTMORE}")
+
+        data = self.session_data(intent.custom_data, IntentNames.GROCYLISTMORE)
+        items = self.listings.get(data.listing_id) if data != None else None
+        if items == None:
+            return EndSession(self.response_sentence(intent, contextName="NoSession"))
+
+        page = items[data.listing_offset:data.listing_offset + self.listing_page_size]
+        data.listing_offset += self.listing_page_size
+        remaining = max(len(items) - data.listing_offset, 0)
+        self._LOGGER.info(f"Intent: {intent.id} | Listing {len(page)} items, {remaining} left")
+        if remaining > 0:
+            return self.continue_listing(data, self.join_items(page, False), remaining, intent.lang)
+
+        self.listings.pop(data.listing_id, None)
+        sentence = self.join_items(page)
+        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYLISTMORE}")
+        return EndSession(sentence)
 
     #Utility Intents   
-    async def get_locations(self, intent: NluIntent):
+    async def get_locations(self, intent: NluIntent, parsed: ParsedIntent):
         """List the locations."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETLOCATIONS}")
 
-        sentence = None
         locations = None
         isfreezers = 0
 
         #Check if the "freezer" slot was sent
-        if any(slot for slot in intent.slots if slot.slot_name == 'freezer'):
+        if 'freezer' in parsed:
             self._LOGGER.info(f"Intent: {intent.id} | Is Freezer: {str(isfreezers)}")
             #Get locations, filter for freezers
-            locations = self.grocy.get_generic_objects_for_type(EntityType.LOCATIONS, "is_freezer=1")
+            locations = [location for location in await self.cache.all(EntityType.LOCATIONS) if str(location.get("is_freezer")) == "1"]
         else:
             self._LOGGER.info(f"Intent: {intent.id} | Is Freezer: <none>")
             #Get locations, no filter
-            locations = self.grocy.get_generic_objects_for_type(EntityType.LOCATIONS)
+            locations = await self.cache.all(EntityType.LOCATIONS)
         self._LOGGER.info(f"Intent: {intent.id} | Location count: {len(locations)}")
             
-        #Build response sentence
-        sentence = self.response_sentence(intent) + " "
-        for location in locations[:len(locations)-1]:
-            sentence = sentence + location["name"] + ", "
-        sentence = sentence + "and " + locations[-1]["name"]
-        self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
-
-        self.app.notify(sentence, intent.site_id)
+        #Respond with the location names, a page at a time
+        result = self.listing(intent, self.response_sentence(intent), [location["name"] for location in locations])
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYGETLOCATIONS}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETLOCATIONS}")
-        return EndSession()
+        return result
 
-    async def get_locationstock(self, intent: NluIntent):
+    async def get_locationstock(self, intent: NluIntent, parsed: ParsedIntent):
         """Get location stock."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETLOCATIONSTOCK}")
 
         sentence = None
         
-        locationslot = next((slot for slot in intent.slots if slot.slot_name == 'location'), None)
-        if locationslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | Location slot equals none")
-            sentence = "I need to know the name of the location"
+        locationslot = parsed.slot('location')
+        if OFFLINE.get():
+            locationProducts = await self.ledger.location_entries(locationslot.value['value'])
         else:
-            products = self.grocy.all_products()
-            self._LOGGER.info(f"Intent: {intent.id} | All Products count: {len(products)}")
-            
-            locationProducts = self.grocy_get_stock_by_location(self.grocy._api_client, locationslot.value['value'])
-            self._LOGGER.debug(f"Intent: {intent.id} | Products: {locationProducts}")
-            self._LOGGER.info(f"Intent: {intent.id} | Product count: {len(locationProducts)}")
-            
-            #Build response sentence
-            if len(locationProducts) == 0:
-                sentence = self.response_sentence(intent, "NoneResponse").format(locationslot.raw_value)
-            if len(locationProducts) == 1:
-                productName = next((product.name for product in products if product.id == locationProducts[0]['product_id']), None)
-                sentence = self.response_sentence(intent) + " " + str(locationProducts[0]['amount']) + " " + productName
-            if len(locationProducts) > 1:
-                sentence = self.response_sentence(intent) + " "
-                for locationProduct in locationProducts[0:-1]:
-                    productName = next((product.name for product in products if product.id == locationProduct['product_id']), None)
-                    sentence = sentence + " " + str(locationProduct['amount']) + " " + productName + ", "
-                productName = next((product.name for product in products if product.id == locationProducts[-1]['product_id']), None)
-                sentence = sentence + "and " + str(locationProducts[-1]["amount"]) + " " + productName
-            
-        self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
-        self.app.notify(sentence, intent.site_id)
+            locationProducts = await self.grocy.stock_by_location(locationslot.value['value'])
+        self._LOGGER.debug(f"Intent: {intent.id} | Products: {locationProducts}")
+        self._LOGGER.info(f"Intent: {intent.id} | Product count: {len(locationProducts)}")
+
+        stockLines = await self.location_stock_lines(locationProducts)
+        self._LOGGER.info(f"Intent: {intent.id} | Distinct product count: {len(stockLines)}")
+        
+        #Build response sentence
+        if len(stockLines) == 0:
+            sentence = self.response_sentence(intent, locationslot.raw_value, contextName="NoneResponse")
+            self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
+            self.notify(sentence, intent.site_id)
+            result = EndSession()
+        else:
+            result = self.listing(intent, self.response_sentence(intent), stockLines)
         
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYGETLOCATIONSTOCK}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETLOCATIONSTOCK}")
-        return EndSession()
+        return result
 
     #Product Intents
-    async def purchase_product(self, intent: NluIntent):
+    async def purchase_product(self, intent: NluIntent, parsed: ParsedIntent):
         """Purchase a product."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYPURCHASEPRODUCT}")
 
         sentence = None
 
-        #Check if the "product" slot was sent
-        if any(slot for slot in intent.slots if slot.slot_name == 'product'):
-            product = next((slot for slot in intent.slots if slot.slot_name == 'product'), None)
-            self._LOGGER.info(f"Intent: {intent.id} | Product: {str(product.value['value'])} ({str(product.raw_value)})")
+        #Product, quantity and location are required, run_intent asked for any that weren't sent
+        product = parsed.slot('product')
+        self._LOGGER.info(f"Intent: {intent.id} | Product: {str(product.value['value'])} ({str(product.raw_value)})")
+        quantity = parsed.slot('quantity')
+        self._LOGGER.info(f"Intent: {intent.id} | Quantity: {str(quantity.value['value'])} ({str(quantity.raw_value)})")
+        location = parsed.slot('location')
+        self._LOGGER.info(f"Intent: {intent.id} | Location: {str(location.value['value'])} ({str(location.raw_value)})")
 
         #Check if the "measure" slot was sent
-        if any(slot for slot in intent.slots if slot.slot_name == 'measure'):
-            measure = next((slot for slot in intent.slots if slot.slot_name == 'measure'), None)
-            self._LOGGER.info(f"Intent: {intent.id} | Measure: {str(measure.value['value'])} ({str(measure.raw_value)})")
-
-        #Check if the "location" slot was sent
-        if any(slot for slot in intent.slots if slot.slot_name == 'location'):
-            location = next((slot for slot in intent.slots if slot.slot_name == 'location'), None)
-            self._LOGGER.info(f"Intent: {intent.id} | Location: {str(location.value['value'])} ({str(location.raw_value)})")
-
-        #Check if the "quantity" slot was sent
-        if any(slot for slot in intent.slots if slot.slot_name == 'quantity'):
-            quantity = next((slot for slot in intent.slots if slot.slot_name == 'quantity'), None)
-            self._LOGGER.info(f"Intent: {intent.id} | Quantity: {str(quantity.value['value'])} ({str(quantity.raw_value)})")
+        if 'measure' in parsed:
+            self._LOGGER.info(f"Intent: {intent.id} | Measure: {str(parsed.value('measure'))} ({str(parsed.raw('measure'))})")
         
         #"Purchase" the product into Grocy inventory
-        #Temporarily commented out until the pygrocy library is updated to accept the location_id
-        #addedproduct = grocy.add_product(product_id=product.value['value'], amount=quantity.value['value'], price=0.0, best_before_date=None, location=location.value['value'])
-        addedproduct = self.grocy_purchase_product(self.grocy._api_client, product_id=product.value['value'], amount=quantity.value['value'], price=0.0, best_before_date=None, location=location.value['value'])
-        self._LOGGER.info(f"Intent: {intent.id} | Added Product: {str(addedproduct)}")
+        try:
+            if self.write_queue != None:
+                addedproduct = await self.write_queue.purchase_product(product.value['value'], quantity.value['value'], location_id=location.value['value'], site_id=intent.site_id, lang=intent.lang, labels={"amount": quantity.value['value'], "product": product.raw_value})
+            else:
+                addedproduct = await self.grocy.purchase_product(product_id=product.value['value'], amount=quantity.value['value'], price=0.0, location_id=location.value['value'])
+            self._LOGGER.info(f"Intent: {intent.id} | Added Product: {str(addedproduct)}")
 
-        #Build response sentence
-        sentence = self.response_sentence(intent).format(str(quantity.value['value']), str(product.raw_value), str(location.raw_value))
+            #Build response sentence
+            sentence = self.response_sentence(intent, str(quantity.value['value']), str(product.raw_value), str(location.raw_value))
+        except GrocyError as error:
+            sentence = self.fail_sentence(intent, "GrocyError", error.message)
         self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
 
-        self.app.notify(sentence, intent.site_id)
+        self.notify(sentence, intent.site_id)
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYPURCHASEPRODUCT}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYPURCHASEPRODUCT}")
         return EndSession()
 
-    async def create_product(self, intent: NluIntent):
+    async def create_product(self, intent: NluIntent, parsed: ParsedIntent):
         """Create a product."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYCREATEPRODUCT}")
 
         sentence = None
 
         #Check if the "product" slot was sent
-        if any(slot for slot in intent.slots if slot.slot_name == 'product'):
-            product = next((slot for slot in intent.slots if slot.slot_name == 'product'), None)
+        if 'product' in parsed:
+            product = parsed.slot('product')
             self._LOGGER.info(f"Intent: {intent.id} | Product: {str(product.value['value'])} ({str(product.raw_value)})")
-            extractedProductName = intent.raw_input.replace("Create a new product called ", "")
+            extractedProductName = self.extract_name(intent, "Create a new product called", trail=r"in the .+")
         else:
             data = {
                 "intent_name": "GrocyCreateProduct",
@@ -385,18 +824,22 @@ class RhasspySkill:
             )
 
         #Check if the "measure" slot was sent
-        measure = self.config['Grocy Setup']['default_qu']
-        if any(slot for slot in intent.slots if slot.slot_name == 'measure'):
-            measureslot = next((slot for slot in intent.slots if slot.slot_name == 'measure'), None)
-            self._LOGGER.info(f"Intent: {intent.id} | Measure: {str(measureslot.value['value'])} ({str(measureslot.raw_value)})")
-            measure = measureslot.value['value']
+        measure = parsed.value('measure', self.tenant().config['Grocy Setup']['default_qu'])
+        if 'measure' in parsed:
+            self._LOGGER.info(f"Intent: {intent.id} | Measure: {str(measure)} ({str(parsed.raw('measure'))})")
 
         #Check if the "location" slot was sent
-        location = self.config['Grocy Setup']['default_location_id']
-        if any(slot for slot in intent.slots if slot.slot_name == 'location'):
-            locationslot = next((slot for slot in intent.slots if slot.slot_name == 'location'), None)
-            self._LOGGER.info(f"Intent: {intent.id} | Location: {str(locationslot.value['value'])} ({str(locationslot.raw_value)})")
-            location = locationslot.value['value']
+        location = parsed.value('location', self.tenant().config['Grocy Setup']['default_location_id'])
+        if 'location' in parsed:
+            self._LOGGER.info(f"Intent: {intent.id} | Location: {str(location)} ({str(parsed.raw('location'))})")
+
+        if len(extractedProductName) == 0:
+            extractedProductName = str(product.raw_value)
+        if await self.cache.has_name(EntityType.PRODUCTS, extractedProductName):
+            sentence = self.response_sentence(intent, extractedProductName, contextName="Exists")
+            self._LOGGER.info(f"Intent: {intent.id} | Product creation failed: Product exists")
+            self.notify(sentence, intent.site_id)
+            return EndSession()
 
         #Create a new product in Grocy
         productdata = {
@@ -408,130 +851,242 @@ class RhasspySkill:
             "qu_id_stock": measure,
             "qu_factor_purchase_to_stock": measure
         }
-        newproduct = self.grocy.add_generic(EntityType.PRODUCTS, productdata)
-        self.grocy.product
+        newproduct = await self.grocy.add_generic(EntityType.PRODUCTS, productdata)
+        self.cache.invalidate(EntityType.PRODUCTS)
         self._LOGGER.info(f"Intent: {intent.id} | Added Product: {str(newproduct)}")
 
         #Build response sentence
-        sentence = self.response_sentence(intent).format(extractedProductName)
+        sentence = self.response_sentence(intent, extractedProductName)
         self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
 
-        self.app.notify(sentence, intent.site_id)
+        self.notify(sentence, intent.site_id)
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYCREATEPRODUCT}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYCREATEPRODUCT}")
         return EndSession()
 
-    async def get_productstock(self, intent: NluIntent):
+    #Purchase session: many purchases in one dialogue, posted together at the end
+    def purchase_session(self, customData: str) -> Optional[SessionCustomData]:
+        """The purchase session carried in a session's custom data, or None outside of one."""
+        return self.session_data(customData, IntentNames.GROCYSTARTPURCHASESESSION)
+
+    def continue_purchase_session(self, data: SessionCustomData, text: str) -> ContinueSession:
+        return ContinueSession(
+            text=text,
+            custom_data=data.json(),
+            intent_filter=[IntentNames.GROCYPURCHASESESSIONITEM.value, IntentNames.GROCYPURCHASESESSIONDONE.value],
+            send_intent_not_recognized=True
+        )
+
+    async def start_purchase_session(self, intent: NluIntent, parsed: ParsedIntent):
+        """Start collecting purchases."""
+        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYSTARTPURCHASESESSION}")
+
+        data = SessionCustomData(intent_name=IntentNames.GROCYSTARTPURCHASESESSION.value, input_text=intent.input)
+        sentence = self.response_sentence(intent)
+
+        self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
+        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYSTARTPURCHASESESSION}")
+        return self.continue_purchase_session(data, sentence)
+
+    async def purchase_session_item(self, intent: NluIntent, parsed: ParsedIntent):
+        """Add one product to the purchase session, nothing is sent to Grocy yet."""
+        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYPURCHASESESSIONITEM}")
+
+        data = self.purchase_session(intent.custom_data)
+        if data == None:
+            return EndSession(self.response_sentence(intent, contextName="NoSession"))
+
+        productslot = parsed.slot('product')
+        if productslot == None:
+            return self.continue_purchase_session(data, self.responses.sentence("MissingSlot-product", lang=intent.lang))
+
+        item = PurchaseSessionItem(
+            product_id=productslot.value['value'],
+            product_name=productslot.raw_value,
+            quantity=parsed.value('quantity', 1),
+            location_id=parsed.value('location')
+        )
+        data.items.append(item)
+        self._LOGGER.info(f"Intent: {intent.id} | Item {len(data.items)}: {item.quantity:g} {item.product_name}")
+
+        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYPURCHASESESSIONITEM}")
+        return self.continue_purchase_session(data, self.response_sentence(intent, quantity=f"{item.quantity:g}", product=item.product_name))
+
+    async def purchase_session_item_post(self, item: PurchaseSessionItem, intent: NluIntent):
+        if self.write_queue != None:
+            return await self.write_queue.purchase_product(item.product_id, item.quantity, location_id=item.location_id, site_id=intent.site_id, lang=intent.lang, labels={"amount": f"{item.quantity:g}", "product": item.product_name})
+        return await self.grocy.purchase_product(product_id=item.product_id, amount=item.quantity, price=0.0, location_id=item.location_id)
+
+    async def purchase_session_done(self, intent: NluIntent, parsed: ParsedIntent):
+        """Post every collected purchase to Grocy concurrently and read back a summary."""
+        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYPURCHASESESSIONDONE}")
+
+        data = self.purchase_session(intent.custom_data)
+        if data == None:
+            return EndSession(self.response_sentence(intent, contextName="NoSession"))
+
+        if parsed.value('action') == "cancel":
+            self._LOGGER.info(f"Intent: {intent.id} | Purchase session cancelled, dropping {len(data.items)} items")
+            return EndSession(self.response_sentence(intent, contextName="Cancelled"))
+        if len(data.items) == 0:
+            return EndSession(self.response_sentence(intent, contextName="NoneResponse"))
+
+        # One purchase per product and location, however often it was mentioned
+        merged = {}
+        for item in data.items:
+            key = (item.product_id, item.location_id)
+            if key in merged:
+                merged[key].quantity += item.quantity
+            else:
+                merged[key] = item.copy()
+        items = list(merged.values())
+
+        results = await asyncio.gather(*[self.purchase_session_item_post(item, intent) for item in items], return_exceptions=True)
+
+        added, failed, unreachable = [], [], []
+        for item, result in zip(items, results):
+            if isinstance(result, (aiohttp.ClientError, asyncio.TimeoutError, GrocyUnhealthy)):
+                unreachable.append(item)
+            elif isinstance(result, GrocyError):
+                self._LOGGER.warning(f"Intent: {intent.id} | Purchase of {item.product_name} failed: {result.message}")
+                failed.append(item)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                added.append(item)
+        self._LOGGER.info(f"Intent: {intent.id} | Purchased {len(added)} of {len(items)} products, {len(failed)} failed, {len(unreachable)} unreachable")
+
+        describe = lambda items: ", ".join(f"{item.quantity:g} {item.product_name}" for item in items)
+        sentences = []
+        if len(added) > 0:
+            sentences.append(self.response_sentence(intent, count=len(added), items=describe(added)))
+        if len(failed) > 0:
+            sentences.append(self.fail_sentence(intent, "GrocyError", items=describe(failed)))
+        if len(unreachable) > 0:
+            # Keep what didn't reach Grocy so saying done again retries it
+            self.grocy_unavailable()
+            data.items = unreachable
+            sentences.append(self.fail_sentence(intent, "Unreachable", items=describe(unreachable)))
+            sentence = ". ".join(sentences)
+            self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
+            return self.continue_purchase_session(data, sentence)
+
+        sentence = ". ".join(sentences)
+        self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
+        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYPURCHASESESSIONDONE}")
+        return EndSession(sentence)
+
+    async def purchase_session_not_recognized(self, notRecognized: DialogueIntentNotRecognized):
+        """Keep a purchase session open with its items when one answer wasn't understood."""
+        data = self.purchase_session(notRecognized.custom_data)
+        if data == None:
+            # Not ours, leave the session to whoever started it
+            return None
+        self._LOGGER.info(f"Session: {notRecognized.session_id} | Not recognized: {notRecognized.input}, keeping {len(data.items)} purchase session items")
+        return self.continue_purchase_session(data, self.responses.sentence(f"{IntentNames.GROCYPURCHASESESSIONITEM.value}-NotRecognized"))
+
+    async def get_productstock(self, intent: NluIntent, parsed: ParsedIntent):
         """Get product stock."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETPRODUCTSTOCK}")
 
         sentence = None
         
-        productslot = next((slot for slot in intent.slots if slot.slot_name == 'product'), None)
-        if productslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | Product slot equals none")
-            sentence = "I need to know the name of the product"
+        if OFFLINE.get():
+            product = await self.offline_product(parsed.value('product'))
         else:
-            product = self.grocy.product(productslot.value['value'])
-            self._LOGGER.debug(f"Intent: {intent.id} | Battery: {product}")
-            self._LOGGER.info(f"Intent: {intent.id} | Battery name: {product.name}")
-                   
-            sentence = self.response_sentence(intent).format(product.available_amount, product.default_quantity_unit_purchase.name, product.name)
+            product = await self.grocy.product(parsed.value('product'))
+        self._LOGGER.debug(f"Intent: {intent.id} | Product: {product}")
+        self._LOGGER.info(f"Intent: {intent.id} | Product name: {product['product']['name']}")
+               
+        sentence = self.response_sentence(intent, product['stock_amount'], product['default_quantity_unit_purchase']['name'], product['product']['name'])
             
         self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
-        self.app.notify(sentence, intent.site_id)
+        self.notify(sentence, intent.site_id)
         
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYGETPRODUCTSTOCK}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETPRODUCTSTOCK}")
         return EndSession()
 
-    async def track_productconsume(self, intent: NluIntent):
+    async def offline_product(self, productId: int) -> dict:
+        """The parts of Grocy's product details get_productstock reads, built from the cache and the stock ledger."""
+        product = await self.cache.get(EntityType.PRODUCTS, productId)
+        if product == None:
+            raise GrocyError(400, f"Product {productId} is not in the snapshot")
+        return {
+            "product": product,
+            "stock_amount": await self.ledger.available(productId),
+            "default_quantity_unit_purchase": await self.cache.get(EntityType.QUANTITY_UNITS, product['qu_id_purchase']) or {"name": "unit"},
+        }
+
+    async def track_productconsume(self, intent: NluIntent, parsed: ParsedIntent):
         """Track product consumption."""
-        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETPRODUCTINVENTORY}")
+        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYTRACKPRODUCTCONSUME}")
 
         sentence = None
         
-        productslot = next((slot for slot in intent.slots if slot.slot_name == 'product'), None)
-        if productslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | Product slot equals none")
-            sentence = "I need to know the name of the product"
+        productslot = parsed.slot('product')
+        if 'quantity' in parsed:
+            quantity = int(parsed.value('quantity'))
+            self._LOGGER.info(f"Intent: {intent.id} | Quantity: {quantity}")
         else:
-            quantityslot = next((slot for slot in intent.slots if slot.slot_name == 'quantity'), None)
-            if quantityslot != None:
-                quantity = int(quantityslot.value['value'])
-                self._LOGGER.info(f"Intent: {intent.id} | Quantity: {quantity}")
-            else:
-                quantity = 1
-                self._LOGGER.info(f"Intent: {intent.id} | Quantity slot equals none, default to 1")
+            quantity = 1
+            self._LOGGER.info(f"Intent: {intent.id} | Quantity slot equals none, default to 1")
 
-            try:
-                trackProduct = self.grocy.consume_product(productslot.value['value'], quantity)
-                self._LOGGER.debug(f"Intent: {intent.id} | Product Comsumption: {trackProduct}")
-                self._LOGGER.info(f"Intent: {intent.id} | Product consumed")
-                sentence = self.response_sentence(intent).format(quantity, productslot.raw_value)
-            except errors.GrocyError as error:
-                if error.message == "Amount to be consumed cannot be > current stock amount (if supplied, at the desired location)":
-                    sentence = self.fail_sentence(intent, "GrocyError-NotEnough").format(productslot.raw_value)
-                else:
-                    sentence = self.fail_sentence(intent, "GrocyError").format(error.message)                
+        try:
+            if self.write_queue != None:
+                trackProduct = await self.write_queue.consume_product(productslot.value['value'], quantity, site_id=intent.site_id, lang=intent.lang, labels={"amount": quantity, "product": productslot.raw_value})
+            else:
+                trackProduct = await self.grocy.consume_product(productslot.value['value'], quantity)
+            self._LOGGER.debug(f"Intent: {intent.id} | Product Comsumption: {trackProduct}")
+            self._LOGGER.info(f"Intent: {intent.id} | Product consumed")
+            sentence = self.response_sentence(intent, quantity, productslot.raw_value)
+        except NotEnoughStock:
+            sentence = self.fail_sentence(intent, "GrocyError-NotEnough", productslot.raw_value)
+        except GrocyError as error:
+            sentence = self.fail_sentence(intent, "GrocyError", error.message)
 
         self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
-        self.app.notify(sentence, intent.site_id)
+        self.notify(sentence, intent.site_id)
 
-        self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYGETPRODUCTINVENTORY}")
-        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETPRODUCTINVENTORY}")
+        self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYTRACKPRODUCTCONSUME}")
+        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYTRACKPRODUCTCONSUME}")
         return EndSession()
 
-    async def transfer_product(self, intent: NluIntent):
+    async def transfer_product(self, intent: NluIntent, parsed: ParsedIntent):
         """Transfer product between locations."""
-        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETPRODUCTINVENTORY}")
+        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYTRANSFERPRODUCT}")
 
         sentence = None
         
-        productslot = next((slot for slot in intent.slots if slot.slot_name == 'product'), None)
-        if productslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | Product slot equals none")
-            sentence = "I need to know the name of the product"
-
-        fromlocslot = next((slot for slot in intent.slots if slot.slot_name == 'fromloc'), None)
-        if fromlocslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | From location slot equals none")
-            sentence = "I need to know the name of the source location"
-
-        tolocslot = next((slot for slot in intent.slots if slot.slot_name == 'toloc'), None)
-        if tolocslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | To location slot equals none")
-            sentence = "I need to know the name of the destination location"
-        
-        if productslot != None and fromlocslot != None and tolocslot != None:
-            quantityslot = next((slot for slot in intent.slots if slot.slot_name == 'quantity'), None)
-            if quantityslot != None:
-                quantity = int(quantityslot.value['value'])
-                self._LOGGER.info(f"Intent: {intent.id} | Quantity: {quantity}")
-            else:
-                quantity = 1
-                self._LOGGER.info(f"Intent: {intent.id} | Quantity slot equals none, default to 1")
+        productslot = parsed.slot('product')
+        fromlocslot = parsed.slot('fromloc')
+        tolocslot = parsed.slot('toloc')
+        if 'quantity' in parsed:
+            quantity = int(parsed.value('quantity'))
+            self._LOGGER.info(f"Intent: {intent.id} | Quantity: {quantity}")
+        else:
+            quantity = 1
+            self._LOGGER.info(f"Intent: {intent.id} | Quantity slot equals none, default to 1")
 
-            try:
-                transferProduct = self.grocy_transfer_product(self.grocy._api_client, product_id=productslot.value['value'], fromlocation_id=fromlocslot.value['value'], tolocation_id=tolocslot.value['value'], amount=quantity)
-                self._LOGGER.debug(f"Intent: {intent.id} | Product Transfer: {transferProduct}")
-                self._LOGGER.info(f"Intent: {intent.id} | Product transfered")
-                sentence = self.response_sentence(intent).format(productslot.raw_value, fromlocslot.raw_value, tolocslot.raw_value)
-            except errors.GrocyError as error:
-                if error.message == "Amount to be transferred cannot be > current stock amount at the source location":
-                    sentence = self.fail_sentence(intent, "GrocyError-NotEnough").format(productslot.raw_value)
-                else:
-                    sentence = self.fail_sentence(intent, "GrocyError").format(error.message)                
+        try:
+            transferProduct = await self.grocy.transfer_product(product_id=productslot.value['value'], fromlocation_id=fromlocslot.value['value'], tolocation_id=tolocslot.value['value'], amount=quantity)
+            self._LOGGER.debug(f"Intent: {intent.id} | Product Transfer: {transferProduct}")
+            self._LOGGER.info(f"Intent: {intent.id} | Product transfered")
+            sentence = self.response_sentence(intent, productslot.raw_value, fromlocslot.raw_value, tolocslot.raw_value)
+        except NotEnoughStock:
+            sentence = self.fail_sentence(intent, "GrocyError-NotEnough", productslot.raw_value)
+        except GrocyError as error:
+            sentence = self.fail_sentence(intent, "GrocyError", error.message)
 
         self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
-        self.app.notify(sentence, intent.site_id)
+        self.notify(sentence, intent.site_id)
 
-        self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYGETPRODUCTINVENTORY}")
-        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETPRODUCTINVENTORY}")
+        self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYTRANSFERPRODUCT}")
+        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYTRANSFERPRODUCT}")
         return EndSession()
 
     #Chore Intents
-    async def get_chores(self, intent: NluIntent):
+    async def get_chores(self, intent: NluIntent, parsed: ParsedIntent):
         """List the chores."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETCHORES}")
         
@@ -539,64 +1094,63 @@ class RhasspySkill:
         chores = None
 
         #Check if the "person" slot was sent
-        person_slot_active = any(slot for slot in intent.slots if slot.slot_name == 'person')
+        person = parsed.slot('person')
+        person_slot_active = person != None
         if person_slot_active:
-            person = next((slot for slot in intent.slots if slot.slot_name == 'person'), None)
             self._LOGGER.info(f"Intent: {intent.id} | Person: {str(person.value['value'])} ({str(person.raw_value)})")
-            chores = self.grocy.chores(get_details=True, query_filters=f"next_execution_assigned_to_user_id={str(person.value['value'])}")
+            if OFFLINE.get():
+                chores = await self.offline_chores(person.value['value'])
+            else:
+                chores = await self.grocy.chores(query_filters=f"next_execution_assigned_to_user_id={str(person.value['value'])}")
         else:
             self._LOGGER.info(f"Intent: {intent.id} | Person: <none>")
-            chores = self.grocy.chores(get_details=True)
+            if OFFLINE.get():
+                chores = await self.offline_chores()
+            else:
+                chores = await self.grocy.chores()
         self._LOGGER.info(f"Intent: {intent.id} | Chore count: {len(chores)}")
 
         #Build response sentence
-        if person_slot_active:
-            if len(chores) > 1:
-                sentence = f"{person.raw_value} active chores are "
-                for chore in chores[:len(chores)-1]:
-                    sentence = sentence + chore.name + ", "
-                sentence = sentence + "and " + chores[-1].name
-            else:        
-                sentence = f"{person.raw_value} active chore is {chores[0].name}"
-        else:
-            if len(chores) > 1:
-                sentence = "The active chores are "
-                for chore in chores[:len(chores)-1]:
-                    sentence = sentence + chore.name + ", "
-                sentence = sentence + "and " + chores[-1].name
-            else:        
-                sentence = f"The active chore is {chores[0].name}"
+        owner = person.raw_value if person_slot_active else "The"
+        if len(chores) > 1:
+            result = self.listing(intent, f"{owner} active chores are", [chore['chore_name'] for chore in chores])
+        else:        
+            sentence = f"{owner} active chore is {chores[0]['chore_name']}"
+            self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
+            result = EndSession(sentence)
                     
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYGETCHORES}")
-        self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETCHORES}")
-        return EndSession(sentence)    
+        return result
+
+    async def offline_chores(self, userId: int = None) -> list:
+        """The chores get_chores lists, optionally those assigned to one user, from the summaries."""
+        await self.summaries.ready()
+        if userId == None:
+            return self.summaries.active_chores
+        return [chore for chore in self.summaries.active_chores if str(chore['next_execution_assigned_to_user_id']) == str(userId)]
 
-    async def track_chore(self, intent: NluIntent):
+    async def track_chore(self, intent: NluIntent, parsed: ParsedIntent):
         """Track a chore."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYTRACKCHORE}")
 
         sentence = None
 
         #Get the "action" slot
-        action = next((slot for slot in intent.slots if slot.slot_name == 'action'), None)
-        if action == None:
-            return EndSession("I need to know what action to do")    
+        action = parsed.slot('action')
         self._LOGGER.info(f"Intent: {intent.id} | Action: {str(action.value['value'])} ({str(action.raw_value)})")
 
         #Get the "chore" slot
-        chore = next((slot for slot in intent.slots if slot.slot_name == 'chore'), None)
-        if chore == None:
-            return EndSession("I need to know what chore to complete")    
+        chore = parsed.slot('chore')
         self._LOGGER.info(f"Intent: {intent.id} | Chore: {str(chore.value['value'])} ({str(chore.raw_value)})")
         
         if action.value['value'] == "Complete":
-            execute_chore = self.grocy.execute_chore(chore_id=chore.value['value'], tracked_time=datetime.now())
+            execute_chore = await self.grocy.execute_chore(chore_id=chore.value['value'], tracked_time=datetime.now())
             sentence = "The chore has been marked complete"
             self._LOGGER.info(f"Intent: {intent.id} | Execute chore response: {execute_chore}")    
             self._LOGGER.info(f"Intent: {intent.id} | Completed chore: {chore.value['value']}")    
         elif action.value['value'] == "Skip":
-            execute_chore = self.grocy.execute_chore(chore_id=chore.value['value'], tracked_time=datetime.now(), skipped=True)
+            execute_chore = await self.grocy.execute_chore(chore_id=chore.value['value'], tracked_time=datetime.now(), skipped=True)
             sentence = "The chore has been skipped"
             self._LOGGER.info(f"Intent: {intent.id} | Execute chore response: {execute_chore}")
             self._LOGGER.info(f"Intent: {intent.id} | Skipped chore: {chore.value['value']}")
@@ -607,57 +1161,52 @@ class RhasspySkill:
         return EndSession(sentence)    
 
     #Shopping List Intents
-    async def get_shoppinglist(self, intent: NluIntent):
+    async def get_shoppinglist(self, intent: NluIntent, parsed: ParsedIntent):
         """List the shopping lists."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETSHOPPINGLISTS}")
 
         sentence = None
 
-        shoppingLists = self.grocy.get_generic_objects_for_type(EntityType.SHOPPING_LISTS)    
+        shoppingLists = await self.cache.all(EntityType.SHOPPING_LISTS)
         self._LOGGER.debug(f"Intent: {intent.id} | Shopping Lists: {shoppingLists}")
         self._LOGGER.info(f"Intent: {intent.id} | Shopping List count: {len(shoppingLists)}")
 
         if len(shoppingLists) > 1:
-            sentence = "There is the "
-            for shoppingList in shoppingLists[:len(shoppingLists)-1]:
-                sentence = sentence + shoppingList['name'] + ", "
-            sentence = sentence + "and " + shoppingLists[-1]['name']
+            result = self.listing(intent, "There is the", [shoppingList['name'] for shoppingList in shoppingLists])
         else:        
             sentence = f"There is only the {shoppingLists[0]['name']}"    
-
-        self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
-        self.app.notify(sentence, intent.site_id)
+            self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
+            result = EndSession(sentence)
 
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYGETSHOPPINGLISTS}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETSHOPPINGLISTS}")
-        return EndSession(sentence)    
+        return result
 
-    async def create_shopping_list(self, intent: NluIntent):
+    async def create_shopping_list(self, intent: NluIntent, parsed: ParsedIntent):
         """Create a shopping list."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYCREATESHOPPINGLIST}")
 
         sentence = None
-        shoppingListCheck = None
         shoppingList = None
 
-        nameslot = next((slot for slot in intent.slots if slot.slot_name == 'name'), None)
+        nameslot = parsed.slot('name')
         if nameslot == None:
             self._LOGGER.info(f"Intent: {intent.id} | Name slot equals none")
             sentence = "I need to know the name of the shopping list"
         elif len(nameslot.value['value']) == 0:
             self._LOGGER.info(f"Intent: {intent.id} | Name slot exists but name is blank")
-            extractedListName = intent.raw_input.replace("create a new shopping list called ", "")
+            extractedListName = self.extract_name(intent, "create a new shopping list called")
             self._LOGGER.info(f"Intent: {intent.id} | Name extracted: {extractedListName}")
             if len(extractedListName) > 0:
-                shoppingListCheck = self.grocy.get_generic_objects_for_type(EntityType.SHOPPING_LISTS, f"name={extractedListName}")    
-                if len(shoppingListCheck) == 0:
+                if not await self.cache.has_name(EntityType.SHOPPING_LISTS, extractedListName):
                     data = {
                         "name": extractedListName,
                     }
-                    shoppingListResponse = self.grocy.add_generic(EntityType.SHOPPING_LISTS, data)
+                    shoppingListResponse = await self.grocy.add_generic(EntityType.SHOPPING_LISTS, data)
+                    self.cache.invalidate(EntityType.SHOPPING_LISTS)
                     self._LOGGER.debug(f"Intent: {intent.id} | Shopping List response: {shoppingListResponse}")
                     self._LOGGER.info(f"Intent: {intent.id} | Shopping List created: {shoppingListResponse['created_object_id']}")
-                    shoppingList = self.grocy.get_generic_objects_for_type(EntityType.SHOPPING_LISTS, f"id={shoppingListResponse['created_object_id']}")    
+                    shoppingList = await self.grocy.get_generic_objects_for_type(EntityType.SHOPPING_LISTS, f"id={shoppingListResponse['created_object_id']}")    
                     self._LOGGER.debug(f"Intent: {intent.id} | Shopping List: {shoppingList}")
                     self._LOGGER.info(f"Intent: {intent.id} | Shopping List retrieved from Grocy: {shoppingList[0]['name']}")
                     sentence = f"I created a new list called {shoppingList[0]['name']}"
@@ -669,156 +1218,263 @@ class RhasspySkill:
                 sentence = "I need to know the name of the shopping list"
         else:
             self._LOGGER.info(f"Intent: {intent.id} | Name: {str(nameslot.value['value'])} ({str(nameslot.raw_value)})")
-            shoppingListCheck = self.grocy.get_generic_objects_for_type(EntityType.SHOPPING_LISTS, f"name={nameslot.value['value']}")    
-            if len(shoppingListCheck) == 0:
+            if not await self.cache.has_name(EntityType.SHOPPING_LISTS, nameslot.value['value']):
                 data = {
                     "name": nameslot.value['value'],
                 }
-                shoppingList = self.grocy.add_generic(EntityType.SHOPPING_LISTS, data)
-                sentence = f"I created a new list called {shoppingList['name']}"
+                shoppingListResponse = await self.grocy.add_generic(EntityType.SHOPPING_LISTS, data)
+                self.cache.invalidate(EntityType.SHOPPING_LISTS)
+                self._LOGGER.info(f"Intent: {intent.id} | Shopping List created: {shoppingListResponse['created_object_id']}")
+                sentence = f"I created a new list called {nameslot.value['value']}"
 
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYCREATESHOPPINGLIST}")
         self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYCREATESHOPPINGLIST}")
         return EndSession(sentence)    
 
-    async def add_product_to_shopping_list(self, intent: NluIntent):
+    async def add_product_to_shopping_list(self, intent: NluIntent, parsed: ParsedIntent):
         """Add product to a the shopping list."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYADDPRODUCTTOSHOPPINGLIST}")
         
         sentence = None
 
-        listslot = next((slot for slot in intent.slots if slot.slot_name == 'list'), None)
-        if listslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | List slot equals none")
-            sentence = "I need to know the name of the shopping list"
-
-        productslot = next((slot for slot in intent.slots if slot.slot_name == 'product'), None)
-        if productslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | Product slot equals none")
-            sentence = "I need to know which product to add"
-
-        if listslot != None and productslot != None:
-            self.grocy.add_product_to_shopping_list(productslot.value['value'], listslot.value['value'], 1)
+        listslot = parsed.slot('list')
+        productslot = parsed.slot('product')
+        try:
+            if self.write_queue != None:
+                await self.write_queue.add_product_to_shopping_list(productslot.value['value'], listslot.value['value'], 1, site_id=intent.site_id, lang=intent.lang, labels={"product": productslot.raw_value, "list": listslot.raw_value})
+            else:
+                await self.grocy.add_product_to_shopping_list(productslot.value['value'], listslot.value['value'], 1)
             self._LOGGER.info(f"Intent: {intent.id} | Product added to Shopping List")                
             sentence = "I added the product to the list"
+        except GrocyError as error:
+            sentence = self.fail_sentence(intent, "GrocyError", error.message)
         
-        self.app.notify(sentence, intent.site_id)
+        self.notify(sentence, intent.site_id)
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYADDPRODUCTTOSHOPPINGLIST}")
         self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYADDPRODUCTTOSHOPPINGLIST}")
         return EndSession()    
 
-    async def remove_product_from_shopping_list(self, intent: NluIntent):
+    async def remove_product_from_shopping_list(self, intent: NluIntent, parsed: ParsedIntent):
         """Remove product from a the shopping list."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYREMOVEPRODUCTFROMSHOPPINGLIST}")
         
         sentence = None
 
-        listslot = next((slot for slot in intent.slots if slot.slot_name == 'list'), None)
-        if listslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | List slot equals none")
-            sentence = "I need to know the name of the shopping list"
-
-        productslot = next((slot for slot in intent.slots if slot.slot_name == 'product'), None)
-        if productslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | Product slot equals none")
-            sentence = "I need to know which product to add"
-
-        if listslot != None and productslot != None:
-            self.grocy.remove_product_in_shopping_list(productslot.value['value'], listslot.value['value'])
-            #.add_product_to_shopping_list(productslot.value['value'], listslot.value['value'], 1)
+        listslot = parsed.slot('list')
+        productslot = parsed.slot('product')
+        try:
+            if self.write_queue != None:
+                await self.write_queue.remove_product_in_shopping_list(productslot.value['value'], listslot.value['value'], site_id=intent.site_id, lang=intent.lang, labels={"product": productslot.raw_value, "list": listslot.raw_value})
+            else:
+                await self.grocy.remove_product_in_shopping_list(productslot.value['value'], listslot.value['value'])
             self._LOGGER.info(f"Intent: {intent.id} | Product removed from Shopping List")                
             sentence = "I removed the product from the list"
+        except GrocyError as error:
+            sentence = self.fail_sentence(intent, "GrocyError", error.message)
 
         self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
-        self.app.notify(sentence, intent.site_id)
+        self.notify(sentence, intent.site_id)
 
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYREMOVEPRODUCTFROMSHOPPINGLIST}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYREMOVEPRODUCTFROMSHOPPINGLIST}")
         return EndSession(sentence)    
 
     #Battery Intents
-    async def get_batteries(self, intent: NluIntent):
+    async def get_batteries(self, intent: NluIntent, parsed: ParsedIntent):
         """List the batteries."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETBATTERIES}")
 
         sentence = None
 
-        batteries = self.grocy.get_generic_objects_for_type(EntityType.BATTERIES)    
+        batteries = await self.cache.all(EntityType.BATTERIES)
         self._LOGGER.debug(f"Intent: {intent.id} | Batteries: {batteries}")
         self._LOGGER.info(f"Intent: {intent.id} | Battery count: {len(batteries)}")
 
         if len(batteries) > 1:
-            sentence = "There is the "
-            for battery in batteries[:len(batteries)-1]:
-                sentence = sentence + battery['name'] + " battery, "
-            sentence = sentence + "and the " + batteries[-1]['name'] + " battery"
+            result = self.listing(intent, "There is", [f"the {battery['name']} battery" for battery in batteries])
         else:        
             sentence = f"There is only the {batteries[0]['name']} battery"
-            
-        self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
-        self.app.notify(sentence, intent.site_id)
+            self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
+            self.notify(sentence, intent.site_id)
+            result = EndSession()
         
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYGETBATTERIES}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETBATTERIES}")
-        return EndSession()
+        return result
 
-    async def get_batterynextchangetime(self, intent: NluIntent):
+    async def get_batterynextchangetime(self, intent: NluIntent, parsed: ParsedIntent):
         """Get battery next charge time."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETBATTERYNEXTCHARGETIME}")
 
         sentence = None
         
-        batteryslot = next((slot for slot in intent.slots if slot.slot_name == 'battery'), None)
-        if batteryslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | Battery slot equals none")
-            sentence = "I need to know the name of the battery"
-        else:
-            battery = self.grocy.battery(batteryslot.value['value'])
-            self._LOGGER.debug(f"Intent: {intent.id} | Battery: {battery}")
-            self._LOGGER.info(f"Intent: {intent.id} | Battery name: {battery.name}")
-            if battery.next_estimated_charge_time != None:
-                if battery.charge_cycles_count == 1:
-                    pluralString = ""
-                else:
-                    pluralString = "s"
-                    
-                sentence = self.response_sentence(intent).format(battery.next_estimated_charge_time, battery.charge_cycles_count, pluralString)
+        battery = await self.grocy.battery(parsed.value('battery'))
+        self._LOGGER.debug(f"Intent: {intent.id} | Battery: {battery}")
+        self._LOGGER.info(f"Intent: {intent.id} | Battery name: {battery['battery']['name']}")
+        if battery['next_estimated_charge_time'] != None:
+            if battery['charge_cycles_count'] == 1:
+                pluralString = ""
             else:
-                sentence = self.response_sentence(intent, contextName="NoneResponse")
+                pluralString = "s"
+                
+            sentence = self.response_sentence(intent, battery['next_estimated_charge_time'], battery['charge_cycles_count'], pluralString)
+        else:
+            sentence = self.response_sentence(intent, contextName="NoneResponse")
             
         self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
-        self.app.notify(sentence, intent.site_id)
+        self.notify(sentence, intent.site_id)
         
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYGETBATTERYNEXTCHARGETIME}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETBATTERYNEXTCHARGETIME}")
         return EndSession()
 
-    async def track_batterycharge(self, intent: NluIntent):
+    async def track_batterycharge(self, intent: NluIntent, parsed: ParsedIntent):
         """Track battery charge time."""
         self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYTRACKBATTERYCHARGE}")
 
         sentence = None
         
-        batteryslot = next((slot for slot in intent.slots if slot.slot_name == 'battery'), None)
-        if batteryslot == None:
-            self._LOGGER.info(f"Intent: {intent.id} | Battery slot equals none")
-            sentence = "I need to know the name of the battery"
+        batteryId = parsed.value('battery')
+        batteryCharge = await self.grocy.charge_battery(batteryId)
+        self._LOGGER.debug(f"Intent: {intent.id} | Battery charge: {batteryCharge}")
+        self._LOGGER.info(f"Intent: {intent.id} | Battery charge tracked {batteryCharge['tracked_time']}")
+        battery = await self.grocy.battery(batteryId)
+        if battery['charge_cycles_count'] == 1:
+            pluralString = ""
         else:
-            batteryCharge = self.grocy.charge_battery(batteryslot.value['value'])
-            self._LOGGER.debug(f"Intent: {intent.id} | Battery charge: {batteryCharge}")
-            self._LOGGER.info(f"Intent: {intent.id} | Battery charge tracked {batteryCharge['tracked_time']}")
-            battery = self.grocy.battery(batteryslot.value['value'])
-            if battery.charge_cycles_count == 1:
-                pluralString = ""
-            else:
-                pluralString = "s"       
-            sentence = self.response_sentence(intent).format(battery.charge_cycles_count, pluralString , battery.next_estimated_charge_time)
+            pluralString = "s"       
+        sentence = self.response_sentence(intent, battery['charge_cycles_count'], pluralString , battery['next_estimated_charge_time'])
             
         self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
-        self.app.notify(sentence, intent.site_id)
+        self.notify(sentence, intent.site_id)
         
         self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYTRACKBATTERYCHARGE}")
         self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYTRACKBATTERYCHARGE}")
         return EndSession()
+
+    #Summary Intents, answered from the background refreshed summaries
+    def summary(self, intent: NluIntent, rows: List[dict], line):
+        """List summary rows through listing(), one spoken line per row."""
+        self._LOGGER.info(f"Intent: {intent.id} | Summary rows: {len(rows)}")
+        if len(rows) == 0:
+            sentence = self.response_sentence(intent, contextName="NoneResponse")
+            self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
+            self.notify(sentence, intent.site_id)
+            return EndSession()
+        return self.listing(intent, self.response_sentence(intent), [line(row) for row in rows])
+
+    async def get_expiring(self, intent: NluIntent, parsed: ParsedIntent):
+        """List the stock that is expiring soon or already expired."""
+        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETEXPIRING}")
+
+        await self.summaries.ready()
+        result = self.summary(intent, self.summaries.expiring, lambda row: f"{row['amount']:g} {row['name']} {'expired on' if row['expired'] else 'by'} {row['date']}")
+
+        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETEXPIRING}")
+        return result
+
+    async def get_below_minimum(self, intent: NluIntent, parsed: ParsedIntent):
+        """List the products below their minimum stock amount."""
+        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETBELOWMINIMUM}")
+
+        await self.summaries.ready()
+        result = self.summary(intent, self.summaries.below_minimum, lambda row: f"{row['missing']:g} more {row['name']}")
+
+        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETBELOWMINIMUM}")
+        return result
+
+    async def get_overdue_chores(self, intent: NluIntent, parsed: ParsedIntent):
+        """List the chores past their next execution time."""
+        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETOVERDUECHORES}")
+
+        await self.summaries.ready()
+        result = self.summary(intent, self.summaries.overdue_chores, lambda row: row['name'])
+
+        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETOVERDUECHORES}")
+        return result
+
+    async def get_batteries_due(self, intent: NluIntent, parsed: ParsedIntent):
+        """List the batteries due for a charge."""
+        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYGETBATTERIESDUE}")
+
+        await self.summaries.ready()
+        result = self.summary(intent, self.summaries.batteries_due, lambda row: f"the {row['name']} battery")
+
+        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYGETBATTERIESDUE}")
+        return result
+
+    #Compound Intents
+    def compound_parts(self, intent: NluIntent) -> list:
+        """Split a GrocyCompound intent into one NluIntent per sub-intent.
+
+        Slots are named <part>[<n>]_<slot>, e.g. consume_product or add2_list, where the
+        part picks the intent from COMPOUND_PARTS and n tells repeats of a part apart.
+        """
+        parts = {}
+        for slot in intent.slots:
+            match = re.match(r"^([a-z]+?)(\d*)_(.+)$", slot.slot_name)
+            if match == None or match.group(1) not in COMPOUND_PARTS:
+                self._LOGGER.warning(f"Intent: {intent.id} | Ignoring compound slot {slot.slot_name}")
+                continue
+            part = parts.setdefault(match.group(1) + match.group(2), (COMPOUND_PARTS[match.group(1)], []))
+            part[1].append(dataclasses.replace(slot, slot_name=match.group(3)))
+        return [
+            dataclasses.replace(intent, intent=Intent(intent_name=intentName.value, confidence_score=intent.intent.confidence_score), slots=slots)
+            for intentName, slots in parts.values()
+        ]
+
+    async def compound_part(self, parsed: ParsedIntent) -> str:
+        """Run one sub-intent's handler and return what it would have said."""
+        part = parsed.intent
+        replies = []
+        # Each gathered task runs in its own copy of the context, so this only reaches this part's handler
+        COMPOUND_REPLIES.set(replies)
+        try:
+            result = await self.run_intent(self.intent_functions[IntentNames(part.intent.intent_name)], parsed)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as connectionError:
+            self._LOGGER.error(f"Intent: {part.id} | Lost connection to Grocy: {connectionError}")
+            self.grocy_unavailable()
+            return self.responses.sentence("GrocyUnavailable", lang=part.lang)
+        except GrocyUnhealthy as unhealthy:
+            return self.unhealthy_sentence(part, unhealthy)
+        except Exception as error:
+            self._LOGGER.exception(f"Intent: {part.id} | {part.intent.intent_name} failed in compound intent: {error}")
+            return self.responses.sentence("GrocyCompound-Fail", lang=part.lang)
+        if len(replies) > 0:
+            return " ".join(replies)
+        return getattr(result, "text", None)
+
+    async def compound_chain(self, parts: list) -> list:
+        replies = []
+        for part in parts:
+            replies.append(await self.compound_part(part))
+        return replies
+
+    async def compound(self, intent: NluIntent, parsed: ParsedIntent):
+        """Run the intents combined in one utterance concurrently and answer them together."""
+        self._LOGGER.info(f"Intent: {intent.id} | Started: {IntentNames.GROCYCOMPOUND}")
+
+        parts = [ParsedIntent(part) for part in self.compound_parts(intent)]
+        self._LOGGER.info(f"Intent: {intent.id} | Parts: {[part.intent.intent.intent_name for part in parts]}")
+        if len(parts) == 0:
+            sentence = self.response_sentence(intent, contextName="NoneResponse")
+        else:
+            # Parts touching the same product keep their spoken order, everything else runs side by side
+            chains = {}
+            for index, part in enumerate(parts):
+                key = ("product", part.value('product')) if 'product' in part else ("part", index)
+                chains.setdefault(key, []).append((index, part))
+            results = await asyncio.gather(*[self.compound_chain([part for index, part in chain]) for chain in chains.values()])
+
+            replies = [None] * len(parts)
+            for chain, chainReplies in zip(chains.values(), results):
+                for (index, part), reply in zip(chain, chainReplies):
+                    replies[index] = reply
+            sentence = ". ".join(reply for reply in replies if reply)
+
+        self._LOGGER.info(f"Intent: {intent.id} | Sentence: {sentence}")
+        self._LOGGER.info(f"Intent: {intent.id} | Responded to {IntentNames.GROCYCOMPOUND}")
+        self._LOGGER.info(f"Intent: {intent.id} | Completed: {IntentNames.GROCYCOMPOUND}")
+        return EndSession(sentence)
@@ -0,0 +1,186 @@
+"""Generates the $grocy/* Rhasspy slot values in one pass over the Grocy API."""
+import asyncio
+import io
+import json
+import os
+from typing import Dict, List
+from pygrocy.data_models.generic import EntityType
+from grocy_client import GrocyClient
+
+#Slot name -> (Grocy endpoint, query filters)
+SLOT_SOURCES = {
+    "grocy/products": (f"objects/{EntityType.PRODUCTS.value}", None),
+    "grocy/locations": (f"objects/{EntityType.LOCATIONS.value}", None),
+    "grocy/quantity_units": (f"objects/{EntityType.QUANTITY_UNITS.value}", None),
+    "grocy/shopping_lists": (f"objects/{EntityType.SHOPPING_LISTS.value}", None),
+    "grocy/batteries": (f"objects/{EntityType.BATTERIES.value}", ["active=1"]),
+    "grocy/chores": (f"objects/{EntityType.CHORES.value}", None),
+    "grocy/users": ("users", None),
+}
+
+def slot_lines(slot_name: str, rows: List[dict]) -> List[str]:
+    """Format rows as Rhasspy slot values, "(spoken name):id"."""
+    if slot_name == "grocy/users":
+        return [f"({user['first_name']}):{user['id']}" for user in rows] \
+            + [f"({user['first_name']}'s):{user['id']}" for user in rows] \
+            + [f"({user['display_name']}):{user['id']}" for user in rows]
+    return [f"({row['name']}):{row['id']}" for row in sorted(rows, key=lambda row: str(row['name']).lower())]
+
+def matches(row: dict, query_filters: List[str]) -> bool:
+    """Whether a row passes "field=value" query filters the way Grocy would."""
+    return all(str(row.get(field)) == value for field, value in (queryFilter.split("=", 1) for queryFilter in query_filters or []))
+
+class SlotGenerator:
+    """Builds every Grocy slot at once and keeps the last result on disk.
+
+    Grocy's db-changed-time is checked first; while it matches the cached result no
+    table is downloaded. Otherwise all sources are fetched concurrently over the client's
+    pooled session as conditional GETs, so unchanged tables cost a 304. With an entity
+    cache the slots are built from its tables instead, which follow Grocy's changes by
+    fetching only the rows added since they were loaded.
+    """
+    _LOGGER = None
+
+    def __init__(self, grocy: GrocyClient, cache_path: str, logger = None) -> None:
+        self.grocy = grocy
+        self.cache_path = cache_path
+        # Optional entity_cache.GrocyEntityCache the slot values are read from
+        self.cache = None
+        if logger != None:
+            self._LOGGER = logger
+
+    def read_cache(self) -> dict:
+        try:
+            with io.open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def write_cache(self, changed_time: str, slots: Dict[str, List[str]]) -> None:
+        tmpPath = f"{self.cache_path}.tmp"
+        with io.open(tmpPath, "w", encoding="utf-8") as f:
+            json.dump({"changed_time": changed_time, "slots": slots}, f)
+        os.replace(tmpPath, self.cache_path)
+
+    async def fetch(self, slot_names: List[str] = None) -> Dict[str, List[str]]:
+        """Download and format the given slots (all of them by default) concurrently."""
+        slotNames = list(slot_names or SLOT_SOURCES)
+        if self.cache != None:
+            tables = await asyncio.gather(*[self.cache.all(SLOT_SOURCES[slotName][0].split("/")[-1]) for slotName in slotNames])
+            return {
+                slotName: slot_lines(slotName, [row for row in rows if matches(row, SLOT_SOURCES[slotName][1])])
+                for slotName, rows in zip(slotNames, tables)
+            }
+        results = await asyncio.gather(*[
+            self.grocy.get(SLOT_SOURCES[slotName][0], SLOT_SOURCES[slotName][1], conditional=True) for slotName in slotNames
+        ])
+        return {slotName: slot_lines(slotName, rows or []) for slotName, rows in zip(slotNames, results)}
+
+    async def generate(self) -> Dict[str, List[str]]:
+        changedTime = await self.grocy.db_changed_time()
+        cached = self.read_cache()
+        if cached.get("changed_time") == changedTime and set(cached.get("slots", {})) == set(SLOT_SOURCES):
+            if self._LOGGER != None:
+                self._LOGGER.info(f"Slots: Grocy unchanged since {changedTime}, using cached slots")
+            return cached["slots"]
+
+        slots = await self.fetch()
+        self.write_cache(changedTime, slots)
+        if self._LOGGER != None:
+            self._LOGGER.info(f"Slots: Generated {sum(len(values) for values in slots.values())} values for {len(slots)} slots")
+        return slots
+
+    def write_files(self, directory: str, slots: Dict[str, List[str]]) -> None:
+        """Write each slot as a Rhasspy slot file below directory, e.g. <directory>/grocy/products."""
+        for slotName, values in slots.items():
+            path = os.path.join(directory, *slotName.split("/"))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with io.open(path, "w", encoding="utf-8") as f:
+                f.write("\n".join(values) + "\n")
+
+async def generate_slot_files(config: dict, directory: str, cache_path: str, logger = None) -> None:
+    """Command line mode: write all slot files to directory and exit."""
+    grocy = GrocyClient.from_config(config, logger = logger)
+    try:
+        generator = SlotGenerator(grocy, cache_path, logger = logger)
+        generator.write_files(directory, await generator.generate())
+    finally:
+        await grocy.close()
+
+class SlotWatcher:
+    """Keeps Rhasspy's Grocy slots in step with Grocy while the skill runs.
+
+    Every ``interval`` seconds the watcher reads Grocy's db-changed-time and the mtime of
+    the sentences file, both single cheap reads. When either moved it waits until no
+    further change happened for ``debounce`` seconds, so a burst of edits causes one
+    retrain, then regenerates the slots and lets the deployer post only the slots whose
+    digest changed before training incrementally. With a freshness monitor the watcher
+    takes Grocy's db-changed-time from it instead of reading it again, and wakes as
+    soon as it moves; the generator then reads the tables from the entity cache, so a
+    stock booking costs no table downloads.
+    """
+    _LOGGER = None
+
+    def __init__(self, generator: SlotGenerator, deployer, interval: float = 60, debounce: float = 15, on_change = None, logger = None) -> None:
+        self.generator = generator
+        self.deployer = deployer
+        self.interval = interval
+        self.debounce = debounce
+        self.on_change = on_change
+        # Optional freshness.FreshnessMonitor already polling Grocy's db-changed-time
+        self.monitor = None
+        if logger != None:
+            self._LOGGER = logger
+
+    def _sentences_mtime(self) -> float:
+        try:
+            return os.stat(self.deployer.sentences_path).st_mtime
+        except OSError:
+            return None
+
+    async def _marker(self) -> tuple:
+        if self.monitor != None and self.monitor.changed_time != None:
+            return (self.monitor.changed_time, self._sentences_mtime())
+        return (await self.generator.grocy.db_changed_time(), self._sentences_mtime())
+
+    async def run(self) -> None:
+        lastMarker = (self.generator.read_cache().get("changed_time"), self._sentences_mtime())
+        lastSlots = self.generator.read_cache().get("slots", {})
+        changes = self.monitor.subscribe() if self.monitor != None else None
+        while True:
+            if changes == None:
+                await asyncio.sleep(self.interval)
+            else:
+                # The sentences file is still checked every interval
+                try:
+                    await asyncio.wait_for(changes.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+                changes.clear()
+            try:
+                marker = await self._marker()
+                if marker == lastMarker:
+                    continue
+
+                # Debounce until Grocy and the sentences file have settled
+                while True:
+                    await asyncio.sleep(self.debounce)
+                    settledMarker = await self._marker()
+                    if settledMarker == marker:
+                        break
+                    marker = settledMarker
+
+                if self._LOGGER != None:
+                    self._LOGGER.info("Slots: Change detected, refreshing slots")
+                slots = await self.generator.generate()
+                changedSlots = [slotName for slotName, values in slots.items() if lastSlots.get(slotName) != values]
+                await self.deployer.deploy(slots)
+                if self.on_change != None and len(changedSlots) > 0:
+                    self.on_change(changedSlots)
+                lastMarker = marker
+                lastSlots = slots
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                if self._LOGGER != None:
+                    self._LOGGER.error(f"Slots: Refresh failed: {error}")
@@ -0,0 +1,109 @@
+"""On-disk snapshot of the Grocy data the skill keeps in memory."""
+import asyncio
+import json
+import sqlite3
+import time
+from typing import Dict, Optional
+
+def describe_age(seconds: float) -> str:
+    """Spoken form of a duration, rounded to its largest unit."""
+    for unit, length in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= length:
+            count = int(seconds // length)
+            return f"{count} {unit}{'s' if count != 1 else ''}"
+    return "less than a minute"
+
+class GrocySnapshot:
+    """Keeps the last known master data, stock and summaries in a SQLite file.
+
+    Every table the skill loads from Grocy is handed to ``put`` and written about
+    ``save_delay`` seconds later, repeated puts of the same table in that time being
+    written once. One row holds one table as JSON, so a table is replaced atomically
+    and ``load`` reads the whole snapshot in one query at startup. The skill restores
+    its cache, stock ledger and summaries from it, which lets it start warm and answer
+    from the last known state while Grocy is unreachable.
+    """
+    _LOGGER = None
+
+    def __init__(self, path: str, save_delay: float = 5, logger = None) -> None:
+        self.path = path
+        self.save_delay = save_delay
+        # Wall clock time of the newest table, None until something was loaded or saved
+        self.saved_at: Optional[float] = None
+        self._pending: Dict[str, object] = {}
+        self._save_task = None
+        if logger != None:
+            self._LOGGER = logger
+
+    @classmethod
+    def from_config(cls, config: dict, path: str, logger = None):
+        """Build the snapshot from the optional [Snapshot] config section, or None when it is disabled."""
+        snapshotConfig = config.get("Snapshot", {})
+        if str(snapshotConfig.get("enabled", True)).lower() not in ("1", "true", "yes", "on"):
+            return None
+        return cls(path, save_delay = float(snapshotConfig.get("save_delay", 5)), logger = logger)
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path)
+        connection.execute("CREATE TABLE IF NOT EXISTS snapshot (name TEXT PRIMARY KEY, saved_at REAL NOT NULL, data TEXT NOT NULL)")
+        return connection
+
+    def load(self) -> Dict[str, tuple]:
+        """Every saved table as name: (data, saved_at)."""
+        started = time.perf_counter()
+        tables = {}
+        try:
+            connection = self._connect()
+            try:
+                for name, savedAt, data in connection.execute("SELECT name, saved_at, data FROM snapshot"):
+                    tables[name] = (json.loads(data), savedAt)
+            finally:
+                connection.close()
+        except (sqlite3.Error, ValueError) as error:
+            if self._LOGGER != None:
+                self._LOGGER.warning(f"Snapshot: Unable to read {self.path}: {error}")
+            return {}
+        if len(tables) > 0:
+            self.saved_at = max(savedAt for data, savedAt in tables.values())
+        if self._LOGGER != None:
+            self._LOGGER.info(f"Snapshot: Loaded {len(tables)} tables in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return tables
+
+    def _write(self, tables: Dict[str, object], savedAt: float) -> None:
+        rows = [(name, savedAt, json.dumps(data, separators=(",", ":"))) for name, data in tables.items()]
+        connection = self._connect()
+        try:
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO snapshot (name, saved_at, data) VALUES (?, ?, ?)", rows)
+        finally:
+            connection.close()
+
+    def put(self, name: str, data) -> None:
+        """Save a table soon.
+
+        data is serialised off the event loop and must not be changed afterwards. Data
+        that keeps changing is passed as a callable returning a copy when the save is due.
+        """
+        self._pending[name] = data
+        if self._save_task == None or self._save_task.done():
+            self._save_task = asyncio.ensure_future(self._save_later())
+
+    async def _save_later(self) -> None:
+        await asyncio.sleep(self.save_delay)
+        await self.save()
+
+    async def save(self) -> None:
+        """Write the pending tables now."""
+        tables, self._pending = self._pending, {}
+        if len(tables) == 0:
+            return
+        tables = {name: data() if callable(data) else data for name, data in tables.items()}
+        savedAt = time.time()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, tables, savedAt)
+            self.saved_at = savedAt
+            if self._LOGGER != None:
+                self._LOGGER.debug(f"Snapshot: Saved {', '.join(tables)}")
+        except (sqlite3.Error, OSError) as error:
+            if self._LOGGER != None:
+                self._LOGGER.error(f"Snapshot: Unable to write {self.path}: {error}")
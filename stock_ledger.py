@@ -0,0 +1,224 @@
+"""Local per product and location stock amounts."""
+import asyncio
+import time
+from typing import Dict, List
+from grocy_client import GrocyClient, NotEnoughStock, OFFLINE
+
+#Name of the ledger's table in a snapshot
+SNAPSHOT_TABLE = "stock"
+
+#Stock log transaction types whose signed amount changes the stock, and ones that leave it alone
+STOCK_CHANGING_TRANSACTIONS = ("purchase", "consume", "inventory-correction", "transfer_from", "transfer_to", "self-production")
+NEUTRAL_TRANSACTIONS = ("product-opened",)
+
+#Stock loads tried while bookings keep coming in; the last one is taken as of the newest booking
+RELOAD_ATTEMPTS = 3
+
+class StockLedger:
+    """Mirrors Grocy's stock so consumes and transfers can be checked without a round trip.
+
+    The ledger is loaded from ``objects/stock`` on first use and then follows
+    ``objects/stock_log``: the bookings returned by the skill's own writes are applied
+    at once, everybody else's on the next delta sync every ``sync_interval`` seconds.
+    Bookings the log can't express as a delta (stock edits, undone transactions) are
+    caught by a full reload, forced when such a booking is seen and otherwise done every
+    ``reload_interval`` seconds. Restored from a snapshot, the ledger continues from the
+    snapshot's booking instead of loading the whole stock again. While an intent is
+    answered offline it isn't synced and answers from what it has. Following a freshness
+    monitor, it syncs whenever Grocy's database changed instead of every ``sync_interval``.
+    """
+    _LOGGER = None
+
+    def __init__(self, grocy: GrocyClient, sync_interval: float = 30, reload_interval: float = 3600, logger = None) -> None:
+        self.grocy = grocy
+        self.sync_interval = sync_interval
+        self.reload_interval = reload_interval
+        self._amounts: Dict[int, Dict[int, float]] = None
+        self._last_log_id = 0
+        # Bookings above _last_log_id already applied from our own write responses
+        self._applied = set()
+        self._loaded_at = 0.0
+        self._stale = False
+        self._sync_lock = None
+        # Bumped by every finished sync, lets callers that queued behind one skip their own
+        self._generation = 0
+        # Optional snapshot.GrocySnapshot the amounts are saved to whenever they change
+        self.snapshot = None
+        # Optional freshness.FreshnessMonitor replacing the sync interval
+        self.monitor = None
+        if logger != None:
+            self._LOGGER = logger
+
+    @classmethod
+    def from_config(cls, grocy: GrocyClient, config: dict, logger = None):
+        """Build the ledger from the optional [Stock Ledger] config section."""
+        ledgerConfig = config.get("Stock Ledger", {})
+        return cls(
+            grocy,
+            sync_interval = float(ledgerConfig.get("sync_interval", 30)),
+            reload_interval = float(ledgerConfig.get("reload_interval", 3600)),
+            logger = logger
+        )
+
+    def _lock(self) -> asyncio.Lock:
+        if self._sync_lock == None:
+            self._sync_lock = asyncio.Lock()
+        return self._sync_lock
+
+    #Snapshot
+    def _snapshot_data(self) -> dict:
+        return {
+            "last_log_id": self._last_log_id,
+            # Flat [product, location, amount] rows, JSON objects would turn the ids into strings
+            "amounts": [[productId, locationId, amount] for productId, locations in self._amounts.items() for locationId, amount in locations.items()],
+        }
+
+    def _changed(self) -> None:
+        if self.snapshot != None and self._amounts != None and not self._stale:
+            self.snapshot.put(SNAPSHOT_TABLE, self._snapshot_data)
+
+    def restore(self, tables: dict) -> None:
+        """Take the amounts of a snapshot; the next sync fetches the bookings made since."""
+        if SNAPSHOT_TABLE not in tables or self._amounts != None:
+            return
+        data, savedAt = tables[SNAPSHOT_TABLE]
+        amounts = {}
+        for productId, locationId, amount in data["amounts"]:
+            amounts.setdefault(productId, {})[locationId] = amount
+        self._amounts = amounts
+        self._last_log_id = int(data["last_log_id"])
+        self._loaded_at = time.monotonic() - max(time.time() - savedAt, 0)
+
+    #Loading
+    async def _reload(self) -> None:
+        lastLogId = await self.grocy.last_stock_log_id()
+        for attempt in range(RELOAD_ATTEMPTS):
+            entries = await self.grocy.stock_entries()
+            # A booking made while the stock loaded may or may not be in it, load again until the log stood still
+            loadedLogId = await self.grocy.last_stock_log_id()
+            if loadedLogId == lastLogId:
+                break
+            if self._LOGGER != None:
+                self._LOGGER.debug(f"Stock ledger: Bookings {lastLogId} to {loadedLogId} were made while loading, reloading")
+            lastLogId = loadedLogId
+        amounts = {}
+        for entry in entries:
+            locations = amounts.setdefault(int(entry["product_id"]), {})
+            locationId = int(entry.get("location_id") or 0)
+            locations[locationId] = locations.get(locationId, 0.0) + float(entry["amount"])
+        self._amounts = amounts
+        self._last_log_id = lastLogId
+        self._applied = set()
+        self._loaded_at = time.monotonic()
+        self._stale = False
+        if self._LOGGER != None:
+            self._LOGGER.debug(f"Stock ledger: Loaded {len(amounts)} products up to booking {lastLogId}")
+        self._changed()
+
+    async def sync(self) -> None:
+        """Apply bookings made since the last sync, or reload everything when the ledger can't be trusted."""
+        if OFFLINE.get() and self._amounts != None:
+            return
+        generation = self._generation
+        async with self._lock():
+            if generation != self._generation and self._amounts != None and not self._stale:
+                # Somebody else synced while this call waited for the lock
+                return
+            await self._sync()
+            self._generation += 1
+
+    async def _sync(self) -> None:
+        if self._amounts == None or self._stale or time.monotonic() - self._loaded_at > self.reload_interval:
+            await self._reload()
+            return
+        bookings = await self.grocy.stock_log(self._last_log_id)
+        for booking in bookings:
+            self._apply(booking)
+        if len(bookings) > 0:
+            self._last_log_id = max(self._last_log_id, max(int(booking["id"]) for booking in bookings))
+            self._applied = set(bookingId for bookingId in self._applied if bookingId > self._last_log_id)
+        if self._stale:
+            await self._reload()
+        elif len(bookings) > 0:
+            self._changed()
+
+    #Bookings
+    def _apply(self, booking: dict) -> None:
+        bookingId = int(booking["id"])
+        if bookingId in self._applied or bookingId <= self._last_log_id:
+            return
+        self._applied.add(bookingId)
+        transactionType = booking.get("transaction_type")
+        if str(booking.get("undone", 0)) not in ("0", "False", "None") or transactionType in NEUTRAL_TRANSACTIONS:
+            return
+        if transactionType not in STOCK_CHANGING_TRANSACTIONS:
+            self._stale = True
+            return
+        locations = self._amounts.setdefault(int(booking["product_id"]), {})
+        locationId = int(booking.get("location_id") or 0)
+        locations[locationId] = locations.get(locationId, 0.0) + float(booking["amount"])
+
+    def record(self, bookings: List[dict]) -> None:
+        """Apply the stock log rows Grocy returned for one of our own writes."""
+        if self._amounts == None:
+            return
+        if not isinstance(bookings, list) or any("id" not in booking or "amount" not in booking for booking in bookings):
+            # Older Grocy versions don't return the bookings, pick them up from the log instead
+            self._stale = True
+            return
+        for booking in bookings:
+            self._apply(booking)
+        self._changed()
+
+    #Queries
+    async def available(self, product_id: int, location_id: int = None) -> float:
+        """Stock amount of a product, at one location or across all of them."""
+        if self._amounts == None or self._stale:
+            await self.sync()
+        locations = self._amounts.get(int(product_id), {})
+        if location_id == None:
+            return sum(locations.values())
+        return locations.get(int(location_id), 0.0)
+
+    async def location_entries(self, location_id: int) -> List[dict]:
+        """Stock at one location as product_id/amount rows, shaped like Grocy's stock entries."""
+        if self._amounts == None or self._stale:
+            await self.sync()
+        locationId = int(location_id)
+        return [{"product_id": productId, "amount": locations[locationId]} for productId, locations in self._amounts.items() if locations.get(locationId, 0) > 0]
+
+    async def check(self, product_id: int, amount: float, location_id: int = None, reserved: float = 0.0, sync: bool = True) -> None:
+        """Raise NotEnoughStock if amount exceeds the stock minus reserved.
+
+        The ledger may lag behind changes made elsewhere, so a shortage is confirmed
+        with a delta sync before it is reported unless ``sync`` is False.
+        """
+        available = await self.available(product_id, location_id) - reserved
+        if float(amount) <= available:
+            return
+        if sync:
+            await self.sync()
+            available = await self.available(product_id, location_id) - reserved
+            if float(amount) <= available:
+                return
+        raise NotEnoughStock(product_id, float(amount), max(available, 0.0), location_id)
+
+    async def run(self) -> None:
+        """Load the ledger in the background, then keep it in step with Grocy."""
+        changes = self.monitor.subscribe() if self.monitor != None else None
+        while True:
+            try:
+                await self.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                # Loaded on first use instead if Grocy isn't up yet
+                if self._LOGGER != None:
+                    self._LOGGER.warning(f"Stock ledger: Sync failed: {error}")
+            if changes != None:
+                await changes.wait()
+                changes.clear()
+                continue
+            if self.sync_interval <= 0:
+                return
+            await asyncio.sleep(self.sync_interval)
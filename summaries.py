@@ -0,0 +1,214 @@
+"""Household summaries precomputed in the background."""
+import asyncio
+import time
+from datetime import datetime
+from typing import List, Optional
+from pygrocy.data_models.generic import EntityType
+from grocy_client import GrocyClient, OFFLINE
+from entity_cache import GrocyEntityCache
+
+#Name of the summaries' table in a snapshot
+SNAPSHOT_TABLE = "summaries"
+
+#Summary lists kept in a snapshot, and the ones among them whose rows carry a due time
+SNAPSHOT_LISTS = ("expiring", "below_minimum", "overdue_chores", "batteries_due", "chores", "batteries", "active_chores")
+DUE_LISTS = ("overdue_chores", "batteries_due", "chores", "batteries")
+
+def parse_time(value) -> Optional[datetime]:
+    """Grocy date or date time, or None for empty and unparsable values."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+class HouseholdSummaries:
+    """Keeps the answers to "what's expiring", "what's low" and the like ready in memory.
+
+    Every ``refresh_interval`` seconds the volatile stock, the chores and the batteries
+    are fetched in three bulk calls and reduced to the lists the summary intents read:
+    stock due within ``due_soon_days`` or already past its date, products below their
+    minimum stock, overdue chores and batteries due for a charge. Intents answer from
+    the last refresh, so their answers may be up to one interval old. The next due time
+    of every chore and battery is kept as well, for ``on_refresh`` listeners, and so is
+    every chore with its assignee, to list the chores while Grocy is unreachable. Following
+    a freshness monitor, a change to Grocy's database refreshes them at once as well.
+    """
+    _LOGGER = None
+
+    def __init__(self, grocy: GrocyClient, cache: GrocyEntityCache, refresh_interval: float = 300, due_soon_days: int = 5, logger = None) -> None:
+        self.grocy = grocy
+        self.cache = cache
+        self.refresh_interval = refresh_interval
+        self.due_soon_days = due_soon_days
+        self.expiring: List[dict] = []
+        self.below_minimum: List[dict] = []
+        self.overdue_chores: List[dict] = []
+        self.batteries_due: List[dict] = []
+        self.chores: List[dict] = []
+        self.batteries: List[dict] = []
+        self.active_chores: List[dict] = []
+        self.refreshed_at = None
+        # Optional callable receiving the summaries after every refresh
+        self.on_refresh = None
+        # Optional snapshot.GrocySnapshot the summaries are saved to after every refresh
+        self.snapshot = None
+        # Optional freshness.FreshnessMonitor whose changes trigger a refresh
+        self.monitor = None
+        self._refresh_lock = None
+        if logger != None:
+            self._LOGGER = logger
+
+    @classmethod
+    def from_config(cls, grocy: GrocyClient, cache: GrocyEntityCache, config: dict, logger = None):
+        """Build the summaries from the optional [Summaries] config section."""
+        summariesConfig = config.get("Summaries", {})
+        return cls(
+            grocy,
+            cache,
+            refresh_interval = float(summariesConfig.get("refresh_interval", 300)),
+            due_soon_days = int(summariesConfig.get("due_soon_days", 5)),
+            logger = logger
+        )
+
+    def _lock(self) -> asyncio.Lock:
+        if self._refresh_lock == None:
+            self._refresh_lock = asyncio.Lock()
+        return self._refresh_lock
+
+    #Snapshot
+    def _snapshot_data(self) -> dict:
+        data = {}
+        for name in SNAPSHOT_LISTS:
+            rows = getattr(self, name)
+            data[name] = [dict(row, due=row["due"].isoformat()) for row in rows] if name in DUE_LISTS else rows
+        return data
+
+    def restore(self, tables: dict) -> None:
+        """Take the summaries of a snapshot, as if refreshed when it was saved."""
+        if SNAPSHOT_TABLE not in tables or self.refreshed_at != None:
+            return
+        data, savedAt = tables[SNAPSHOT_TABLE]
+        for name in SNAPSHOT_LISTS:
+            rows = data.get(name, [])
+            setattr(self, name, [dict(row, due=parse_time(row["due"])) for row in rows] if name in DUE_LISTS else rows)
+        self.refreshed_at = time.monotonic() - max(time.time() - savedAt, 0)
+
+    #Building
+    async def _product_name(self, row: dict) -> str:
+        product = row.get("product")
+        if isinstance(product, dict) and product.get("name"):
+            return product["name"]
+        product = await self.cache.get(EntityType.PRODUCTS, int(row.get("product_id") or row["id"]))
+        return product["name"] if product != None else "unknown product"
+
+    async def _expiring(self, volatile: dict) -> List[dict]:
+        # A stock row can be in more than one of the lists, the product and date identify it
+        rows = {}
+        for listName in ("expired_products", "overdue_products", "due_products"):
+            for row in volatile.get(listName) or []:
+                key = (int(row["product_id"]), row.get("best_before_date"))
+                if key in rows:
+                    continue
+                rows[key] = {
+                    "product_id": key[0],
+                    "name": await self._product_name(row),
+                    "amount": float(row.get("amount_aggregated") or row.get("amount") or 0),
+                    "date": row.get("best_before_date"),
+                    "expired": listName != "due_products",
+                }
+        return sorted(rows.values(), key=lambda row: row["date"] or "")
+
+    async def _below_minimum(self, volatile: dict) -> List[dict]:
+        rows = []
+        for row in volatile.get("missing_products") or []:
+            rows.append({
+                "product_id": int(row["id"]),
+                "name": row.get("name") or await self._product_name(row),
+                "missing": float(row.get("amount_missing") or 0),
+            })
+        return sorted(rows, key=lambda row: row["name"])
+
+    def _chores(self, chores: list) -> List[dict]:
+        rows = []
+        for chore in chores:
+            due = parse_time(chore.get("next_estimated_execution_time"))
+            if due != None:
+                rows.append({"chore_id": int(chore["chore_id"]), "name": chore.get("chore_name"), "due": due})
+        return sorted(rows, key=lambda row: row["due"])
+
+    def _active_chores(self, chores: list) -> List[dict]:
+        # The fields get_chores reads, in Grocy's order
+        return [{
+            "chore_id": int(chore["chore_id"]),
+            "chore_name": chore.get("chore_name"),
+            "next_execution_assigned_to_user_id": chore.get("next_execution_assigned_to_user_id"),
+        } for chore in chores]
+
+    async def _batteries(self, batteries: list) -> List[dict]:
+        names = await self.cache.by_id(EntityType.BATTERIES)
+        rows = []
+        for battery in batteries:
+            due = parse_time(battery.get("next_estimated_charge_time"))
+            if due != None:
+                batteryId = int(battery["battery_id"])
+                rows.append({"battery_id": batteryId, "name": names[batteryId]["name"] if batteryId in names else f"battery {batteryId}", "due": due})
+        return sorted(rows, key=lambda row: row["due"])
+
+    async def refresh(self) -> None:
+        """Fetch the volatile data in bulk and rebuild every summary from it."""
+        async with self._lock():
+            started = time.perf_counter()
+            volatile, chores, batteries = await asyncio.gather(
+                self.grocy.volatile_stock(self.due_soon_days),
+                self.grocy.chores(),
+                self.grocy.batteries()
+            )
+            now = datetime.now()
+            self.expiring = await self._expiring(volatile or {})
+            self.below_minimum = await self._below_minimum(volatile or {})
+            self.chores = self._chores(chores)
+            self.active_chores = self._active_chores(chores)
+            self.batteries = await self._batteries(batteries)
+            self.overdue_chores = [chore for chore in self.chores if chore["due"] <= now]
+            self.batteries_due = [battery for battery in self.batteries if battery["due"] <= now]
+            self.refreshed_at = time.monotonic()
+            if self.snapshot != None:
+                self.snapshot.put(SNAPSHOT_TABLE, self._snapshot_data())
+            if self._LOGGER != None:
+                self._LOGGER.debug(
+                    f"Summaries: {len(self.expiring)} expiring, {len(self.below_minimum)} below minimum, "
+                    f"{len(self.overdue_chores)} overdue chores, {len(self.batteries_due)} batteries due, "
+                    f"refreshed in {(time.perf_counter() - started) * 1000:.0f}ms"
+                )
+        if self.on_refresh != None:
+            self.on_refresh(self)
+
+    async def ready(self) -> None:
+        """Make sure there is something to answer from; only the first call after startup may wait on Grocy."""
+        if self.refreshed_at == None or (self.refresh_interval <= 0 and not OFFLINE.get()):
+            await self.refresh()
+
+    async def run(self) -> None:
+        """Refresh the summaries in the background; an interval of 0 leaves it to each request."""
+        if self.refresh_interval <= 0:
+            return
+        changes = self.monitor.subscribe() if self.monitor != None else None
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                if self._LOGGER != None:
+                    self._LOGGER.warning(f"Summaries: Refresh failed: {error}")
+            if changes == None:
+                await asyncio.sleep(self.refresh_interval)
+                continue
+            # Due dates still pass while Grocy stands still
+            try:
+                await asyncio.wait_for(changes.wait(), self.refresh_interval)
+            except asyncio.TimeoutError:
+                pass
+            changes.clear()
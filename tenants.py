@@ -0,0 +1,159 @@
+"""Households served by one skill process, each with its own Grocy."""
+import asyncio
+import contextvars
+import aiohttp
+from datetime import time as clock
+from typing import Callable, List
+from grocy_client import GrocyClient, GrocyError
+from entity_cache import GrocyEntityCache
+from stock_ledger import StockLedger
+from summaries import HouseholdSummaries
+from write_queue import WriteBehindQueue
+from due_scheduler import DueScheduler, due_events
+from responses import ResponseCatalog
+from snapshot import GrocySnapshot
+from freshness import FreshnessMonitor
+
+#Config sections of additional tenants are named [Tenant:<name>]
+TENANT_SECTION_PREFIX = "Tenant:"
+
+#Grocy Setup options a tenant section may override
+TENANT_GROCY_OPTIONS = ("host", "port", "apikey", "verifyssl", "pool_size", "endpoint_concurrency", "request_timeout", "get_retries", "retry_delay", "breaker_threshold", "breaker_cooldown", "retry_max_delay", "default_qu", "default_location_id")
+
+#Tenant of the intent or background task running in the current context
+TENANT = contextvars.ContextVar("TENANT", default=None)
+
+def enabled(section: dict, option: str) -> bool:
+    return str(section.get(option, False)).lower() in ("1", "true", "yes", "on")
+
+class Tenant:
+    """One household: its Grocy client and everything the skill keeps about that Grocy.
+
+    ``sites`` are the Rhasspy site ids whose intents are routed to it. At most
+    ``max_concurrency`` of its intents are handled at once, so a slow Grocy only queues
+    requests of its own household. With a snapshot its data is restored from disk on
+    construction and its writes can be queued while its Grocy is unreachable, even
+    without write-behind mode.
+    """
+    _LOGGER = None
+
+    def __init__(self, name: str, config: dict, sites: List[str] = None, max_concurrency: int = 32, responses: ResponseCatalog = None, journal_path: str = None, snapshot_path: str = None, logger = None) -> None:
+        self.name = name
+        self.config = config
+        self.sites = sites or []
+        self.max_concurrency = max_concurrency
+        self.responses = responses
+        self.journal_path = journal_path
+        if logger != None:
+            self._LOGGER = logger
+
+        # Grocy is connected lazily, nothing here waits on the network
+        self.grocy = GrocyClient.from_config(config, logger = self._LOGGER)
+        self.cache = GrocyEntityCache.from_config(self.grocy, config, logger = self._LOGGER)
+        self.ledger = StockLedger.from_config(self.grocy, config, logger = self._LOGGER)
+        self.grocy.stock_ledger = self.ledger
+        self.summaries = HouseholdSummaries.from_config(self.grocy, self.cache, config, logger = self._LOGGER)
+        # One poll of Grocy's db-changed-time tells the cache, ledger and summaries when to refresh
+        self.monitor = FreshnessMonitor.from_config(self.grocy, config, logger = self._LOGGER)
+        for follower in (self.cache, self.ledger, self.summaries):
+            follower.monitor = self.monitor
+        self.snapshot = GrocySnapshot.from_config(config, snapshot_path, logger = self._LOGGER) if snapshot_path != None else None
+        if self.snapshot != None:
+            tables = self.snapshot.load()
+            for keeper in (self.cache, self.ledger, self.summaries):
+                keeper.restore(tables)
+                keeper.snapshot = self.snapshot
+        self.write_behind = enabled(config.get("Write Behind", {}), "enabled")
+        self.write_queue = None
+        self.due_scheduler = None
+        self.notification_sites = None
+        self.grocy_connected = None
+        self.connect_task = None
+        self._semaphore = None
+
+    @classmethod
+    def from_section(cls, name: str, config: dict, responses: ResponseCatalog, journal_path: str, snapshot_path: str = None, logger = None):
+        """Build a tenant from its [Tenant:<name>] section, with everything it doesn't set taken from the main config."""
+        section = config[f"{TENANT_SECTION_PREFIX}{name}"]
+        tenantConfig = dict(config)
+        tenantConfig["Grocy Setup"] = dict(config.get("Grocy Setup", {}))
+        tenantConfig["Grocy Setup"].update({option: section[option] for option in TENANT_GROCY_OPTIONS if option in section})
+        if "Notifications" in config:
+            # Announced on the tenant's own sites unless it names others
+            tenantConfig["Notifications"] = dict(config.get("Notifications", {}))
+            tenantConfig["Notifications"]["sites"] = section.get("notification_sites", section.get("sites", ""))
+        if section.get("responses"):
+            responses = ResponseCatalog(section["responses"], logger = logger)
+        return cls(
+            name,
+            tenantConfig,
+            sites = [site.strip() for site in str(section.get("sites", "")).split(",") if site.strip()],
+            max_concurrency = int(section.get("max_concurrency", 32)),
+            responses = responses,
+            journal_path = journal_path,
+            snapshot_path = snapshot_path,
+            logger = logger
+        )
+
+    @staticmethod
+    def names(config: dict) -> List[str]:
+        return [section[len(TENANT_SECTION_PREFIX):] for section in config if section.startswith(TENANT_SECTION_PREFIX)]
+
+    def setup_write_queue(self, on_failure: Callable[[dict, str], None]) -> None:
+        """Create the write queue if the [Write Behind] section enables it or writes may be queued offline."""
+        if self.write_behind or self.snapshot != None:
+            self.write_queue = WriteBehindQueue.from_config(self.grocy, self.cache, self.ledger, self.config, self.journal_path, on_failure = on_failure, logger = self._LOGGER)
+
+    def setup_notifications(self, announce: Callable[[dict], None]) -> None:
+        """Create the due scheduler if the [Notifications] section enables it."""
+        notificationsConfig = self.config.get("Notifications", {})
+        if not enabled(notificationsConfig, "enabled"):
+            return
+        self.notification_sites = [site.strip() for site in str(notificationsConfig.get("sites", "default")).split(",") if site.strip()]
+        kinds = [kind.strip() for kind in str(notificationsConfig.get("kinds", "chore, battery, product")).split(",")]
+        productTime = clock.fromisoformat(str(notificationsConfig.get("product_time", "09:00")))
+        self.due_scheduler = DueScheduler(announce, logger = self._LOGGER)
+        self.summaries.on_refresh = lambda summaries: self.due_scheduler.update(due_events(summaries, kinds, productTime))
+
+    def semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore == None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def data_time(self) -> float:
+        """Wall clock time the last known state is from: the last answer of Grocy, or the snapshot's time."""
+        return self.grocy.answered_at or (self.snapshot.saved_at if self.snapshot != None else None) or 0
+
+    async def revalidate(self) -> None:
+        """Check the cached master data against Grocy's db-changed-time, so unchanged tables needn't be downloaded again."""
+        if self.snapshot == None and self.monitor == None:
+            return
+        changedTime = await self.grocy.db_changed_time()
+        if self.monitor != None:
+            self.monitor.seen(changedTime)
+        renewed = self.cache.revalidate(changedTime)
+        if self._LOGGER != None:
+            self._LOGGER.info(f"Tenant {self.name}: Grocy changed at {changedTime}, reusing cached {', '.join(renewed) or 'nothing'}")
+
+    async def preload(self) -> None:
+        """Load all master data once Grocy answers, so the snapshot can stand in for any of it."""
+        await self.grocy_connected.wait()
+        try:
+            await self.cache.preload()
+        except (aiohttp.ClientError, GrocyError, asyncio.TimeoutError) as error:
+            if self._LOGGER != None:
+                self._LOGGER.warning(f"Tenant {self.name}: Unable to preload master data: {error}")
+
+    def background_tasks(self) -> list:
+        """Coroutines keeping this tenant's data current, to be run with the tenant set in TENANT."""
+        coroutines = [self.ledger.run(), self.summaries.run()]
+        if self.monitor != None:
+            coroutines.append(self.monitor.run())
+        if self.snapshot != None:
+            coroutines.append(self.preload())
+        if self.due_scheduler != None:
+            coroutines.append(self.due_scheduler.run())
+        if self.write_queue != None:
+            self.write_queue.connected = self.grocy_connected
+            coroutines.append(self.write_queue.run())
+        return coroutines
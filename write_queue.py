@@ -0,0 +1,295 @@
+"""Write-behind queue for stock and shopping list mutations."""
+import asyncio
+import io
+import json
+import os
+import time
+import uuid
+from typing import Callable, List
+import aiohttp
+from pygrocy.data_models.generic import EntityType
+from grocy_client import GrocyClient, GrocyError, GrocyUnhealthy
+from entity_cache import GrocyEntityCache
+from stock_ledger import StockLedger
+
+PURCHASE = "purchase"
+CONSUME = "consume"
+SHOPPING_LIST_ADD = "shopping_list_add"
+SHOPPING_LIST_REMOVE = "shopping_list_remove"
+
+#Mutation kinds whose repeats are summed into one request
+MERGEABLE = (PURCHASE, SHOPPING_LIST_ADD)
+
+class WriteBehindQueue:
+    """Acknowledges mutations at once and writes them to Grocy in the background.
+
+    Each accepted mutation is appended to a JSON lines journal before the caller
+    returns, so nothing is lost if the skill stops before it was flushed; pending
+    entries are replayed on the next start. The worker waits ``flush_interval``
+    seconds after the first mutation to collect a batch, merges repeated purchases
+    and shopping list adds of the same product into one amount and posts the batch,
+    different products concurrently and the same product in order. Connection errors
+    and 5xx responses are retried up to ``max_attempts`` times, anything else is
+    reported through ``on_failure(mutation, message)``. While the optional ``connected``
+    event is clear Grocy is known to be down, and the worker waits for it instead of
+    using up attempts.
+    """
+    _LOGGER = None
+
+    def __init__(
+        self,
+        grocy: GrocyClient,
+        cache: GrocyEntityCache,
+        ledger: StockLedger,
+        journal_path: str,
+        flush_interval: float = 2.0,
+        max_attempts: int = 5,
+        retry_delay: float = 10.0,
+        on_failure: Callable[[dict, str], None] = None,
+        logger = None
+    ) -> None:
+        self.grocy = grocy
+        self.cache = cache
+        self.ledger = ledger
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_failure = on_failure
+        self.pending: List[dict] = []
+        # Mutations of the running flush that Grocy accepted, already counted by the ledger
+        self._posted = set()
+        self._journal_lock = None
+        self._wakeup = None
+        # Optional asyncio.Event set while Grocy is reachable
+        self.connected = None
+        if logger != None:
+            self._LOGGER = logger
+        self.load()
+
+    @classmethod
+    def from_config(cls, grocy: GrocyClient, cache: GrocyEntityCache, ledger: StockLedger, config: dict, journal_path: str, on_failure = None, logger = None):
+        """Build the queue from the [Write Behind] config section."""
+        writeConfig = config.get("Write Behind", {})
+        return cls(
+            grocy,
+            cache,
+            ledger,
+            journal_path,
+            flush_interval = float(writeConfig.get("flush_interval", 2)),
+            max_attempts = int(writeConfig.get("max_attempts", 5)),
+            retry_delay = float(writeConfig.get("retry_delay", 10)),
+            on_failure = on_failure,
+            logger = logger
+        )
+
+    #Journal
+    def load(self) -> None:
+        """Read mutations left in the journal by a previous run and compact it."""
+        pending = {}
+        try:
+            with io.open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-write
+                        continue
+                    if record.get("op") == "add":
+                        pending[record["mutation"]["id"]] = record["mutation"]
+                    elif record.get("op") == "done":
+                        for mutationId in record["ids"]:
+                            pending.pop(mutationId, None)
+        except IOError:
+            pass
+        self.pending = list(pending.values())
+        self._rewrite_journal()
+        if self._LOGGER != None and len(self.pending) > 0:
+            self._LOGGER.info(f"Write behind: Replaying {len(self.pending)} journaled mutations")
+
+    def _rewrite_journal(self) -> None:
+        tmpPath = f"{self.journal_path}.tmp"
+        with io.open(tmpPath, "w", encoding="utf-8") as f:
+            for mutation in self.pending:
+                f.write(json.dumps({"op": "add", "mutation": mutation}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmpPath, self.journal_path)
+
+    def _append_sync(self, records: List[dict]) -> None:
+        with io.open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def _journal(self, function, *args) -> None:
+        # fsync can take a while on SD cards, keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+    def _lock(self) -> asyncio.Lock:
+        if self._journal_lock == None:
+            self._journal_lock = asyncio.Lock()
+        return self._journal_lock
+
+    #Validation
+    def reserved(self, product_id: int) -> float:
+        """Stock the pending consumes will take, less what the pending purchases will add."""
+        amount = 0.0
+        for mutation in self.pending:
+            if int(mutation["product_id"]) == int(product_id) and mutation["id"] not in self._posted:
+                if mutation["kind"] == CONSUME:
+                    amount += mutation["amount"]
+                elif mutation["kind"] == PURCHASE:
+                    amount -= mutation["amount"]
+        return amount
+
+    async def _validate(self, kind: str, product_id: int, amount: float, location_id = None, list_id = None) -> None:
+        if await self.cache.get(EntityType.PRODUCTS, product_id) == None:
+            raise GrocyError(400, "Product does not exist or is inactive")
+        if location_id != None and await self.cache.get(EntityType.LOCATIONS, location_id) == None:
+            raise GrocyError(400, "Location does not exist")
+        if list_id != None and await self.cache.get(EntityType.SHOPPING_LISTS, list_id) == None:
+            raise GrocyError(400, "Shopping list does not exist")
+        if kind == CONSUME:
+            await self.ledger.check(product_id, amount, reserved=self.reserved(product_id))
+
+    async def submit(self, kind: str, product_id: int, amount: float, location_id = None, list_id = None, site_id: str = "default", lang: str = None, labels: dict = None) -> dict:
+        """Validate a mutation against cached data, journal it and return it; raises GrocyError (NotEnoughStock for consumes) if it would be rejected."""
+        await self._validate(kind, product_id, amount, location_id, list_id)
+        mutation = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "product_id": int(product_id),
+            "amount": float(amount),
+            "location_id": location_id,
+            "list_id": list_id,
+            "site_id": site_id,
+            "lang": lang,
+            "labels": labels or {},
+            "attempts": 0,
+            "queued_at": time.time(),
+        }
+        async with self._lock():
+            await self._journal(self._append_sync, [{"op": "add", "mutation": mutation}])
+            self.pending.append(mutation)
+        if self._wakeup != None:
+            self._wakeup.set()
+        return mutation
+
+    #Same call shapes as GrocyClient
+    async def purchase_product(self, product_id: int, amount: float, location_id: int = None, **context) -> dict:
+        return await self.submit(PURCHASE, product_id, amount, location_id=location_id, **context)
+
+    async def consume_product(self, product_id: int, amount: float = 1, **context) -> dict:
+        return await self.submit(CONSUME, product_id, amount, **context)
+
+    async def add_product_to_shopping_list(self, product_id: int, shopping_list_id: int = 1, amount: float = 1, **context) -> dict:
+        return await self.submit(SHOPPING_LIST_ADD, product_id, amount, list_id=shopping_list_id, **context)
+
+    async def remove_product_in_shopping_list(self, product_id: int, shopping_list_id: int = 1, amount: float = 1, **context) -> dict:
+        return await self.submit(SHOPPING_LIST_REMOVE, product_id, amount, list_id=shopping_list_id, **context)
+
+    #Flushing
+    @staticmethod
+    def merge(mutations: List[dict]) -> List[List[dict]]:
+        """Group mutations into requests; repeated purchases and list adds of the same target become one group."""
+        groups = []
+        mergeable = {}
+        for mutation in mutations:
+            if mutation["kind"] in MERGEABLE:
+                key = (mutation["kind"], mutation["product_id"], mutation["location_id"], mutation["list_id"])
+                if key in mergeable:
+                    mergeable[key].append(mutation)
+                    continue
+                mergeable[key] = [mutation]
+                groups.append(mergeable[key])
+            else:
+                groups.append([mutation])
+        return groups
+
+    async def _post(self, group: List[dict]):
+        first = group[0]
+        amount = sum(mutation["amount"] for mutation in group)
+        if first["kind"] == PURCHASE:
+            return await self.grocy.purchase_product(first["product_id"], amount, price=0.0, location_id=first["location_id"])
+        if first["kind"] == CONSUME:
+            return await self.grocy.consume_product(first["product_id"], amount)
+        if first["kind"] == SHOPPING_LIST_ADD:
+            return await self.grocy.add_product_to_shopping_list(first["product_id"], first["list_id"], amount)
+        return await self.grocy.remove_product_in_shopping_list(first["product_id"], first["list_id"], amount)
+
+    async def _flush_chain(self, chain: List[List[dict]]) -> tuple:
+        """Post one product's groups in order; stop at the first retryable failure to keep that order."""
+        done, retry = [], False
+        for group in chain:
+            try:
+                await self._post(group)
+                done.extend(group)
+                self._posted.update(mutation["id"] for mutation in group)
+            except GrocyUnhealthy as error:
+                # Grocy's circuit breaker is open, the group wasn't sent and keeps its attempts
+                if self._LOGGER != None:
+                    self._LOGGER.warning(f"Write behind: {group[0]['kind']} of product {group[0]['product_id']} held back, Grocy {error.message}")
+                retry = True
+                break
+            except (aiohttp.ClientError, asyncio.TimeoutError, GrocyError) as error:
+                message = error.message if isinstance(error, GrocyError) else str(error)
+                retryable = not isinstance(error, GrocyError) or error.status_code >= 500
+                for mutation in group:
+                    mutation["attempts"] += 1
+                if retryable and group[0]["attempts"] < self.max_attempts:
+                    if self._LOGGER != None:
+                        self._LOGGER.warning(f"Write behind: {group[0]['kind']} of product {group[0]['product_id']} failed ({message}), retrying")
+                    retry = True
+                    break
+                if self._LOGGER != None:
+                    self._LOGGER.error(f"Write behind: {group[0]['kind']} of product {group[0]['product_id']} failed ({message}), giving up")
+                done.extend(group)
+                if self.on_failure != None:
+                    for mutation in group:
+                        self.on_failure(mutation, message)
+        return done, retry
+
+    async def flush(self) -> bool:
+        """Post everything pending once. Returns True if something has to be retried."""
+        batch = list(self.pending)
+        if len(batch) == 0:
+            return False
+        chains = {}
+        for group in self.merge(batch):
+            chains.setdefault(group[0]["product_id"], []).append(group)
+        try:
+            results = await asyncio.gather(*[self._flush_chain(chain) for chain in chains.values()])
+
+            doneIds = set(mutation["id"] for done, retry in results for mutation in done)
+            if len(doneIds) > 0:
+                async with self._lock():
+                    await self._journal(self._append_sync, [{"op": "done", "ids": list(doneIds)}])
+                    self.pending = [mutation for mutation in self.pending if mutation["id"] not in doneIds]
+                    if len(self.pending) == 0:
+                        await self._journal(self._rewrite_journal)
+        finally:
+            self._posted.clear()
+        if self._LOGGER != None:
+            self._LOGGER.info(f"Write behind: Flushed {len(doneIds)} of {len(batch)} mutations in {len(chains)} products")
+        return any(retry for done, retry in results)
+
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        while True:
+            if len(self.pending) == 0:
+                await self._wakeup.wait()
+            self._wakeup.clear()
+            # Collect the rest of the batch
+            await asyncio.sleep(self.flush_interval)
+            if self.connected != None and not self.connected.is_set():
+                await self.connected.wait()
+            try:
+                if await self.flush():
+                    await asyncio.sleep(self.retry_delay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                if self._LOGGER != None:
+                    self._LOGGER.error(f"Write behind: Flush failed: {error}")
+                await asyncio.sleep(self.retry_delay)